@@ -7,11 +7,59 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = "INFO"
     DEVICE: str = "cpu"
 
+    # Concurrency (per uvicorn worker)
+    MAX_CONCURRENT_REQUESTS: int = 32
+    RETRIEVAL_THREADS: int = 8
+
+    # Query embedding cache (LRU + TTL, optional SQLite tier that survives restarts)
+    EMB_CACHE_SIZE: int = 4096
+    EMB_CACHE_TTL_SECONDS: int = 86400
+    EMB_CACHE_DISK_PATH: str = ""
+
+    # Micro-batching of concurrent query embeddings
+    EMB_BATCHING: bool = True
+    EMB_BATCH_MAX_SIZE: int = 32
+    EMB_BATCH_MAX_WAIT_MS: float = 5.0
+
     # ChromaDB settings
     CHROMA_HOST: str = "localhost"
     CHROMA_PORT: int = 8001
     COLLECTION_NAME: str = "legal_chunks"
 
+    # Vector store backend: "chroma" (HTTP server) or "local" (in-process, memory-mapped)
+    VECTOR_STORE: str = "chroma"
+    EMBEDDINGS_STORE_PATH: str = "data/embeddings/store"
+    EMBEDDINGS_NPY_PATH: str = "data/embeddings/embeddings.npy"  # legacy single-file matrix
+    METADATA_EMBEDDINGS_PATH: str = "data/metadata_embeddings.csv"
+    CHUNK_STORE_PATH: str = "data/chunked/store"
+    DOC_METADATA_PATH: str = "data/doc_metadata.csv"  # source / court / date per document, for filters
+    CHUNKS_JSONL_PATH: str = "data/chunked/chunks.jsonl"  # legacy, used when there is no chunk store
+    MANIFEST_PATH: str = "data/manifest.sqlite"  # ETL manifest: which embedding rows are still live
+
+    # Local backend index: "flat" (exact scan), "ivfpq" (built by etl/etl_ann_index.py)
+    # or "quantized" (int8 / binary codes from etl_embedding.py --quantize, rescored in float)
+    VECTOR_INDEX: str = "flat"
+    ANN_INDEX_PATH: str = "data/embeddings/ann_index.npz"
+    QUANTIZED_INDEX_PATH: str = "data/embeddings/quantized.npz"
+    ANN_NPROBE: int = 16
+    ANN_RERANK_FACTOR: int = 4
+
+    # Hybrid retrieval: BM25 index (built by etl/etl_bm25_index.py) fused with the dense results
+    HYBRID_SEARCH: bool = True
+    BM25_INDEX_PATH: str = "data/bm25_index.npz"
+    HYBRID_CANDIDATES: int = 4  # candidates per retriever, as a multiple of top_k
+    RRF_K: int = 60
+
+    # Semantic answer cache (invalidated through the doc versions written by scripts/build_vector_db.py)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 1024
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    DOC_VERSIONS_PATH: str = "data/doc_versions.json"
+
+    # Characters of chunk content returned as snippet in QueryResponse
+    SNIPPET_CHARS: int = 300
+
     # LLM
     LLM_MODEL_NAME: str = "gemini-2.5-flash-lite"
     LLM_TEMPERATURE: float = 0.
@@ -0,0 +1,242 @@
+import numpy as np
+
+from api.db.local_store import normalize, top_k_indices
+
+
+# Rows processed at a time when assigning / encoding vectors
+BLOCK_ROWS = 16384
+
+
+class IVFPQIndex:
+    """Inverted-file index with product-quantized residuals (IVF-PQ).
+
+    Vectors are L2-normalized, assigned to the nearest of ``nlist`` coarse
+    centroids and the residual to that centroid is compressed into ``m`` bytes
+    (one 256-entry codebook per sub-vector). Search visits the ``nprobe``
+    closest lists and scores their codes with per-query lookup tables, so
+    ``nprobe`` is the recall/latency knob. Row ids are insertion order, which
+    matches the row order of the embedding store.
+    """
+
+    def __init__(self, dim: int, nlist: int, m: int):
+        if dim % m:
+            raise ValueError(f"Vector dim {dim} is not divisible by m={m}")
+
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.dsub = dim // m
+
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.codebooks = np.empty((m, 0, self.dsub), dtype=np.float32)
+
+        self.codes = np.empty((0, m), dtype=np.uint8)
+        self.assign = np.empty(0, dtype=np.int32)
+
+        # Inverted lists: row ids grouped by list, list l is list_ids[list_offsets[l]:list_offsets[l + 1]]
+        self.list_ids = np.empty(0, dtype=np.int64)
+        self.list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+
+    @property
+    def ntotal(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids.shape[0] > 0
+
+    # Build
+
+    def train(self, vectors: np.ndarray, iters: int = 20, seed: int = 0):
+        """Learn coarse centroids and PQ codebooks from a training sample."""
+
+        rng = np.random.default_rng(seed)
+        x = normalize(vectors)
+
+        self.centroids = kmeans(x, self.nlist, iters, rng)
+        self.nlist = self.centroids.shape[0]
+        residuals = x - self.centroids[nearest(x, self.centroids)]
+
+        ksub = min(256, x.shape[0])
+        self.codebooks = np.stack([
+            kmeans(residuals[:, i * self.dsub:(i + 1) * self.dsub], ksub, iters, rng)
+            for i in range(self.m)
+        ])
+
+    def add(self, vectors: np.ndarray):
+        """Append vectors; they get row ids ``ntotal .. ntotal + len(vectors) - 1``."""
+
+        if not self.is_trained:
+            raise RuntimeError("Index must be trained before adding vectors")
+
+        new_codes = []
+        new_assign = []
+
+        for start in range(0, vectors.shape[0], BLOCK_ROWS):
+            x = normalize(vectors[start:start + BLOCK_ROWS])
+            assign = nearest(x, self.centroids)
+            new_codes.append(self.encode(x - self.centroids[assign]))
+            new_assign.append(assign.astype(np.int32))
+
+        if not new_codes:
+            return
+
+        self.codes = np.concatenate([self.codes] + new_codes)
+        self.assign = np.concatenate([self.assign] + new_assign)
+        self._rebuild_lists()
+
+    def encode(self, residuals: np.ndarray) -> np.ndarray:
+        codes = np.empty((residuals.shape[0], self.m), dtype=np.uint8)
+
+        for i in range(self.m):
+            sub = residuals[:, i * self.dsub:(i + 1) * self.dsub]
+            codes[:, i] = nearest(sub, self.codebooks[i])
+
+        return codes
+
+    def _rebuild_lists(self):
+        self.list_ids = np.argsort(self.assign, kind="stable").astype(np.int64)
+        counts = np.bincount(self.assign, minlength=self.nlist)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    # Search
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = 16,
+               rerank_vectors: np.ndarray = None, rerank_factor: int = 4, allowed: np.ndarray = None):
+        """Approximate top-k by cosine similarity.
+
+        With ``rerank_vectors`` (the raw float matrix, e.g. memory-mapped), the
+        best ``k * rerank_factor`` PQ candidates are rescored exactly. With an
+        ``allowed`` mask over row ids, other rows are dropped from the lists
+        before scoring.
+        Returns ``(ids, scores)`` lists, one array per query, best first.
+        """
+
+        q = normalize(queries)
+        nprobe = min(nprobe, self.nlist)
+        shortlist = k * rerank_factor if rerank_vectors is not None else k
+
+        all_ids, all_scores = [], []
+
+        for qi in q:
+            probe = top_k_indices(self.centroids @ qi, nprobe)
+
+            cand_ids, cand_dist = [], []
+            for list_no in probe:
+                ids = self.list_ids[self.list_offsets[list_no]:self.list_offsets[list_no + 1]]
+                if allowed is not None:
+                    ids = ids[allowed[ids]]
+                if not ids.size:
+                    continue
+
+                # Lookup table of squared distances, shape (m, ksub)
+                target = (qi - self.centroids[list_no]).reshape(self.m, 1, self.dsub)
+                lut = ((self.codebooks - target) ** 2).sum(axis=2)
+
+                cand_ids.append(ids)
+                cand_dist.append(lut[np.arange(self.m), self.codes[ids]].sum(axis=1))
+
+            if not cand_ids:
+                all_ids.append(np.empty(0, dtype=np.int64))
+                all_scores.append(np.empty(0, dtype=np.float32))
+                continue
+
+            cand_ids = np.concatenate(cand_ids)
+            # ||q - x||^2 = 2 - 2 cos for unit vectors
+            cand_scores = 1.0 - np.concatenate(cand_dist) / 2.0
+
+            top = top_k_indices(cand_scores, shortlist)
+            cand_ids, cand_scores = cand_ids[top], cand_scores[top]
+
+            if rerank_vectors is not None:
+                cand_scores = exact_scores(rerank_vectors, cand_ids, qi)
+                top = top_k_indices(cand_scores, k)
+                cand_ids, cand_scores = cand_ids[top], cand_scores[top]
+
+            all_ids.append(cand_ids)
+            all_scores.append(cand_scores.astype(np.float32))
+
+        return all_ids, all_scores
+
+    # Persistence
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            config=np.array([self.dim, self.nlist, self.m], dtype=np.int64),
+            centroids=self.centroids,
+            codebooks=self.codebooks,
+            codes=self.codes,
+            assign=self.assign,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQIndex":
+        data = np.load(path)
+        dim, nlist, m = (int(v) for v in data["config"])
+
+        index = cls(dim, nlist, m)
+        index.centroids = data["centroids"]
+        index.codebooks = data["codebooks"]
+        index.codes = data["codes"]
+        index.assign = data["assign"]
+        index._rebuild_lists()
+
+        return index
+
+
+# Helpers
+
+def exact_scores(vectors: np.ndarray, ids: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Exact cosine between a unit query and selected (raw) rows."""
+
+    # Sorted gather keeps memory-mapped reads sequential
+    order = np.argsort(ids)
+    rows = np.asarray(vectors[ids[order]], dtype=np.float32)
+
+    scores = np.empty(ids.shape[0], dtype=np.float32)
+    scores[order] = (rows @ query) / np.maximum(np.linalg.norm(rows, axis=1), 1e-12)
+    return scores
+
+
+def nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (L2) for each row of ``x``."""
+
+    c_sq = (centroids ** 2).sum(axis=1)
+    out = np.empty(x.shape[0], dtype=np.int64)
+
+    for start in range(0, x.shape[0], BLOCK_ROWS):
+        block = x[start:start + BLOCK_ROWS]
+        out[start:start + BLOCK_ROWS] = np.argmin(c_sq - 2.0 * (block @ centroids.T), axis=1)
+
+    return out
+
+
+def kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points."""
+
+    k = min(k, x.shape[0])
+    centroids = x[rng.choice(x.shape[0], k, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+
+        order = np.argsort(assign, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = np.searchsorted(assign[order], nonempty)
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            centroids[empty] = x[rng.choice(x.shape[0], empty.size, replace=False)]
+
+    return centroids.astype(np.float32)
+
+
+def recall_at_k(approx_ids, exact_ids, k: int) -> float:
+    """Mean fraction of the exact top-k found in the approximate top-k."""
+
+    hits = [len(set(a[:k].tolist()) & set(e[:k].tolist())) for a, e in zip(approx_ids, exact_ids)]
+    return float(np.mean(hits)) / k if hits else 0.0
@@ -0,0 +1,215 @@
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from api.db.local_store import top_k_indices
+
+
+# Numbers with their separators ("587/2024", "2.3") or runs of letters, after folding
+TOKEN = re.compile(r"\d+(?:[./-]\d+)*|[a-z]+")
+NUMBER_PARTS = re.compile(r"\d+")
+
+# Ordinal indicators: "94º" -> "94", "nº" -> "n"
+ORDINALS = str.maketrans("", "", "ºª°")
+
+STOPWORDS = frozenset("""
+    a ao aos as ate com como da das de dela dele do dos e ela ele em entre era essa esse esta este eu foi for
+    ha isso isto ja la lhe mais mas me mesmo na nas nao no nos num numa o os ou para pela pelas pelo pelos
+    por qual quando que quem se sem ser seu sua sao so sob sobre tambem te tem ter um uma umas uns
+""".split())
+
+# Usual abbreviations in legal citations
+ABBREVIATIONS = {"art": "artigo", "arts": "artigo", "ac": "acordao", "proc": "processo", "dl": "decreto"}
+
+# Plural endings folded to the singular (longest first)
+PLURALS = (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("s", ""))
+
+
+def fold(text: str) -> str:
+    """Lower case without diacritics or ordinal indicators."""
+    text = unicodedata.normalize("NFKD", text.translate(ORDINALS).lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def singular(word: str) -> str:
+    for suffix, replacement in PLURALS:
+        if word.endswith(suffix) and len(word) > len(suffix) + 3:
+            return word[:-len(suffix)] + replacement
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Portuguese-aware terms: accents folded, stopwords dropped, numeric citations kept whole and split."""
+
+    terms = []
+    for token in TOKEN.findall(fold(text)):
+        if token[0].isdigit():
+            terms.append(token)
+            # "587/2024" also matches "587" and "2024"
+            parts = NUMBER_PARTS.findall(token)
+            if len(parts) > 1:
+                terms.extend(parts)
+
+        elif len(token) > 1 and token not in STOPWORDS:
+            terms.append(singular(ABBREVIATIONS.get(token, token)))
+
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over the chunk corpus with array-backed postings.
+
+    Postings are stored term by term (CSR): the chunks containing term ``t``
+    are ``doc_ids[offsets[t]:offsets[t + 1]]`` with their term frequencies in
+    ``tfs``. Terms and chunk ids are kept as one UTF-8 blob plus offsets, so
+    the saved index is a handful of flat arrays.
+    """
+
+    def __init__(self, terms: List[str], chunk_ids: List[str], offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_lengths: np.ndarray, k1: float = 1.2, b: float = 0.75):
+
+        self.terms = terms
+        self.term_ids = {t: i for i, t in enumerate(terms)}
+        self.chunk_ids = chunk_ids
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        n = len(chunk_ids)
+        df = np.diff(offsets)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # Length normalization of each chunk, k1 * (1 - b + b * dl / avgdl)
+        avgdl = max(float(doc_lengths.mean()), 1.0) if n else 1.0
+        self.norms = (k1 * (1.0 - b + b * doc_lengths / avgdl)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, chunks: Iterable[Tuple[str, str]], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Index ``(chunk_id, content)`` pairs."""
+
+        term_ids: Dict[str, int] = {}
+        chunk_ids: List[str] = []
+        lengths = array("i")
+        post_terms, post_docs, post_tfs = array("i"), array("i"), array("i")
+
+        for doc, (chunk_id, content) in enumerate(chunks):
+            terms = tokenize(content)
+            chunk_ids.append(chunk_id)
+            lengths.append(len(terms))
+
+            for term, tf in Counter(terms).items():
+                post_terms.append(term_ids.setdefault(term, len(term_ids)))
+                post_docs.append(doc)
+                post_tfs.append(tf)
+
+        # Group the postings by term; a stable sort keeps chunks in order within a term
+        post_terms = np.frombuffer(post_terms, dtype=np.int32)
+        order = np.argsort(post_terms, kind="stable")
+        offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(post_terms, minlength=len(term_ids)))
+
+        return cls(
+            terms=sorted(term_ids, key=term_ids.get),
+            chunk_ids=chunk_ids,
+            offsets=offsets,
+            doc_ids=np.frombuffer(post_docs, dtype=np.int32)[order],
+            tfs=np.minimum(np.frombuffer(post_tfs, dtype=np.int32)[order], np.iinfo(np.uint16).max).astype(np.uint16),
+            doc_lengths=np.frombuffer(lengths, dtype=np.int32).astype(np.float32),
+            k1=k1,
+            b=b,
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for the query."""
+
+        scores = np.zeros(len(self), dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            t = self.term_ids.get(term)
+            if t is None:
+                continue
+
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            # Each chunk appears once per term, so fancy-index accumulation is safe
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1.0) / (tf + self.norms[docs])
+
+        return scores
+
+    def search(self, query: str, k: int) -> Tuple[List[str], np.ndarray]:
+        """Top-k chunk ids with a positive score, best first."""
+
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        top = matched[top_k_indices(scores[matched], k)]
+
+        return [self.chunk_ids[i] for i in top], scores[top]
+
+    def save(self, path: str):
+        term_blob, term_offsets = pack_strings(self.terms)
+        id_blob, id_offsets = pack_strings(self.chunk_ids)
+
+        # Atomic replace, the API may be loading the index
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                params=np.array([self.k1, self.b], dtype=np.float64),
+                term_blob=term_blob, term_offsets=term_offsets,
+                id_blob=id_blob, id_offsets=id_offsets,
+                offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs, doc_lengths=self.doc_lengths,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        data = np.load(path)
+        k1, b = (float(v) for v in data["params"])
+
+        return cls(
+            terms=unpack_strings(data["term_blob"], data["term_offsets"]),
+            chunk_ids=unpack_strings(data["id_blob"], data["id_offsets"]),
+            offsets=data["offsets"],
+            doc_ids=data["doc_ids"],
+            tfs=data["tfs"],
+            doc_lengths=data["doc_lengths"],
+            k1=k1,
+            b=b,
+        )
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Merge ranked id lists by sum of ``1 / (k + rank)``; ties keep first-seen order."""
+
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# Helpers
+
+def pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    raw = blob.tobytes()
+    return [raw[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
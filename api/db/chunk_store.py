@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+
+# One fixed-size record per stored chunk version
+RECORD_DTYPE = np.dtype([
+    ("offset", "<u8"),          # byte offset of the content in content.bin
+    ("length", "<u4"),          # content length in bytes
+    ("tokens", "<u4"),
+    ("embedding_row", "<i8"),   # row in the embedding store, -1 until embedded
+    ("hash", "u1", (32,)),      # sha256 of the content
+])
+
+CONTENT_FILE = "content.bin"
+RECORDS_FILE = "records.bin"
+INDEX_FILE = "index.sqlite"
+
+# chunk_ids per SQL ``IN (...)`` lookup
+LOOKUP_BATCH = 500
+
+
+class ChunkStore:
+    """Chunk content and per-chunk columns with random access by ``chunk_id``.
+
+    ``directory`` holds the UTF-8 content of every chunk version appended to
+    ``content.bin``, one ``RECORD_DTYPE`` record per version in ``records.bin``
+    and ``index.sqlite`` mapping each ``chunk_id`` to the record of its current
+    version. Appends write content and records before the index, so a torn
+    append leaves only unreferenced bytes behind. Lookups read single records
+    and content ranges with ``pread``; nothing is loaded up front.
+    """
+
+    def __init__(self, directory: str):
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        # Plain descriptors: appends and in-place record updates both go through pwrite
+        self._content = os.open(os.path.join(directory, CONTENT_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._records = os.open(os.path.join(directory, RECORDS_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+
+        self.db = sqlite3.connect(os.path.join(directory, INDEX_FILE), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, doc_id TEXT, record INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_chunks_record ON chunks(record)")
+        self.db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+        os.close(self._content)
+        os.close(self._records)
+
+    # Writes
+
+    def put(self, rows: Iterable[dict]):
+        """Store new versions of chunks (``doc_id``, ``chunk_id``, ``content``, optional ``tokens``)."""
+
+        rows = list(rows)
+        if not rows:
+            return
+
+        blobs = [row["content"].encode("utf-8") for row in rows]
+
+        with self._lock:
+            content_end = os.fstat(self._content).st_size
+            # A torn record append is overwritten
+            first_record = os.fstat(self._records).st_size // RECORD_DTYPE.itemsize
+
+            records = np.zeros(len(rows), dtype=RECORD_DTYPE)
+            records["length"] = [len(b) for b in blobs]
+            records["offset"][0] = content_end
+            records["offset"][1:] = content_end + np.cumsum(records["length"][:-1], dtype=np.uint64)
+            records["tokens"] = [int(row.get("tokens") or 0) for row in rows]
+            records["embedding_row"] = -1
+            records["hash"] = np.frombuffer(b"".join(hashlib.sha256(b).digest() for b in blobs), dtype=np.uint8).reshape(-1, 32)
+
+            os.pwrite(self._content, b"".join(blobs), content_end)
+            os.pwrite(self._records, records.tobytes(), first_record * RECORD_DTYPE.itemsize)
+
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO chunks (chunk_id, doc_id, record) VALUES (?, ?, ?)",
+                    ((row["chunk_id"], row["doc_id"], first_record + i) for i, row in enumerate(rows)),
+                )
+
+    def remove(self, chunk_ids: Iterable[str]):
+        """Forget chunks that no longer exist (their bytes stay in the files)."""
+
+        with self._lock, self.db:
+            self.db.executemany("DELETE FROM chunks WHERE chunk_id = ?", ((c,) for c in chunk_ids))
+
+    def set_embedding_rows(self, rows: Dict[str, int]):
+        """Record the embedding store row of the current version of each chunk."""
+
+        field = RECORD_DTYPE.fields["embedding_row"][1]
+
+        for chunk_id, (_, record) in self._lookup(rows).items():
+            os.pwrite(self._records, np.int64(rows[chunk_id]).tobytes(), record * RECORD_DTYPE.itemsize + field)
+
+    def import_jsonl(self, path: str, batch_size: int = 1000) -> int:
+        """Load a legacy ``chunks.jsonl``; later lines of a chunk_id replace earlier ones."""
+
+        batch, n = [], 0
+
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+
+                batch.append(json.loads(line))
+                if len(batch) == batch_size:
+                    self.put(batch)
+                    n += len(batch)
+                    batch = []
+
+        self.put(batch)
+        return n + len(batch)
+
+    # Reads
+
+    def get(self, chunk_id: str) -> Optional[dict]:
+        return self.get_many([chunk_id]).get(chunk_id)
+
+    def get_many(self, chunk_ids: Iterable[str]) -> Dict[str, dict]:
+        """Current version of each known chunk: ``doc_id``, ``content``, ``tokens``, ``hash`` (hex), ``embedding_row``."""
+
+        return {
+            chunk_id: self._read(chunk_id, doc_id, record)
+            for chunk_id, (doc_id, record) in sorted(self._lookup(chunk_ids).items(), key=lambda item: item[1][1])
+        }
+
+    def contents(self, chunk_ids: Iterable[str]) -> Dict[str, str]:
+        return {chunk_id: chunk["content"] for chunk_id, chunk in self.get_many(chunk_ids).items()}
+
+    def iter_chunks(self) -> Iterator[dict]:
+        """Current version of every chunk, in storage order."""
+
+        with self._lock:
+            index = self.db.execute("SELECT chunk_id, doc_id, record FROM chunks ORDER BY record").fetchall()
+
+        for chunk_id, doc_id, record in index:
+            yield self._read(chunk_id, doc_id, record)
+
+    def _lookup(self, chunk_ids: Iterable[str]) -> Dict[str, tuple]:
+        chunk_ids = list(chunk_ids)
+        found = {}
+
+        with self._lock:
+            for start in range(0, len(chunk_ids), LOOKUP_BATCH):
+                batch = chunk_ids[start:start + LOOKUP_BATCH]
+                found.update(
+                    (chunk_id, (doc_id, record))
+                    for chunk_id, doc_id, record in self.db.execute(
+                        f"SELECT chunk_id, doc_id, record FROM chunks WHERE chunk_id IN ({', '.join('?' * len(batch))})",
+                        batch,
+                    )
+                )
+
+        return found
+
+    def _read(self, chunk_id: str, doc_id: str, record: int) -> dict:
+        rec = np.frombuffer(
+            os.pread(self._records, RECORD_DTYPE.itemsize, record * RECORD_DTYPE.itemsize), dtype=RECORD_DTYPE
+        )[0]
+        content = os.pread(self._content, int(rec["length"]), int(rec["offset"]))
+
+        return {
+            "doc_id": doc_id,
+            "chunk_id": chunk_id,
+            "content": content.decode("utf-8"),
+            "tokens": int(rec["tokens"]),
+            "hash": rec["hash"].tobytes().hex(),
+            "embedding_row": int(rec["embedding_row"]) if rec["embedding_row"] >= 0 else None,
+        }
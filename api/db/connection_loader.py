@@ -0,0 +1,73 @@
+import os
+from functools import lru_cache
+from api.core.config import settings
+
+from chromadb import HttpClient
+
+from api.db.local_store import LocalVectorStore
+from api.db.ann_index import IVFPQIndex
+from api.db.bm25_index import BM25Index
+from api.db.quantized_index import QuantizedIndex
+
+
+# Cache the connection to avoid reconnecting on every request
+@lru_cache
+def get_chroma_collection():
+    client = HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
+
+    collection = client.get_or_create_collection(
+        name=settings.COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"}
+    )
+    return collection
+
+
+@lru_cache
+def get_local_store():
+    ann_index = None
+    if settings.VECTOR_INDEX == "ivfpq":
+        ann_index = IVFPQIndex.load(settings.ANN_INDEX_PATH)
+    elif settings.VECTOR_INDEX == "quantized":
+        ann_index = QuantizedIndex.load(settings.QUANTIZED_INDEX_PATH)
+    elif settings.VECTOR_INDEX != "flat":
+        raise ValueError(f"Unknown vector index: {settings.VECTOR_INDEX}")
+
+    store = LocalVectorStore(
+        embeddings_path=settings.EMBEDDINGS_STORE_PATH if os.path.isdir(settings.EMBEDDINGS_STORE_PATH) else settings.EMBEDDINGS_NPY_PATH,
+        metadata_path=settings.METADATA_EMBEDDINGS_PATH,
+        chunks_path=settings.CHUNK_STORE_PATH if os.path.isdir(settings.CHUNK_STORE_PATH) else settings.CHUNKS_JSONL_PATH,
+        ann_index=ann_index,
+        nprobe=settings.ANN_NPROBE,
+        rerank_factor=settings.ANN_RERANK_FACTOR,
+        doc_metadata_path=settings.DOC_METADATA_PATH,
+        manifest_path=settings.MANIFEST_PATH,
+    )
+    return store
+
+
+@lru_cache
+def get_bm25_index():
+    """Lexical index for hybrid search, or None when disabled or not built yet."""
+
+    if not settings.HYBRID_SEARCH or not os.path.exists(settings.BM25_INDEX_PATH):
+        return None
+
+    index = BM25Index.load(settings.BM25_INDEX_PATH)
+    print(f"[BM25Index] Loaded {len(index)} chunks, {len(index.terms)} terms.")
+    return index
+
+
+def get_vector_store():
+    """Vector store selected by ``settings.VECTOR_STORE``.
+
+    Both backends expose ``query(query_embeddings=..., n_results=...)`` with
+    Chroma's result layout.
+    """
+
+    if settings.VECTOR_STORE == "chroma":
+        return get_chroma_collection()
+
+    if settings.VECTOR_STORE == "local":
+        return get_local_store()
+
+    raise ValueError(f"Unknown vector store backend: {settings.VECTOR_STORE}")
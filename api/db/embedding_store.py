@@ -0,0 +1,201 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+
+# Rows per shard file
+SHARD_ROWS = 65536
+
+STORE_META = "store.json"
+
+
+class ShardedEmbeddingStore:
+    """Append-only embedding matrix stored as fixed-size raw shards.
+
+    ``directory`` holds ``shard_00000.bin``, ``shard_00001.bin``, ... (row-major,
+    ``shard_rows`` rows each, the last one partial) and ``store.json`` with the
+    dimension, dtype and row count. Appending writes only the new rows and then
+    the count, so a torn append is ignored (and overwritten) by the next one.
+    ``float16`` halves the disk and page-cache footprint; reads are float32.
+    """
+
+    def __init__(self, directory: str, dim: Optional[int] = None, dtype: str = "float32",
+                 shard_rows: int = SHARD_ROWS):
+
+        self.directory = directory
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.shard_rows = shard_rows
+        self.count = 0
+
+        meta_path = os.path.join(directory, STORE_META)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+            self.shard_rows = meta["shard_rows"]
+            self.count = meta["count"]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"shard_{shard:05d}.bin")
+
+    def _write_meta(self):
+        meta = {"dim": self.dim, "dtype": self.dtype.name, "shard_rows": self.shard_rows, "count": self.count}
+
+        # Atomic replace, readers may be opening the store
+        tmp_path = os.path.join(self.directory, STORE_META + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.directory, STORE_META))
+
+    def append(self, vectors: np.ndarray) -> int:
+        """Append rows; returns the row index of the first one."""
+
+        vectors = np.atleast_2d(np.asarray(vectors))
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, got {vectors.shape[1]}.")
+
+        vectors = vectors.astype(self.dtype, copy=False)
+        row_bytes = self.dim * self.dtype.itemsize
+        os.makedirs(self.directory, exist_ok=True)
+
+        first = self.count
+        pos = 0
+        while pos < vectors.shape[0]:
+            shard, offset = divmod(self.count, self.shard_rows)
+            take = min(self.shard_rows - offset, vectors.shape[0] - pos)
+            path = self._shard_path(shard)
+
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.seek(offset * row_bytes)
+                f.write(vectors[pos:pos + take].tobytes())
+                f.truncate()
+
+            self.count += take
+            pos += take
+
+        self._write_meta()
+        return first
+
+    def truncate(self, count: int):
+        """Drop the rows from ``count`` on (e.g. an uncommitted batch); later appends overwrite them."""
+
+        if count >= self.count:
+            return
+
+        self.count = count
+        self._write_meta()
+
+        # Shards entirely past the new end
+        shard = -(-count // self.shard_rows)
+        while os.path.exists(self._shard_path(shard)):
+            os.remove(self._shard_path(shard))
+            shard += 1
+
+    def import_npy(self, npy_path: str, block_rows: int = SHARD_ROWS) -> int:
+        """Append the rows of a legacy ``embeddings.npy``, block by block."""
+
+        legacy = np.load(npy_path, mmap_mode="r")
+        for start in range(0, legacy.shape[0], block_rows):
+            self.append(legacy[start:start + block_rows])
+        return legacy.shape[0]
+
+    def view(self) -> "ShardedArray":
+        """Read-only, memory-mapped view of the rows stored so far."""
+
+        shards = []
+        for shard, start in enumerate(range(0, self.count, self.shard_rows)):
+            rows = min(self.shard_rows, self.count - start)
+            shards.append(np.memmap(self._shard_path(shard), dtype=self.dtype, mode="r", shape=(rows, self.dim)))
+
+        return ShardedArray(shards, self.shard_rows, self.dim or 0)
+
+
+class ShardedArray:
+    """Array-like view over the shards, enough for the readers of the embedding matrix.
+
+    Slices with step 1 are lazy views; integers and index arrays read the rows
+    as a float32 array, and ``np.asarray(view)`` materializes the view.
+    """
+
+    def __init__(self, shards, shard_rows: int, dim: int, start: int = 0, stop: Optional[int] = None):
+        self.shards = shards
+        self.shard_rows = shard_rows
+        self.dim = dim
+        self.start = start
+        self.stop = sum(s.shape[0] for s in shards) if stop is None else stop
+
+    @property
+    def shape(self):
+        return (self.stop - self.start, self.dim)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            return ShardedArray(self.shards, self.shard_rows, self.dim, self.start + start, self.start + max(start, stop))
+
+        if isinstance(key, (int, np.integer)):
+            return self._gather(np.array([key]))[0]
+
+        return self._gather(np.asarray(key))
+
+    def __array__(self, dtype=None, copy=None):
+        out = self._range(self.start, self.stop)
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def _range(self, start: int, stop: int) -> np.ndarray:
+        out = np.empty((stop - start, self.dim), dtype=np.float32)
+
+        row = start
+        while row < stop:
+            shard, offset = divmod(row, self.shard_rows)
+            take = min(self.shard_rows - offset, stop - row)
+            out[row - start:row - start + take] = self.shards[shard][offset:offset + take]
+            row += take
+
+        return out
+
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        rows = rows.astype(np.int64).ravel()
+        rows = np.where(rows < 0, rows + len(self), rows)
+        if rows.size and (rows.min() < 0 or rows.max() >= len(self)):
+            raise IndexError("Row index out of range.")
+
+        rows = rows + self.start
+        out = np.empty((rows.shape[0], self.dim), dtype=np.float32)
+
+        shard_of = rows // self.shard_rows
+        for shard in np.unique(shard_of):
+            mask = shard_of == shard
+            out[mask] = self.shards[shard][rows[mask] - shard * self.shard_rows]
+
+        return out
+
+
+def open_embeddings(path: str):
+    """Embedding matrix for readers: a sharded store directory, or a legacy ``.npy`` (memory-mapped)."""
+
+    if os.path.isdir(path):
+        return ShardedEmbeddingStore(path).view()
+
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,345 @@
+import csv
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from api.db.chunk_store import ChunkStore
+from api.db.embedding_store import open_embeddings
+
+
+# Rows processed at a time when scanning the memory-mapped matrix
+BLOCK_ROWS = 65536
+
+# Document fields usable in ``where`` filters: categorical (bitmap per value) and the YYYYMMDD date
+FILTER_FIELDS = ["source", "court"]
+RANGE_FIELDS = ["date", "date_end"]
+RANGE_OPERATORS = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+
+class LocalVectorStore:
+    """In-process vector store over the ETL embeddings output.
+
+    The embedding matrix is memory-mapped from the ETL's sharded store (or a
+    legacy ``embeddings.npy``; row ``i`` matches row ``i`` of
+    ``metadata_embeddings.csv``) and queried with exact
+    cosine similarity. ``query`` returns the same structure as a Chroma
+    collection so the retrieval tool does not care which backend it talks to.
+
+    With an ``ann_index`` (see ``api.db.ann_index``) the matrix is only used to
+    rescore the index shortlist; rows appended after the index was built are
+    still searched exactly so new chunks are visible straight away.
+
+    ``where`` filters on the document's source / court / date (from
+    ``doc_metadata_path``) are resolved to a row mask from per-value bitmaps
+    before scoring, so excluded rows never take a top-k slot.
+
+    Live rows come from the ETL manifest (``manifest_path``), whose
+    ``embeddings`` table drops the rows of chunks removed by a re-chunk and of
+    superseded versions. Without a manifest the last row of each chunk_id in
+    the ledger is live.
+    """
+
+    def __init__(self, embeddings_path: str, metadata_path: str, chunks_path: Optional[str] = None,
+                 ann_index=None, nprobe: int = 16, rerank_factor: int = 4, doc_metadata_path: Optional[str] = None,
+                 manifest_path: Optional[str] = None):
+
+        self.embeddings = open_embeddings(embeddings_path)
+        self.metadatas = load_metadata(metadata_path)
+
+        # Guard against a partially written ledger / matrix
+        n = min(len(self.metadatas), self.embeddings.shape[0])
+        self.embeddings = self.embeddings[:n]
+        self.metadatas = self.metadatas[:n]
+        self.ids = [m["chunk_id"] for m in self.metadatas]
+
+        # Rows of deleted chunks stay in the ledger; the manifest knows which rows still back a chunk
+        if manifest_path and os.path.exists(manifest_path):
+            self.live = manifest_live_rows(manifest_path, n)
+        else:
+            # A re-embedded chunk appends a new row; only the last row of each chunk_id is live
+            self.live = live_rows(self.ids)
+
+        # chunk_id -> its live row, for ``get``
+        self.row_of = {self.ids[i]: int(i) for i in np.flatnonzero(self.live)}
+
+        # The ETL stores raw (unnormalized) embeddings
+        self.inv_norms = inverse_norms(self.embeddings)
+
+        # Filter fields joined by doc_id; one bitmap per source / court value
+        doc_metadata = load_doc_metadata(doc_metadata_path) if doc_metadata_path else {}
+        unknown = {"source": "", "court": "", "date": 0, "date_end": 0}
+        self.metadatas = [{**m, **doc_metadata.get(m["doc_id"], unknown)} for m in self.metadatas]
+        self.bitmaps = {field: value_bitmaps([m[field] for m in self.metadatas]) for field in FILTER_FIELDS}
+        self.ranges = {field: np.array([m[field] for m in self.metadatas], dtype=np.int64) for field in RANGE_FIELDS}
+
+        # Content comes from the chunk store per query; a legacy chunks.jsonl is loaded up front
+        self.chunk_store = None
+        self.documents = {}
+        if chunks_path and os.path.isdir(chunks_path):
+            self.chunk_store = ChunkStore(chunks_path)
+        elif chunks_path:
+            self.documents = load_documents(chunks_path, set(self.ids))
+
+        self.ann_index = ann_index
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+
+        print(f"[LocalVectorStore] Loaded {n} embeddings of dim {self.embeddings.shape[1]}.")
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def filter_mask(self, where: Optional[Dict] = None, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows that are live and match a Chroma-style ``where`` (``$and``, equality, ``$in``, ``$gt(e)``/``$lt(e)``).
+
+        With ``rows`` only those rows are tested and the mask is aligned with them.
+        """
+
+        live = self.live if rows is None else self.live[rows]
+        if not where:
+            return live
+
+        if "$and" in where:
+            mask = live.copy()
+            for clause in where["$and"]:
+                mask &= self.filter_mask(clause, rows)
+            return mask
+
+        mask = live.copy()
+        for field, condition in where.items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+
+            for op, value in condition.items():
+                if field in self.ranges and op in RANGE_OPERATORS:
+                    values = self.ranges[field] if rows is None else self.ranges[field][rows]
+                    mask &= RANGE_OPERATORS[op](values, int(value))
+                elif field in self.bitmaps and op in ("$eq", "$in"):
+                    hit = np.zeros(mask.shape[0], dtype=bool)
+                    for v in (value if op == "$in" else [value]):
+                        if v in self.bitmaps[field]:
+                            hit |= self.bitmaps[field][v] if rows is None else self.bitmaps[field][v][rows]
+                    mask &= hit
+                else:
+                    raise ValueError(f"Unsupported filter on {field!r}: {op}")
+
+        return mask
+
+    def scores(self, query_embeddings: np.ndarray, start_row: int = 0, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity of stored rows (from ``start_row``) against each query, shape (n_queries, n_rows).
+
+        Rows outside ``mask`` (default: the live rows) score ``-inf``.
+        """
+
+        q = normalize(query_embeddings)
+
+        out = np.empty((q.shape[0], self.count() - start_row), dtype=np.float32)
+        for start in range(start_row, self.count(), BLOCK_ROWS):
+            end = start + BLOCK_ROWS
+            block = np.asarray(self.embeddings[start:end], dtype=np.float32)
+            out[:, start - start_row:end - start_row] = (q @ block.T) * self.inv_norms[start:end]
+
+        mask = self.live if mask is None else mask
+        out[:, ~mask[start_row:]] = -np.inf
+        return out
+
+    def search(self, query_embeddings: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+        """Top-k row indices and cosine similarities for each query, best first, among the rows in ``mask``."""
+
+        mask = self.live if mask is None else mask
+
+        if self.ann_index is None:
+            hits = []
+            for scores in self.scores(query_embeddings, mask=mask):
+                top = top_k_indices(scores, k)
+                top = top[np.isfinite(scores[top])]
+                hits.append((top, scores[top]))
+            return hits
+
+        # Rows not yet in the index are scanned exactly and merged
+        tail_start = min(self.ann_index.ntotal, self.count())
+
+        # Pre-filter inside the inverted lists: dead and filtered-out rows are never scored
+        allowed = np.zeros(self.ann_index.ntotal, dtype=bool)
+        allowed[:tail_start] = mask[:tail_start]
+
+        all_ids, all_scores = self.ann_index.search(
+            query_embeddings, k,
+            nprobe=self.nprobe,
+            rerank_vectors=self.embeddings,
+            rerank_factor=self.rerank_factor,
+            allowed=allowed,
+        )
+
+        hits = []
+        for ids, scores, tail_scores in zip(all_ids, all_scores, self.scores(query_embeddings, tail_start, mask)):
+            keep = ids < tail_start
+            keep[keep] = mask[ids[keep]]
+            ids = np.concatenate([ids[keep], np.arange(tail_start, self.count())])
+            scores = np.concatenate([scores[keep], tail_scores])
+            top = top_k_indices(scores, k)
+            top = top[np.isfinite(scores[top])]
+            hits.append((ids[top], scores[top]))
+
+        return hits
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 5, where: Optional[Dict] = None,
+              **kwargs) -> Dict[str, list]:
+        """Top-k cosine search, optionally filtered by ``where``. Distances are ``1 - cosine`` like Chroma's cosine space."""
+
+        results = {"ids": [], "distances": [], "metadatas": [], "documents": []}
+        if not self.count():
+            for q in query_embeddings:
+                for key in results:
+                    results[key].append([])
+            return results
+
+        for top, scores in self.search(normalize(query_embeddings), n_results, self.filter_mask(where)):
+            ids = [self.ids[i] for i in top]
+            documents = self.chunk_store.contents(ids) if self.chunk_store is not None else self.documents
+
+            results["ids"].append(ids)
+            results["distances"].append((1.0 - scores).tolist())
+            results["metadatas"].append([self.metadatas[i] for i in top])
+            results["documents"].append([documents.get(chunk_id, "") for chunk_id in ids])
+
+        return results
+
+    def get(self, ids: List[str], include: Optional[List[str]] = None, where: Optional[Dict] = None,
+            **kwargs) -> Dict[str, list]:
+        """Live rows of the given chunk IDs matching ``where``, in Chroma's ``get`` layout; others are left out."""
+
+        if include is None:
+            include = ["metadatas", "documents"]
+
+        rows = np.array([self.row_of[chunk_id] for chunk_id in ids if chunk_id in self.row_of], dtype=np.int64)
+        rows = rows[self.filter_mask(where, rows)]
+        found = [self.ids[i] for i in rows]
+
+        results = {"ids": found}
+        if "embeddings" in include:
+            results["embeddings"] = np.asarray(self.embeddings[rows], dtype=np.float32)
+        if "metadatas" in include:
+            results["metadatas"] = [self.metadatas[i] for i in rows]
+        if "documents" in include:
+            documents = self.chunk_store.contents(found) if self.chunk_store is not None else self.documents
+            results["documents"] = [documents.get(chunk_id, "") for chunk_id in found]
+
+        return results
+
+
+# Helpers
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    x = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores, best first, without a full sort."""
+
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < scores.shape[0]:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(scores.shape[0])
+
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def inverse_norms(embeddings: np.ndarray) -> np.ndarray:
+    inv = np.empty(embeddings.shape[0], dtype=np.float32)
+
+    for start in range(0, embeddings.shape[0], BLOCK_ROWS):
+        block = np.asarray(embeddings[start:start + BLOCK_ROWS], dtype=np.float32)
+        inv[start:start + BLOCK_ROWS] = 1.0 / np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+
+    return inv
+
+
+def live_rows(ids: List[str]) -> np.ndarray:
+    """Mask of the rows holding the last occurrence of their ID."""
+
+    last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+    live = np.zeros(len(ids), dtype=bool)
+    live[list(last.values())] = True
+    return live
+
+
+def manifest_live_rows(path: str, n: int) -> np.ndarray:
+    """Mask of the rows listed in the ETL manifest's ``embeddings`` table (read-only)."""
+
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = np.fromiter((row for (row,) in db.execute("SELECT row FROM embeddings")), dtype=np.int64)
+    finally:
+        db.close()
+
+    live = np.zeros(n, dtype=bool)
+    live[rows[rows < n]] = True
+    return live
+
+
+def value_bitmaps(values: List[str]) -> Dict[str, np.ndarray]:
+    """Row mask of each distinct value."""
+
+    codes, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    return {value: inverse == i for i, value in enumerate(codes)}
+
+
+def load_doc_metadata(path: str) -> Dict[str, Dict]:
+    """doc_id -> source / court / date / date_end (YYYYMMDD) from the ETL's ``doc_metadata.csv``."""
+
+    if not os.path.exists(path):
+        return {}
+
+    metadata = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            first = int(row["date"] or 0)
+            # Files written before date_end existed only hold exact dates
+            metadata[row["doc_id"]] = {"source": row["source"], "court": row["court"], "date": first,
+                                       "date_end": int(row.get("date_end") or first)}
+    return metadata
+
+
+def load_metadata(path: str) -> List[Dict[str, str]]:
+    if not os.path.exists(path):
+        return []
+
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            {
+                "doc_id": row["doc_id"],
+                "doc_processed_path": row["doc_processed_path"],
+                "chunk_id": row["chunk_id"],
+                "chunk_hash": row["chunk_hash"],
+                "timestamp": row["timestamp"],
+            }
+            for row in csv.DictReader(f)
+        ]
+
+
+def load_documents(path: str, wanted_ids: set) -> Dict[str, str]:
+    """Chunk content for the given IDs, streamed from ``chunks.jsonl``."""
+
+    documents = {}
+    if not os.path.exists(path):
+        return documents
+
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+
+            chunk = json.loads(line)
+            if chunk["chunk_id"] in wanted_ids:
+                documents[chunk["chunk_id"]] = chunk["content"]
+
+    return documents
@@ -0,0 +1,142 @@
+import numpy as np
+
+from api.db.ann_index import exact_scores
+from api.db.local_store import normalize, top_k_indices
+
+
+# Rows encoded / scored at a time
+BLOCK_ROWS = 65536
+
+KINDS = ("int8", "binary")
+
+# Set bits of every byte value, for numpy versions without np.bitwise_count
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return POPCOUNT[x]
+
+
+class QuantizedIndex:
+    """Compressed copy of the embedding matrix for a coarse first pass.
+
+    ``int8`` scales each dimension of the L2-normalized vectors into
+    ``[-127, 127]`` (4x smaller than float32) and scores by dot product with
+    the float query. ``binary`` keeps one sign bit per dimension (32x smaller)
+    and scores by Hamming distance, turned into a cosine estimate. The best
+    ``k * rerank_factor`` rows are then rescored exactly against the float
+    vectors (memory-mapped), so only the codes have to stay in RAM. Row ids
+    are insertion order, which matches the row order of the embedding store.
+    """
+
+    def __init__(self, dim: int, kind: str = "int8"):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown quantization: {kind}")
+
+        self.dim = dim
+        self.kind = kind
+
+        # int8: per-dimension step; binary codes need no training
+        self.scale = np.ones(dim, dtype=np.float32)
+        width = dim if kind == "int8" else (dim + 7) // 8
+        self.codes = np.empty((0, width), dtype=np.int8 if kind == "int8" else np.uint8)
+
+    @property
+    def ntotal(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scale.nbytes
+
+    # Build
+
+    def train(self, vectors: np.ndarray):
+        """Fit the int8 scale to the largest magnitude of each dimension in a sample."""
+
+        if self.kind == "int8":
+            self.scale = np.maximum(np.abs(normalize(vectors)).max(axis=0), 1e-6).astype(np.float32) / 127.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        x = normalize(vectors)
+
+        if self.kind == "int8":
+            return np.clip(np.rint(x / self.scale), -127, 127).astype(np.int8)
+        return np.packbits(x > 0, axis=1)
+
+    def add(self, vectors: np.ndarray):
+        """Append codes of new rows (e.g. a lazy slice of the embedding store), block by block."""
+
+        blocks = [self.codes]
+        for start in range(0, vectors.shape[0], BLOCK_ROWS):
+            blocks.append(self.encode(np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)))
+        self.codes = np.concatenate(blocks)
+
+    # Search
+
+    def coarse_scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate cosine of every row against a unit query."""
+
+        out = np.empty(self.ntotal, dtype=np.float32)
+
+        if self.kind == "int8":
+            q = (query * self.scale).astype(np.float32)
+            for start in range(0, self.ntotal, BLOCK_ROWS):
+                out[start:start + BLOCK_ROWS] = self.codes[start:start + BLOCK_ROWS].astype(np.float32) @ q
+            return out
+
+        q_bits = np.packbits(query > 0)
+        for start in range(0, self.ntotal, BLOCK_ROWS):
+            hamming = popcount(self.codes[start:start + BLOCK_ROWS] ^ q_bits).sum(axis=1, dtype=np.int32)
+            # Sign-bit agreement estimates the angle: cos(pi * hamming / dim)
+            out[start:start + BLOCK_ROWS] = np.cos(np.pi * hamming / self.dim)
+        return out
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = None,
+               rerank_vectors: np.ndarray = None, rerank_factor: int = 4, allowed: np.ndarray = None):
+        """Approximate top-k by cosine similarity, same interface as ``IVFPQIndex.search``.
+
+        ``nprobe`` is ignored (every code is scanned). Rows outside ``allowed``
+        are excluded before the shortlist. Returns ``(ids, scores)`` lists, one
+        array per query, best first.
+        """
+
+        shortlist = k * rerank_factor if rerank_vectors is not None else k
+        all_ids, all_scores = [], []
+
+        for qi in normalize(queries):
+            scores = self.coarse_scores(qi)
+            if allowed is not None:
+                scores[~allowed[:self.ntotal]] = -np.inf
+
+            ids = top_k_indices(scores, shortlist)
+            ids = ids[np.isfinite(scores[ids])]
+            cand_scores = scores[ids]
+
+            if rerank_vectors is not None and ids.size:
+                cand_scores = exact_scores(rerank_vectors, ids, qi)
+                top = top_k_indices(cand_scores, k)
+                ids, cand_scores = ids[top], cand_scores[top]
+
+            all_ids.append(ids.astype(np.int64))
+            all_scores.append(cand_scores.astype(np.float32))
+
+        return all_ids, all_scores
+
+    # Persistence
+
+    def save(self, path: str):
+        np.savez(path, config=np.array([self.dim, KINDS.index(self.kind)], dtype=np.int64), scale=self.scale, codes=self.codes)
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex":
+        data = np.load(path)
+        dim, kind = (int(v) for v in data["config"])
+
+        index = cls(dim, KINDS[kind])
+        index.scale = data["scale"]
+        index.codes = data["codes"]
+
+        return index
@@ -1,9 +1,9 @@
 from fastapi import FastAPI
 from api.routes import query, root, health
 
-from api.models.emb_loader import load_emb_model
+from api.models.emb_loader import load_emb_model, get_embedding_batcher
 from api.models.llm_loader import load_llm_agent
-from api.db.connection_loader import get_chroma_collection
+from api.db.connection_loader import get_vector_store
 
 from contextlib import asynccontextmanager
 
@@ -13,13 +13,14 @@ async def startup_event(app: FastAPI):
 
     # Ensure embedding model is loaded at startup
     load_emb_model()
+    get_embedding_batcher()
 
     #
     load_llm_agent()
 
 
-    # Connection to the VectorDB
-    get_chroma_collection()
+    # Connection to the VectorDB (or load the local index)
+    get_vector_store()
 
     yield
 
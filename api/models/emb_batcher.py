@@ -0,0 +1,105 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """Dynamic micro-batching of single-text encode calls.
+
+    Callers submit one text and get a ``Future`` (``aencode`` awaits it from the
+    event loop, so waiting callers hold no thread). A background thread takes the
+    first pending request and everything already queued behind it. A request
+    that finds the worker idle and the queue empty is encoded right away;
+    requests that queued up during the previous batch keep collecting for up to
+    ``max_wait_ms`` or ``max_batch_size`` items. ``encode_fn`` runs once on the
+    whole batch and every future is resolved with its own row.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.batches = 0
+        self.items = 0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    async def aencode(self, text: str) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first, wait: bool) -> list:
+        """``first`` plus the queued requests; with ``wait``, keep collecting until the deadline."""
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if wait and remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            # Requests left waiting by the previous batch mean concurrent traffic: worth waiting for more
+            backlog = not self._queue.empty()
+
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = self._collect(first, wait=backlog)
+            texts = [text for text, _ in batch]
+
+            try:
+                vectors = self.encode_fn(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
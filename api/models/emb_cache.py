@@ -0,0 +1,121 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: NFC, case-folded, whitespace collapsed."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip().casefold()
+
+
+class EmbeddingCache:
+    """Bounded LRU + TTL cache of query embeddings, keyed by model name and normalized text.
+
+    An optional SQLite file (``disk_path``) acts as a second tier that survives
+    restarts: memory misses fall through to it and hits are promoted back.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 86400, disk_path: str = "",
+                 clock: Callable[[], float] = time.time):
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if disk_path:
+            self._db = self._open_disk(disk_path)
+
+    def _open_disk(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT, query TEXT, created REAL, vector BLOB, PRIMARY KEY (model, query))"
+        )
+        db.execute("DELETE FROM embeddings WHERE created < ?", (self.clock() - self.ttl_seconds,))
+        db.commit()
+        return db
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        key = (model_name, normalize_query(text))
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] + self.ttl_seconds > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, vector FROM embeddings WHERE model = ? AND query = ?", key
+                ).fetchone()
+
+                if row is not None and row[0] + self.ttl_seconds > now:
+                    vector = np.frombuffer(row[1], dtype=np.float32)
+                    self._insert(key, row[0], vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model_name: str, text: str, embedding: np.ndarray):
+        key = (model_name, normalize_query(text))
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        vector.flags.writeable = False
+        now = self.clock()
+
+        with self._lock:
+            self._insert(key, now, vector)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, query, created, vector) VALUES (?, ?, ?, ?)",
+                    (key[0], key[1], now, vector.tobytes()),
+                )
+                self._db.commit()
+
+    def _insert(self, key: tuple, created: float, vector: np.ndarray):
+        self._entries[key] = (created, vector)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
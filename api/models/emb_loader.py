@@ -2,8 +2,67 @@ from functools import lru_cache
 from api.core.config import settings
 from sentence_transformers import SentenceTransformer
 
+from api.models.emb_cache import EmbeddingCache
+from api.models.emb_batcher import EmbeddingBatcher
+from api.utils.concurrency import run_blocking
+
 # Cache the loaded model to avoid reloading on every request
 @lru_cache
 def load_emb_model():
     model = SentenceTransformer(settings.MODEL_NAME, device=settings.DEVICE)
-    return model
\ No newline at end of file
+    return model
+
+
+@lru_cache
+def get_embedding_cache():
+    cache = EmbeddingCache(
+        max_size=settings.EMB_CACHE_SIZE,
+        ttl_seconds=settings.EMB_CACHE_TTL_SECONDS,
+        disk_path=settings.EMB_CACHE_DISK_PATH,
+    )
+    return cache
+
+
+@lru_cache
+def get_embedding_batcher():
+    model = load_emb_model()
+
+    batcher = EmbeddingBatcher(
+        lambda texts: model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True),
+        max_batch_size=settings.EMB_BATCH_MAX_SIZE,
+        max_wait_ms=settings.EMB_BATCH_MAX_WAIT_MS,
+    )
+    return batcher
+
+
+def encode_query(query: str):
+    """Normalized query embedding, served from the embedding cache when possible."""
+
+    cache = get_embedding_cache()
+
+    embedding = cache.get(settings.MODEL_NAME, query)
+    if embedding is None:
+        if settings.EMB_BATCHING:
+            # Joins concurrent requests into one forward pass
+            embedding = get_embedding_batcher().encode(query)
+        else:
+            embedding = load_emb_model().encode(query, normalize_embeddings=True)
+        cache.put(settings.MODEL_NAME, query, embedding)
+
+    return embedding
+
+
+async def aencode_query(query: str):
+    """``encode_query`` for the event loop: a batched request is awaited without holding a pool thread."""
+
+    cache = get_embedding_cache()
+
+    embedding = cache.get(settings.MODEL_NAME, query)
+    if embedding is None:
+        if settings.EMB_BATCHING:
+            embedding = await get_embedding_batcher().aencode(query)
+        else:
+            embedding = await run_blocking(load_emb_model().encode, query, normalize_embeddings=True)
+        cache.put(settings.MODEL_NAME, query, embedding)
+
+    return embedding
@@ -1,7 +1,18 @@
 from fastapi import APIRouter
 
+from api.models.emb_loader import get_embedding_cache, get_embedding_batcher
+from api.utils.answer_cache import get_answer_cache
+
 router = APIRouter(prefix="/health", tags=["Health"])
 
 @router.get("/")
 async def root():
     return {"status": "okay running"}
+
+@router.get("/cache")
+async def cache_stats():
+    return {
+        "embedding_cache": get_embedding_cache().stats(),
+        "embedding_batcher": get_embedding_batcher().stats(),
+        "answer_cache": get_answer_cache().stats(),
+    }
@@ -1,33 +1,194 @@
+from typing import Dict, List
 from fastapi import APIRouter, HTTPException
-from api.schemas.query import QueryRequest, QueryResponse
+from fastapi.responses import StreamingResponse
+from api.schemas.query import QueryRequest, QueryResponse, RetrievedChunk
 
+from api.core.config import settings
+from api.models.emb_loader import aencode_query
 from api.models.llm_loader import load_llm_agent
+from api.utils.answer_cache import get_answer_cache
+from api.utils.concurrency import get_request_limiter, run_blocking
+from api.utils.retrieval import build_where, search_chunks
+from api.utils.streaming import sse_event, message_text, tool_chunk_ids, tool_ranking
 
 
 router = APIRouter(prefix="/query", tags=["Query"])
 
+
+def to_retrieved_chunks(ranking: List[Dict], include_snippets: bool) -> List[RetrievedChunk]:
+    """Ranking dicts from the retrieval tool as response records, de-duplicated by chunk ID."""
+
+    chunks = {}
+    for r in ranking:
+        if r["chunk_id"] in chunks:
+            continue
+
+        chunks[r["chunk_id"]] = RetrievedChunk(
+            chunk_id=r["chunk_id"],
+            distance=r["distance"],
+            metadata=r.get("metadata") or {},
+            snippet=(r.get("content") or "")[:settings.SNIPPET_CHARS] if include_snippets else None,
+        )
+
+    return list(chunks.values())
+
+
+def filters_where(request: QueryRequest):
+    """Vector store filter of the request's ``filters``, or None."""
+
+    if request.filters is None:
+        return None
+    return build_where(**request.filters.model_dump())
+
+
+def request_config(request: QueryRequest) -> Dict:
+    """Agent run config carrying the request's top_k and filters to the retrieval tool.
+
+    Passed with the run rather than set in context variables, which an async generator
+    closed from another context (client disconnect) could not reset.
+    """
+
+    return {"configurable": {"top_k": request.top_k, "where": filters_where(request)}}
+
+
+def without_snippets(chunks: List[RetrievedChunk]) -> List[RetrievedChunk]:
+    return [c.model_copy(update={"snippet": None}) for c in chunks]
+
+
+async def cached_answer(request: QueryRequest):
+    """Embedding of the query and, if a close enough paraphrase was answered before, the cached entry."""
+
+    # Answers are cached without their filters, so filtered requests bypass the cache
+    if not settings.ANSWER_CACHE_ENABLED or filters_where(request):
+        return None, None
+
+    query_embedding = await aencode_query(request.query)
+    return query_embedding, get_answer_cache().get(query_embedding, request.top_k)
+
+
 @router.post("", response_model=QueryResponse)
 async def query_endpoint(request: QueryRequest):
 
+    # Retrieval only: no LLM round-trip
+    if request.retrieval_only:
+        async with get_request_limiter():
+            query_embedding = await aencode_query(request.query)
+            ranking = await run_blocking(search_chunks, request.query, request.top_k or 5, filters_where(request), query_embedding)
+
+        return QueryResponse(
+            response="",
+            retrieved_chunks=to_retrieved_chunks(ranking, request.include_snippets),
+        )
 
     agent = load_llm_agent()
 
-    msgs = []
+    async with get_request_limiter():
+
+        # Semantic answer cache: paraphrases of an answered question skip retrieval and the LLM
+        query_embedding, cached = await cached_answer(request)
+        if cached is not None:
+            chunks = [RetrievedChunk(**c) for c in cached["chunks"]]
+            return QueryResponse(
+                response=cached["response"],
+                retrieved_chunks=chunks if request.include_snippets else without_snippets(chunks),
+            )
 
-    for event in agent.stream(
-        {"messages": [{"role": "user", "content": request.query}]},
-        stream_mode="values",
-    ):
-        msgs.append(event)
-        event["messages"][-1].pretty_print()
+        # Only the latest state is needed, it already holds the final answer and the tool messages
+        last_event = None
 
+        # Async streaming keeps the event loop free while Gemini and the tools run
+        async for event in agent.astream(
+            {"messages": [{"role": "user", "content": request.query}]},
+            request_config(request),
+            stream_mode="values",
+        ):
+            last_event = event
+            event["messages"][-1].pretty_print()
 
-    # Get the response to the user
-    # print(f"------------- MSG FINAL: ---------------\n{msgs[-1]['messages'][-1].content}")
+    # Chunks the agent actually retrieved, taken from its tool messages
+    ranking = []
+    for message in last_event["messages"]:
+        if message.type == "tool":
+            ranking.extend(tool_ranking(message))
+
+    answer = message_text(last_event["messages"][-1].content)
+    chunks = to_retrieved_chunks(ranking, include_snippets=True)
+
+    if query_embedding is not None:
+        get_answer_cache().put(query_embedding, request.top_k, answer, [c.model_dump() for c in chunks])
 
     response = QueryResponse(
-        response=msgs[-1]["messages"][-1].content,
-        retrieved_chunks=[],
+        response=answer,
+        retrieved_chunks=chunks if request.include_snippets else without_snippets(chunks),
     )
 
-    return response
\ No newline at end of file
+    return response
+
+
+async def stream_agent_events(request: QueryRequest):
+    """SSE events for tool calls, retrieved chunk IDs and answer tokens, as they happen."""
+
+    agent = load_llm_agent()
+
+    async with get_request_limiter():
+
+        query_embedding, cached = await cached_answer(request)
+        if cached is not None:
+            yield sse_event("retrieval", {"tool": "answer_cache", "chunk_ids": [c["chunk_id"] for c in cached["chunks"]]})
+            yield sse_event("token", {"text": cached["response"]})
+            yield sse_event("done", {"cached": True})
+            return
+
+        # Kept only to fill the answer cache: the final answer and the retrieved ranking
+        answer = ""
+        ranking = []
+
+        try:
+            async for mode, chunk in agent.astream(
+                {"messages": [{"role": "user", "content": request.query}]},
+                request_config(request),
+                stream_mode=["messages", "updates"],
+            ):
+
+                if mode == "messages":
+                    # LLM tokens
+                    message, _ = chunk
+                    if message.type == "AIMessageChunk":
+                        text = message_text(message.content)
+                        if text:
+                            yield sse_event("token", {"text": text})
+                    continue
+
+                # Node updates: tool calls decided by the model, tool results
+                for update in chunk.values():
+                    for message in (update or {}).get("messages", []):
+
+                        if message.type == "ai":
+                            for call in message.tool_calls:
+                                yield sse_event("tool_call", {"name": call["name"], "args": call["args"]})
+
+                            if not message.tool_calls:
+                                answer = message_text(message.content)
+
+                        elif message.type == "tool":
+                            ranking.extend(tool_ranking(message))
+                            yield sse_event("retrieval", {"tool": message.name, "chunk_ids": tool_chunk_ids(message)})
+
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+            return
+
+    if query_embedding is not None and answer:
+        chunks = to_retrieved_chunks(ranking, include_snippets=True)
+        get_answer_cache().put(query_embedding, request.top_k, answer, [c.model_dump() for c in chunks])
+
+    yield sse_event("done", {"cached": False})
+
+
+@router.post("/stream")
+async def query_stream_endpoint(request: QueryRequest):
+    return StreamingResponse(
+        stream_agent_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,10 +1,26 @@
+from datetime import date
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+class RetrievalFilters(BaseModel):
+    source: Optional[List[str]] = Field(None, description="Only chunks from these sources (DGSI, Tribunal Constitucional, Parlamento.pt).")
+    court: Optional[List[str]] = Field(None, description="Only chunks from these courts (STJ, STA, TC, TRL, TRP, TRC, TRG, TRE, TCAS, TCAN, TCONF).")
+    date_from: Optional[date] = Field(None, description="Only documents dated on or after this day. Date filters only match documents with a known date (a date or case year in the title, as for most Tribunal Constitucional rulings); DGSI rulings are usually undated and left out. A document known only by its case year matches when that year overlaps the range.")
+    date_to: Optional[date] = Field(None, description="Only documents dated on or before this day. Undated documents are left out, as for date_from.")
 
 class QueryRequest(BaseModel):
     query: str = Field(..., description="The input query string.")
-    top_k: Optional[int] = Field(5, description="Number of top similar chunks to retrieve")
-    
+    top_k: Optional[int] = Field(5, ge=1, le=100, description="Number of top similar chunks to retrieve")
+    retrieval_only: bool = Field(False, description="Only retrieve chunks, skip the LLM answer.")
+    include_snippets: bool = Field(True, description="Include a content snippet for each retrieved chunk.")
+    filters: Optional[RetrievalFilters] = Field(None, description="Restrict retrieval to a source, court or date range.")
+
+class RetrievedChunk(BaseModel):
+    chunk_id: str = Field(..., description="ID of the chunk.")
+    distance: float = Field(..., description="Cosine distance to the query (lower is closer).")
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="Chunk metadata (document ID, path, hash...).")
+    snippet: Optional[str] = Field(None, description="Start of the chunk content.")
+
 class QueryResponse(BaseModel):
     response: str = Field(..., description="The response generated by the LLM.")
-    retrieved_chunks: list = Field(..., description="List of retrieved chunks relevant to the query.")
\ No newline at end of file
+    retrieved_chunks: List[RetrievedChunk] = Field(..., description="List of retrieved chunks relevant to the query.")
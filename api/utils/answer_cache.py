@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from api.core.config import settings
+
+
+class DocVersions:
+    """Per-document versions written by the ETL embedding stage (and ``scripts/build_vector_db.py``).
+
+    The file maps ``doc_id`` to the time its chunks last changed in the vector
+    store. It is re-read only when its mtime changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = None
+        self._versions: Dict[str, str] = {}
+
+    def get(self, doc_ids: Iterable[str]) -> Dict[str, str]:
+        self._refresh()
+        return {doc_id: self._versions.get(doc_id, "") for doc_id in doc_ids}
+
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._mtime, self._versions = None, {}
+            return
+
+        if mtime != self._mtime:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._versions = json.load(f)
+            self._mtime = mtime
+
+
+class SemanticAnswerCache:
+    """Answers of the RAG pipeline keyed by query embedding.
+
+    A lookup returns the most similar cached answer whose cosine similarity is
+    at least ``threshold``, as long as it has not expired and the documents its
+    chunks came from have the same version as when it was cached. Embeddings
+    live in one preallocated matrix so a lookup is a single mat-vec product;
+    the least recently used slot is reused when the cache is full.
+    """
+
+    def __init__(self, max_size: int = 1024, threshold: float = 0.95, ttl_seconds: float = 3600,
+                 doc_versions: Optional[Callable[[Iterable[str]], Dict[str, str]]] = None,
+                 clock: Callable[[], float] = time.time):
+
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.doc_versions = doc_versions or (lambda doc_ids: {doc_id: "" for doc_id in doc_ids})
+        self.clock = clock
+
+        self._vectors = None
+        self._valid = np.zeros(max_size, dtype=bool)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_size
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, embedding, top_k: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._vectors is None or not self._valid.any():
+                self.misses += 1
+                return None
+
+            q = _unit(embedding)
+            scores = np.where(self._valid, self._vectors @ q, -np.inf)
+
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold:
+                    break
+
+                entry = self._entries[slot]
+                if entry["top_k"] != top_k:
+                    continue
+
+                if not self._is_fresh(entry):
+                    self._drop(slot)
+                    self.invalidations += 1
+                    continue
+
+                self._lru.move_to_end(slot)
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, embedding, top_k: int, response: str, chunks: List[Dict[str, Any]]):
+        if self.max_size <= 0:
+            return
+
+        q = _unit(embedding)
+        doc_ids = {c["metadata"]["doc_id"] for c in chunks if c.get("metadata", {}).get("doc_id")}
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, q.shape[0]), dtype=np.float32)
+
+            free = np.flatnonzero(~self._valid)
+            slot = int(free[0]) if free.size else next(iter(self._lru))
+
+            self._vectors[slot] = q
+            self._valid[slot] = True
+            self._entries[slot] = {
+                "top_k": top_k,
+                "response": response,
+                "chunks": chunks,
+                "created": self.clock(),
+                "doc_ids": doc_ids,
+                "doc_versions": self.doc_versions(doc_ids),
+            }
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def invalidate_docs(self, doc_ids: Iterable[str]):
+        doc_ids = set(doc_ids)
+
+        with self._lock:
+            for slot in np.flatnonzero(self._valid):
+                if doc_ids & self._entries[slot]["doc_ids"]:
+                    self._drop(slot)
+                    self.invalidations += 1
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        if entry["created"] + self.ttl_seconds <= self.clock():
+            return False
+        return self.doc_versions(entry["doc_ids"]) == entry["doc_versions"]
+
+    def _drop(self, slot: int):
+        self._valid[slot] = False
+        self._entries[slot] = None
+        self._lru.pop(slot, None)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": int(self._valid.sum()),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _unit(embedding) -> np.ndarray:
+    q = np.asarray(embedding, dtype=np.float32).ravel()
+    return q / max(float(np.linalg.norm(q)), 1e-12)
+
+
+@lru_cache
+def get_answer_cache():
+    cache = SemanticAnswerCache(
+        max_size=settings.ANSWER_CACHE_SIZE,
+        threshold=settings.ANSWER_CACHE_THRESHOLD,
+        ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+        doc_versions=DocVersions(settings.DOC_VERSIONS_PATH).get,
+    )
+    return cache
@@ -0,0 +1,23 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+from api.core.config import settings
+
+
+# Bounded pool for blocking work (embedding, vector store calls) so it never runs on the event loop
+@lru_cache
+def get_executor():
+    executor = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_THREADS, thread_name_prefix="retrieval")
+    return executor
+
+
+# Caps the number of /query requests a worker processes at once; extra requests wait their turn
+@lru_cache
+def get_request_limiter():
+    return asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(func, *args, **kwargs))
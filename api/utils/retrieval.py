@@ -1,27 +1,103 @@
-from typing import List, Dict, Optional
-from api.models.emb_loader import load_emb_model
-from api.db.connection_loader import get_chroma_collection
+import re
+import json
+import calendar
+from datetime import date
+from typing import List, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from api.core.config import settings
+from api.models.emb_loader import aencode_query, encode_query
+from api.db.bm25_index import reciprocal_rank_fusion
+from api.db.connection_loader import get_bm25_index, get_vector_store
+from api.utils.concurrency import run_blocking
 
 from langchain.tools import tool
+from langchain_core.runnables import RunnableConfig
+
+
+def as_list(value: Union[None, str, List[str]]) -> List[str]:
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+# "2024", "2024-03": partial dates the LLM may pass as a bound
+PARTIAL_DATE = re.compile(r"(\d{4})(?:-(\d{1,2}))?")
+
+
+def date_bound(value: Union[str, date], last: bool = False) -> int:
+    """YYYYMMDD of a filter bound; a year or year-month is expanded to its first day, or its last one with ``last``.
+
+    Raises ValueError for anything other than an ISO date, a year or a year-month.
+    """
+
+    if isinstance(value, date):
+        return int(value.strftime("%Y%m%d"))
+
+    value = value.strip()
+    if m := PARTIAL_DATE.fullmatch(value):
+        year = int(m[1])
+        month = int(m[2]) if m[2] else (12 if last else 1)
+        if not 1 <= month <= 12:
+            raise ValueError(f"invalid month in {value!r}")
+        day = calendar.monthrange(year, month)[1] if last else 1
+        return year * 10000 + month * 100 + day
+
+    try:
+        return int(date.fromisoformat(value).strftime("%Y%m%d"))
+    except ValueError:
+        raise ValueError(f"{value!r} is not a date, use YYYY-MM-DD, YYYY-MM or YYYY") from None
+
+
+def build_where(source=None, court=None, date_from: Union[None, str, date] = None,
+                date_to: Union[None, str, date] = None) -> Optional[Dict]:
+    """Vector store ``where`` filter (Chroma syntax, also understood by the local store); None without filters.
+
+    Raises ValueError for a date bound ``date_bound`` cannot read.
+    """
+
+    clauses = []
+    if as_list(source):
+        clauses.append({"source": {"$in": as_list(source)}})
+    if as_list(court):
+        clauses.append({"court": {"$in": [c.upper() for c in as_list(court)]}})
+
+    # A document date is stored as the first / last day it can be (date / date_end, YYYYMMDD, 0 when
+    # unknown); a document matches when that span overlaps the requested one, undated documents never do
+    if date_from:
+        clauses.append({"date_end": {"$gte": date_bound(date_from)}})
+    elif date_to:
+        clauses.append({"date": {"$gte": 1}})
+    if date_to:
+        clauses.append({"date": {"$lte": date_bound(date_to, last=True)}})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
 
-@tool
-def retrieve_close_chunks(
-        query: str,
-        top_k: int = 5
-) -> List[Dict]:
-    """Retrieve information to help answer a query."""
-    
-    # 1. Embed the query with the embedding model
-    model = load_emb_model()
-    query_embedding = model.encode(query, normalize_embeddings=True).tolist()
 
-    # 2. Access the vector database collection
-    collection = get_chroma_collection()
+def search_chunks(query: str, top_k: int = 5, where: Optional[Dict] = None,
+                  query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+    """Embed the query and rank the closest chunks, fused with BM25 hits when hybrid search is on (blocking).
+
+    ``where`` (see ``build_where``) is applied inside the vector store, before the top-k. Async callers
+    pass the ``query_embedding`` from ``aencode_query`` so the pool thread only runs the search.
+    """
+
+    # 1. Embed the query with the embedding model (cached)
+    if query_embedding is None:
+        query_embedding = encode_query(query)
+
+    # 2. Access the vector database collection (Chroma or local index)
+    collection = get_vector_store()
+    bm25 = get_bm25_index()
 
     # 3. Launch the query (get closest chunks and their content)
     results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
+        query_embeddings=[query_embedding.tolist()],
+        n_results=top_k * settings.HYBRID_CANDIDATES if bm25 is not None else top_k,
+        where=where,
     )
 
     ids = results["ids"][0]
@@ -39,9 +115,83 @@ def retrieve_close_chunks(
             "content": documents[i]
         })
 
+    # 4b. Lexical hits (exact article / case numbers) merged by reciprocal rank fusion
+    if bm25 is not None:
+        lexical_ids, _ = bm25.search(query, top_k * settings.HYBRID_CANDIDATES)
+        ranking = fuse_rankings(collection, query_embedding, ranking, lexical_ids, top_k, where)
+
     # 5. Print
     print("[Retrieval] Ranking:")
     for r in ranking:
         print(f"  - ID {r['chunk_id']} | score={r['distance']:.4f} | content='{r['content'][:50]}...'")
 
-    return ranking
\ No newline at end of file
+    return ranking
+
+
+def fuse_rankings(collection, query_embedding, dense: List[Dict], lexical_ids: List[str], top_k: int,
+                  where: Optional[Dict] = None) -> List[Dict]:
+    """Top-k of the RRF merge of both rankings; lexical-only chunks are fetched and given their cosine distance."""
+
+    # The BM25 index has no metadata: its candidates are checked against the filter in the vector store
+    if where and lexical_ids:
+        allowed = set(collection.get(ids=lexical_ids, where=where, include=[])["ids"])
+        lexical_ids = [chunk_id for chunk_id in lexical_ids if chunk_id in allowed]
+
+    by_id = {r["chunk_id"]: r for r in dense}
+    fused = reciprocal_rank_fusion([list(by_id), lexical_ids], k=settings.RRF_K)
+
+    missing = [chunk_id for chunk_id in fused[:top_k] if chunk_id not in by_id]
+    if missing:
+        # Chunks dropped since the BM25 index was built are not returned
+        found = collection.get(ids=missing, include=["embeddings", "metadatas", "documents"])
+
+        if found["ids"]:
+            vectors = np.asarray(found["embeddings"], dtype=np.float32)
+            cosines = vectors @ query_embedding / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+
+        for i, chunk_id in enumerate(found["ids"]):
+            by_id[chunk_id] = {
+                "chunk_id": chunk_id,
+                "distance": float(1.0 - cosines[i]),
+                "metadata": found["metadatas"][i],
+                "content": found["documents"][i],
+            }
+
+    return [by_id[chunk_id] for chunk_id in fused if chunk_id in by_id][:top_k]
+
+
+@tool(response_format="content_and_artifact")
+async def retrieve_close_chunks(
+        query: str,
+        top_k: int = 5,
+        court: Optional[str] = None,
+        source: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        config: RunnableConfig = None,
+) -> Tuple[str, List[Dict]]:
+    """Retrieve information to help answer a query.
+
+    Optional filters: court (STJ, STA, TC, TRL, TRP, TRC, TRG, TRE, TCAS, TCAN, TCONF),
+    source (DGSI, Tribunal Constitucional, Parlamento.pt), date_from / date_to (YYYY-MM-DD,
+    or YYYY-MM / YYYY for a whole month or year). A date filter only matches documents with a
+    known date (a date or case year in the title, e.g. Tribunal Constitucional rulings); most
+    DGSI rulings have none and are left out. A document known only by its case year matches
+    any date range that overlaps that year.
+    """
+
+    # top_k and filters of the /query request (see ``request_config``) override the values chosen by the LLM
+    configurable = (config or {}).get("configurable", {})
+    top_k = configurable.get("top_k") or top_k
+    try:
+        where = configurable.get("where") or build_where(source, court, date_from, date_to)
+    except ValueError as e:
+        # Returned to the LLM so it can retry with a valid date
+        return f"Invalid date filter: {e}", []
+
+    # The embedding is awaited from the batcher; only the blocking search goes to the pool
+    query_embedding = await aencode_query(query)
+    ranking = await run_blocking(search_chunks, query, top_k, where, query_embedding)
+
+    # The LLM sees the JSON ranking, the route gets the structured ranking as the message artifact
+    return json.dumps(ranking, ensure_ascii=False), ranking
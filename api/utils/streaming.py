@@ -0,0 +1,45 @@
+import json
+from typing import Any, Dict, List
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def message_text(content) -> str:
+    """Plain text of a message content (string or list of content parts)."""
+
+    if isinstance(content, str):
+        return content
+
+    parts = []
+    for part in content or []:
+        if isinstance(part, str):
+            parts.append(part)
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+
+    return "".join(parts)
+
+
+def tool_ranking(message) -> List[Dict[str, Any]]:
+    """Ranking returned by a retrieval ToolMessage (its artifact, or the JSON content)."""
+
+    ranking = getattr(message, "artifact", None)
+
+    if ranking is None:
+        try:
+            ranking = json.loads(message_text(message.content))
+        except (TypeError, ValueError):
+            return []
+
+    if not isinstance(ranking, list):
+        return []
+
+    return [r for r in ranking if isinstance(r, dict) and "chunk_id" in r]
+
+
+def tool_chunk_ids(message) -> List[str]:
+    """Chunk IDs returned by a retrieval ToolMessage."""
+    return [r["chunk_id"] for r in tool_ranking(message)]
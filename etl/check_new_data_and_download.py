@@ -1,13 +1,24 @@
-import requests
 import hashlib
-import csv
 import os
 from datetime import datetime, timezone
 from bs4 import BeautifulSoup
 import argparse
-from urllib.parse import urlsplit, quote
+from urllib.parse import urlsplit, urljoin, quote
+
+from crawler import Crawler
+from crawl_state import CrawlState
+from manifest import Manifest, MANIFEST_PATH, append_ledger
 
 METADATA_PATH = os.path.join("data", "metadata_raw.csv")
+CRAWL_STATE_PATH = os.path.join("data", "crawl_state.sqlite")
+
+TC_BASE = "https://www.tribunalconstitucional.pt"
+CONSTITUICAO_URL = "https://www.parlamento.pt/Legislacao/Documents/constpt2005.pdf"
+
+RAW_FIELDS = ["id", "title", "source", "url", "timestamp", "file_path", "hash"]
+
+_crawler = None
+_manifest = None
 
 
 # Utils
@@ -20,24 +31,19 @@ def sha256_content(content):
     return hashlib.sha256(content).hexdigest()
 
 
-def load_existing_hashes():
-    if not os.path.exists(METADATA_PATH):
-        return set()
-    with open(METADATA_PATH, newline="", encoding="utf-8") as f:
-        return {row["hash"] for row in csv.DictReader(f)}
+def save_metadata(rows, manifest):
+    """Record a batch of new raw documents in the manifest and the CSV ledger."""
+    manifest.add("raw_docs", rows)
+    append_ledger(METADATA_PATH, RAW_FIELDS, rows)
 
 
-def save_metadata(row):
-    file_exists = os.path.exists(METADATA_PATH)
+def record_fetched(crawler, fetched):
+    """Store validators of ``(url, response, hash)`` only once their documents are in the manifest.
 
-    with open(METADATA_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=["id", "title", "source", "url", "timestamp", "file_path", "hash"]
-        )
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
+    Recording first would turn an interrupted run into permanent 304s for documents that never got a row.
+    """
+    for url, response, content_hash in fetched:
+        crawler.record(url, response, content_hash)
 
 
 def save_file(file_path, content):
@@ -46,17 +52,36 @@ def save_file(file_path, content):
         f.write(content)
 
 
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        _manifest = Manifest(MANIFEST_PATH)
+    return _manifest
+
+
+def get_crawler():
+    # Shared so every source reuses the same connection pool
+    global _crawler
+    if _crawler is None:
+        _crawler = Crawler(state=CrawlState(CRAWL_STATE_PATH))
+    return _crawler
+
+
 # Funcs
 
-def fetch_dgsi_latest(limit=40, url="https://www.dgsi.pt/jstj.nsf/"):
+def fetch_dgsi_latest(limit=40, url="https://www.dgsi.pt/jstj.nsf/", crawler=None, manifest=None):
     print("[DGSI] Checking latest rulings...")
-    html = requests.get(url).text
+    crawler = crawler or get_crawler()
+    manifest = manifest or get_manifest()
+
+    html = crawler.get(url).text
     soup = BeautifulSoup(html, "html.parser")
 
     links = soup.select("a")[:limit]
-    existing = load_existing_hashes()
-    new_docs = 0
+    new_rows = []
+    fetched = []
 
+    doc_links = []
     for link in links:
         href = link.get("href")
 
@@ -65,8 +90,22 @@ def fetch_dgsi_latest(limit=40, url="https://www.dgsi.pt/jstj.nsf/"):
         # if not href or "jstj" not in href:
         #     continue
 
-        doc_url = "https://www.dgsi.pt" + href
-        doc_html = requests.get(doc_url).text.encode("utf-8")
+        doc_links.append((link, href, urljoin(url, href)))
+
+    # Download every document concurrently (conditional GET), then process in listing order
+    responses = crawler.fetch_many([doc_url for _, _, doc_url in doc_links], conditional=True)
+    unchanged = 0
+
+    for (link, href, doc_url), (_, resp) in zip(doc_links, responses):
+        if isinstance(resp, Exception):
+            print(f"[DGSI] Error downloading {doc_url}: {resp}")
+            continue
+
+        if resp.status_code == 304:
+            unchanged += 1
+            continue
+
+        doc_html = resp.text.encode("utf-8")
 
         # uniqueness is more important
         file_name = hashlib.sha256(href.encode('utf-8')).hexdigest() + ".html"
@@ -74,11 +113,10 @@ def fetch_dgsi_latest(limit=40, url="https://www.dgsi.pt/jstj.nsf/"):
 
         h = sha256_content(doc_html)
 
-        if h not in existing:
+        if not manifest.has_raw_hash(h):
             save_file(file_path, doc_html)
    
-            new_docs += 1
-            save_metadata({
+            new_rows.append({
                 "id": file_name,
                 "title": link.text.strip(),
                 "source": "DGSI",
@@ -88,23 +126,38 @@ def fetch_dgsi_latest(limit=40, url="https://www.dgsi.pt/jstj.nsf/"):
                 "hash": h,
             })
 
-    return new_docs
+        fetched.append((doc_url, resp, h))
+
+    save_metadata(new_rows, manifest)
+    record_fetched(crawler, fetched)
+
+    print(f"[DGSI] New: {len(new_rows)}, not modified (304): {unchanged}")
+    return len(new_rows)
 
-def fetch_constituicao_latest():
+def fetch_constituicao_latest(url=CONSTITUICAO_URL, crawler=None, manifest=None):
 
-    url = "https://www.parlamento.pt/Legislacao/Documents/constpt2005.pdf"
     print("[Constituição] Downloading the Constitution document...")
-    response = requests.get(url)
+    crawler = crawler or get_crawler()
+    manifest = manifest or get_manifest()
+    response = crawler.get(url, conditional=True)
+    if response.status_code == 304:
+        print("[Constituição] Not modified since last crawl.")
+        return 0
+
+    if response.status_code != 200:
+        print(f"[Constituição] Failed to download (status {response.status_code})")
+        return 0
+
     file_name = "constituicao.pdf"
     file_path = os.path.join("data", "raw", "constituicao", file_name)
 
-    existing = load_existing_hashes()
     h = sha256_content(response.content)
+    new_docs = 0
 
-    if h not in existing:
+    if not manifest.has_raw_hash(h):
         save_file(file_path, response.content)
 
-        save_metadata({
+        save_metadata([{
             "id": file_name,
             "title": "Constituição da República Portuguesa",
             "source": "Parlamento.pt",
@@ -112,26 +165,27 @@ def fetch_constituicao_latest():
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "file_path": file_path,
             "hash": h,
-        })
+        }], manifest)
 
-        return 1
+        new_docs = 1
 
-    return 0
+    crawler.record(url, response, h)
+    return new_docs
 
 
-def fetch_tc_all(limit=40):
+def fetch_tc_all(limit=40, base=TC_BASE, crawler=None, manifest=None):
     print("[TC] Fetching ALL Acórdãos from Tribunal Constitucional...")
+    crawler = crawler or get_crawler()
+    manifest = manifest or get_manifest()
 
-    BASE = "https://www.tribunalconstitucional.pt"
-    LISTING_URL = BASE + "/tc/acordaos/?p="
+    LISTING_URL = base + "/tc/acordaos/?p="
 
-    existing_hashes = load_existing_hashes()
     new_docs = 0
     page = 1
 
     while new_docs < limit:
         url = LISTING_URL + str(page)
-        resp = requests.get(url)
+        resp = crawler.get(url)
         if resp.status_code != 200:
             break
 
@@ -145,6 +199,7 @@ def fetch_tc_all(limit=40):
         if not rows:
             break
 
+        acordaos = []
         for row in rows:
             cols = row.find_all("td")
 
@@ -159,21 +214,29 @@ def fetch_tc_all(limit=40):
                 continue
 
             href = link["href"].split("/")[-1]   # ex: 20240587.html
-            acordao_url = f"{BASE}/tc/acordaos/{href}"
+            acordaos.append((acordao_label, f"{base}/tc/acordaos/{href}"))
+
+        # Download the full HTML of every acórdão on the page concurrently
+        responses = crawler.fetch_many([acordao_url for _, acordao_url in acordaos], conditional=True)
 
-            # Download full HTML
-            try:
-                acordao_html = requests.get(acordao_url).content
-            except Exception:
+        new_rows = []
+        fetched = []
+        for (acordao_label, acordao_url), (_, acordao_resp) in zip(acordaos, responses):
+            if isinstance(acordao_resp, Exception):
                 continue
 
+            if acordao_resp.status_code == 304:
+                continue
+
+            acordao_html = acordao_resp.content
+
             # Unique filename
             file_name = hashlib.sha256(acordao_url.encode("utf-8")).hexdigest() + ".html"
             file_path = os.path.join("data", "raw", "tc", file_name)
 
 
             h = sha256_content(acordao_html)
-            if h not in existing_hashes:
+            if not manifest.has_raw_hash(h):
 
                 if os.path.exists(file_path):
                     # Avoid overwriting different files with same name
@@ -183,7 +246,7 @@ def fetch_tc_all(limit=40):
                 save_file(file_path, acordao_html)
 
                 new_docs += 1
-                save_metadata({
+                new_rows.append({
                     "id": file_name,
                     "title": acordao_label,
                     "source": "Tribunal Constitucional",
@@ -193,21 +256,28 @@ def fetch_tc_all(limit=40):
                     "hash": h,
                 })
 
+            fetched.append((acordao_url, acordao_resp, h))
+
+        # One manifest transaction per listing page, then its validators
+        save_metadata(new_rows, manifest)
+        record_fetched(crawler, fetched)
 
         page += 1
 
     print(f"[TC] Completed. Pages crawled: {page - 1}")
     return new_docs
 
-def fetch_tc_ebook_pdfs():
+def fetch_tc_ebook_pdfs(base=TC_BASE, crawler=None, manifest=None):
     print("[TC-PDF] Crawling PDFs...")
+    crawler = crawler or get_crawler()
+    manifest = manifest or get_manifest()
 
-    base_links = ["https://www.tribunalconstitucional.pt/tc/home.html", 
-             "https://www.tribunalconstitucional.pt/tc/ebook/"]
+    base_links = [base + "/tc/home.html", 
+             base + "/tc/ebook/"]
 
 
-    existing_hashes = load_existing_hashes()
-    new_docs = 0
+    new_rows = []
+    fetched = []
 
     save_dir = os.path.join("data", "raw", "tc_pdf")
     os.makedirs(save_dir, exist_ok=True)
@@ -219,7 +289,7 @@ def fetch_tc_ebook_pdfs():
 
         # Fetch HTML index
         try:
-            resp = requests.get(base_link, timeout=15)
+            resp = crawler.get(base_link, timeout=15)
             resp.raise_for_status()
         except Exception as e:
             print(f"[TC-PDF] Failed to fetch index: {e}")
@@ -246,10 +316,18 @@ def fetch_tc_ebook_pdfs():
     seen = set()
     pdf_links = [(u, t) for (u, t) in pdf_links if not (u in seen or seen.add(u))]
 
-    # Download and validate each PDF
-    for pdf_url, title in pdf_links:
+    # Download concurrently, then validate each PDF
+    responses = crawler.fetch_many([pdf_url for pdf_url, _ in pdf_links], timeout=20, conditional=True)
+
+    for (pdf_url, title), (_, r) in zip(pdf_links, responses):
         try:
-            r = requests.get(pdf_url, timeout=20)
+            if isinstance(r, Exception):
+                raise r
+
+            if r.status_code == 304:
+                print(f"[TC-PDF] Not modified: {pdf_url}")
+                continue
+
             if r.status_code != 200:
                 print(f"[TC-PDF] Skipping (status {r.status_code}): {pdf_url}")
                 continue
@@ -277,10 +355,10 @@ def fetch_tc_ebook_pdfs():
 
             h = sha256_content(r.content)
 
-            if h not in existing_hashes:
+            if not manifest.has_raw_hash(h):
                 save_file(file_path, r.content)
 
-                save_metadata({
+                new_rows.append({
                     "id": local_filename,
                     "title": title,
                     "source": "Tribunal Constitucional",
@@ -289,37 +367,43 @@ def fetch_tc_ebook_pdfs():
                     "file_path": file_path,
                     "hash": h,
                 })
-                new_docs += 1
                 print(f"[TC-PDF] Downloaded: {pdf_url}")
 
             else:
                 print(f"[TC-PDF] Already exists (hash match): {pdf_url}")
 
+            fetched.append((pdf_url, r, h))
+
         except Exception as e:
             print(f"[TC-PDF] Error downloading {pdf_url}: {e}")
 
-    print(f"[TC-PDF] Completed. New PDFs added: {new_docs}")
-    return new_docs
+    save_metadata(new_rows, manifest)
+    record_fetched(crawler, fetched)
+
+    print(f"[TC-PDF] Completed. New PDFs added: {len(new_rows)}")
+    return len(new_rows)
 
 
 
 def run_daily_download(limit=40):
     new_docs = 0
+    crawler = get_crawler()
 
-    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jstj.nsf/") # Supremo Tribunal de Justiça
-    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jsta.nsf/") # Supremo Tribunal Administrativo
-    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtrp.nsf/") # Tribunal da Relação do Porto
-    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtrl.nsf/") # Tribunal da Relação do Lisboa
-    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtrc.nsf/") # Tribunal da Relação do Coimbra
-    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtca.nsf/") # Tribunal Central Administrativo Sul
-    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtcn.nsf/") # Tribunal Central Administrativo Norte
+    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jstj.nsf/", crawler=crawler) # Supremo Tribunal de Justiça
+    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jsta.nsf/", crawler=crawler) # Supremo Tribunal Administrativo
+    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtrp.nsf/", crawler=crawler) # Tribunal da Relação do Porto
+    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtrl.nsf/", crawler=crawler) # Tribunal da Relação do Lisboa
+    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtrc.nsf/", crawler=crawler) # Tribunal da Relação do Coimbra
+    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtca.nsf/", crawler=crawler) # Tribunal Central Administrativo Sul
+    new_docs += fetch_dgsi_latest(limit=limit, url="https://www.dgsi.pt/jtcn.nsf/", crawler=crawler) # Tribunal Central Administrativo Norte
 
-    new_docs += fetch_constituicao_latest()
+    new_docs += fetch_constituicao_latest(crawler=crawler)
 
-    new_docs += fetch_tc_ebook_pdfs()
+    new_docs += fetch_tc_ebook_pdfs(crawler=crawler)
 
-    new_docs += fetch_tc_all(limit=limit)
+    new_docs += fetch_tc_all(limit=limit, crawler=crawler)
 
+    print(f"[CRAWL] Documents not modified since last crawl (304): {crawler.not_modified}")
 
     return new_docs
 
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+
+class CrawlState:
+    """Persistent per-URL record of the last successful fetch.
+
+    Stores the ETag, Last-Modified, content length and content hash of each
+    URL so the next crawl can send ``If-None-Match`` / ``If-Modified-Since``
+    and skip documents the server reports as unchanged (304).
+    """
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS crawl_state ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "content_length INTEGER, hash TEXT, fetched_at TEXT)"
+        )
+        self._db.commit()
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, content_length, hash, fetched_at FROM crawl_state WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip(["etag", "last_modified", "content_length", "hash", "fetched_at"], row))
+
+    def conditional_headers(self, url):
+        state = self.get(url)
+        headers = {}
+
+        if state is None:
+            return headers
+        if state["etag"]:
+            headers["If-None-Match"] = state["etag"]
+        if state["last_modified"]:
+            headers["If-Modified-Since"] = state["last_modified"]
+
+        return headers
+
+    def update(self, url, response, content_hash):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO crawl_state (url, etag, last_modified, content_length, hash, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    len(response.content),
+                    content_hash,
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
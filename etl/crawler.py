@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class Crawler:
+    """Thread-pooled HTTP fetcher shared by all the download functions.
+
+    One ``requests.Session`` keeps connections alive per host, a semaphore per
+    host caps concurrent requests to the same server, and every request has a
+    timeout and is retried with exponential backoff on connection errors and
+    on 429/5xx responses.
+
+    With a ``state`` (``crawl_state.CrawlState``), ``conditional=True`` requests
+    send the validators of the previous fetch; callers treat a 304 as
+    "unchanged" and call ``record`` once they have processed a 200.
+    """
+
+    def __init__(self, max_workers=16, per_host=4, timeout=20, retries=3, backoff=0.5,
+                 user_agent="lawsense-rag-crawler/1.0", state=None):
+
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.per_host = per_host
+        self.state = state
+        self.not_modified = 0
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawler")
+        self._host_limits = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._host_lock = threading.Lock()
+
+    def _host_limit(self, url):
+        with self._host_lock:
+            return self._host_limits[urlsplit(url).netloc]
+
+    def get(self, url, timeout=None, conditional=False, **kwargs):
+        """GET with retries. Returns the last response, raises the last error if no response was obtained."""
+
+        kwargs.setdefault("timeout", timeout or self.timeout)
+
+        if conditional and self.state is not None:
+            kwargs["headers"] = {**self.state.conditional_headers(url), **kwargs.get("headers", {})}
+
+        for attempt in range(self.retries + 1):
+            try:
+                with self._host_limit(url):
+                    response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            if response.status_code == 304:
+                self.not_modified += 1
+
+            if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                return response
+
+            retry_after = response.headers.get("Retry-After", "")
+            time.sleep(float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt)
+
+        return response
+
+    def record(self, url, response, content_hash):
+        """Remember the validators of a processed 200 response for the next conditional fetch."""
+        if self.state is not None and response.status_code == 200:
+            self.state.update(url, response, content_hash)
+
+    def fetch_many(self, urls, **kwargs):
+        """Fetch URLs concurrently. Returns ``(url, response or exception)`` pairs in input order."""
+
+        futures = [(url, self._executor.submit(self.get, url, **kwargs)) for url in urls]
+
+        results = []
+        for url, future in futures:
+            try:
+                results.append((url, future.result()))
+            except Exception as e:
+                results.append((url, e))
+
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+        if self.state is not None:
+            self.state.close()
@@ -0,0 +1,128 @@
+import os
+import re
+import csv
+import json
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+
+DOC_METADATA_PATH = os.path.join("data", "doc_metadata.csv")
+
+# doc_id -> time its vectors last changed; the API's answer cache drops answers citing an older version
+DOC_VERSIONS_PATH = os.path.join("data", "doc_versions.json")
+
+DOC_METADATA_FIELDS = ["doc_id", "source", "court", "date", "date_end"]
+
+# DGSI hosts one database per court: https://www.dgsi.pt/<database>.nsf/...
+DGSI_COURTS = {
+    "jstj": "STJ",
+    "jsta": "STA",
+    "jtrl": "TRL",
+    "jtrp": "TRP",
+    "jtrc": "TRC",
+    "jtrg": "TRG",
+    "jtre": "TRE",
+    "jtca": "TCAS",
+    "jtcn": "TCAN",
+    "jcon": "TCONF",
+}
+
+SOURCE_COURTS = {"Tribunal Constitucional": "TC"}
+
+# "02-12-2025", "02/12/2025", "2025-12-02"; case numbers "587/2024" give the year.
+# DGSI listing titles are process numbers ("1234/19.3T8LSB.L1.S1") and carry no decision date
+DMY_DATE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+CASE_YEAR = re.compile(r"\b\d+/((?:19|20)\d{2})\b")
+
+
+def court_of(row):
+    """Court code of a raw document ("" for legislation and unknown sources)."""
+
+    if row["source"] == "DGSI":
+        database = urlsplit(row.get("url") or "").path.strip("/").split(".nsf")[0]
+        return DGSI_COURTS.get(database, "")
+
+    return SOURCE_COURTS.get(row["source"], "")
+
+
+def date_of(row):
+    """First and last day the document date can be, as YYYYMMDD: a date in the title gives the same day twice,
+    a case-number year its 1 January and 31 December, and (0, 0) is unknown.
+
+    The download timestamp is never used: a date filter would then select by crawl day.
+    """
+
+    title = row.get("title") or ""
+
+    if m := ISO_DATE.search(title):
+        day = int(m[1] + m[2] + m[3])
+        return day, day
+
+    if m := DMY_DATE.search(title):
+        day = int(f"{m[3]}{int(m[2]):02d}{int(m[1]):02d}")
+        return day, day
+
+    if m := CASE_YEAR.search(title):
+        return int(m[1] + "0101"), int(m[1] + "1231")
+
+    return 0, 0
+
+
+def doc_filters(row):
+    first, last = date_of(row)
+    return {"doc_id": row["id"], "source": row["source"] or "", "court": court_of(row), "date": first, "date_end": last}
+
+
+def write_doc_metadata(manifest, path=DOC_METADATA_PATH):
+    """Filterable metadata of every raw document, rewritten from the manifest (read by the API and build_vector_db)."""
+
+    tmp_path = path + ".tmp"
+    n = 0
+
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=DOC_METADATA_FIELDS)
+        writer.writeheader()
+        for row in manifest.raw_docs():
+            writer.writerow(doc_filters(row))
+            n += 1
+
+    # Atomic replace, the API may be reading the file
+    os.replace(tmp_path, path)
+    return n
+
+
+def read_doc_metadata(path=DOC_METADATA_PATH):
+    """doc_id -> {"source", "court", "date", "date_end"}; empty when the file was never written."""
+
+    if not os.path.exists(path):
+        return {}
+
+    metadata = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            first = int(row["date"] or 0)
+            # Files written before date_end existed only hold exact dates
+            metadata[row["doc_id"]] = {"source": row["source"], "court": row["court"], "date": first,
+                                       "date_end": int(row.get("date_end") or first)}
+    return metadata
+
+
+
+def update_doc_versions(doc_ids, path=DOC_VERSIONS_PATH):
+    """Bump the version of every document whose vectors changed."""
+
+    versions = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            versions = json.load(f)
+
+    now = datetime.now(timezone.utc).isoformat()
+    for doc_id in doc_ids:
+        versions[doc_id] = now
+
+    # Atomic replace, the API may be reading the file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(versions, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
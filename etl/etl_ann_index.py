@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Index structures are shared with the API, which loads the saved index
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.db.ann_index import IVFPQIndex, recall_at_k
+from api.db.embedding_store import open_embeddings
+from api.db.local_store import inverse_norms, normalize, top_k_indices
+
+
+EMBEDDINGS_STORE_PATH = os.path.join("data", "embeddings", "store")
+EMBEDDINGS_NPY_PATH = os.path.join("data", "embeddings", "embeddings.npy")  # legacy single-file matrix
+ANN_INDEX_PATH = os.path.join("data", "embeddings", "ann_index.npz")
+
+
+def load_embeddings():
+    if os.path.isdir(EMBEDDINGS_STORE_PATH):
+        return open_embeddings(EMBEDDINGS_STORE_PATH)
+
+    if not os.path.exists(EMBEDDINGS_NPY_PATH):
+        raise FileNotFoundError(f"No embeddings found at {EMBEDDINGS_STORE_PATH} or {EMBEDDINGS_NPY_PATH}.")
+
+    return open_embeddings(EMBEDDINGS_NPY_PATH)
+
+
+def default_nlist(n: int) -> int:
+    # Usual IVF rule of thumb: ~4 * sqrt(N) lists
+    return max(1, int(4 * np.sqrt(n)))
+
+
+def build_index(embeddings, nlist: int, m: int, train_size: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    sample_idx = np.sort(rng.choice(embeddings.shape[0], min(train_size, embeddings.shape[0]), replace=False))
+
+    print(f"[ANN] Training IVF-PQ (nlist={nlist}, m={m}) on {len(sample_idx)} vectors...")
+    index = IVFPQIndex(dim=embeddings.shape[1], nlist=nlist, m=m)
+    index.train(np.asarray(embeddings[sample_idx]), seed=seed)
+
+    return index
+
+
+def exact_search(embeddings, queries, k: int, block_rows: int = 65536):
+    """Brute-force top-k ids per query, keeping a running top-k per block of rows."""
+
+    q = normalize(queries)
+    best_ids = np.empty((q.shape[0], 0), dtype=np.int64)
+    best_scores = np.empty((q.shape[0], 0), dtype=np.float32)
+
+    for start in range(0, embeddings.shape[0], block_rows):
+        block = embeddings[start:start + block_rows]
+        scores = (q @ np.asarray(block, dtype=np.float32).T) * inverse_norms(block)
+        ids = np.broadcast_to(np.arange(start, start + block.shape[0]), scores.shape)
+
+        best_ids = np.concatenate([best_ids, ids], axis=1)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+
+        if best_scores.shape[1] > k:
+            keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_ids = np.take_along_axis(best_ids, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+    return [ids[top_k_indices(scores, k)] for ids, scores in zip(best_ids, best_scores)]
+
+
+def recall_report(index, embeddings, k: int, nprobes, n_queries: int, rerank_factor: int, seed: int = 0):
+    """Recall@k and mean latency per nprobe, against exact search, using corpus rows as queries."""
+
+    rng = np.random.default_rng(seed)
+    query_idx = rng.choice(embeddings.shape[0], min(n_queries, embeddings.shape[0]), replace=False)
+    queries = np.asarray(embeddings[np.sort(query_idx)], dtype=np.float32)
+
+    exact = exact_search(embeddings[:index.ntotal], queries, k)
+
+    print(f"[ANN] Recall@{k} over {len(queries)} queries (rerank_factor={rerank_factor})")
+    print(f"{'nprobe':>8} {'recall(pq)':>11} {'recall(rerank)':>15} {'ms/query':>9}")
+
+    rows = []
+    for nprobe in nprobes:
+        pq_ids, _ = index.search(queries, k, nprobe=nprobe)
+
+        start = time.perf_counter()
+        rr_ids, _ = index.search(queries, k, nprobe=nprobe, rerank_vectors=embeddings, rerank_factor=rerank_factor)
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        row = {
+            "nprobe": nprobe,
+            "recall_pq": recall_at_k(pq_ids, exact, k),
+            "recall_rerank": recall_at_k(rr_ids, exact, k),
+            "ms_per_query": ms,
+        }
+        rows.append(row)
+        print(f"{nprobe:>8} {row['recall_pq']:>11.3f} {row['recall_rerank']:>15.3f} {ms:>9.2f}")
+
+    return rows
+
+
+def run_ann_index(nlist: int, m: int, train_size: int, rebuild: bool):
+    embeddings = load_embeddings()
+    n = embeddings.shape[0]
+
+    if os.path.exists(ANN_INDEX_PATH) and not rebuild:
+        index = IVFPQIndex.load(ANN_INDEX_PATH)
+        print(f"[ANN] Loaded existing index with {index.ntotal} vectors.")
+
+        if index.dim != embeddings.shape[1] or index.ntotal > n:
+            print("[ANN] Index does not match the embeddings. Rebuilding.")
+            index = build_index(embeddings, nlist or default_nlist(n), m, train_size)
+    else:
+        index = build_index(embeddings, nlist or default_nlist(n), m, train_size)
+
+    # Incremental insertion of the rows embedded since the last run
+    new_rows = n - index.ntotal
+    if new_rows:
+        print(f"[ANN] Adding {new_rows} new vectors...")
+        index.add(embeddings[index.ntotal:])
+        index.save(ANN_INDEX_PATH)
+        print(f"[ANN] Index saved to {ANN_INDEX_PATH} ({index.ntotal} vectors).")
+    else:
+        print("[ANN] Nothing new to index.")
+
+    return index, embeddings
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Build / update the IVF-PQ index over the embeddings")
+
+    parser.add_argument("--nlist", type=int, default=0, help="Number of IVF lists (default: 4 * sqrt(N))")
+    parser.add_argument("--m", type=int, default=64, help="PQ sub-vectors (bytes per vector); must divide the embedding dim")
+    parser.add_argument("--train-size", type=int, default=100_000, help="Vectors sampled to train the index")
+    parser.add_argument("--rebuild", action="store_true", help="Retrain from scratch instead of appending")
+    parser.add_argument("--report", action="store_true", help="Print a recall@k report against exact search")
+    parser.add_argument("--k", type=int, default=10, help="k for the recall report")
+    parser.add_argument("--nprobe", type=str, default="1,4,8,16,32,64", help="Comma separated nprobe values for the report")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries for the report")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="Shortlist multiplier for exact rescoring")
+
+    args = parser.parse_args()
+
+    index, embeddings = run_ann_index(args.nlist, args.m, args.train_size, args.rebuild)
+
+    if args.report:
+        nprobes = [int(p) for p in args.nprobe.split(",") if p.strip()]
+        recall_report(index, embeddings, args.k, nprobes, args.queries, args.rerank_factor)
@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# Index structures are shared with the API, which loads the saved index
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.db.bm25_index import BM25Index
+from api.db.chunk_store import ChunkStore
+
+
+CHUNK_STORE_PATH = os.path.join("data", "chunked", "store")
+CHUNKS_JSONL_PATH = os.path.join("data", "chunked", "chunks.jsonl")  # legacy, used when there is no chunk store
+BM25_INDEX_PATH = os.path.join("data", "bm25_index.npz")
+
+
+def read_corpus():
+    """``(chunk_id, content)`` of the current version of every chunk."""
+
+    if os.path.isdir(CHUNK_STORE_PATH):
+        chunk_store = ChunkStore(CHUNK_STORE_PATH)
+        try:
+            for chunk in chunk_store.iter_chunks():
+                yield chunk["chunk_id"], chunk["content"]
+        finally:
+            chunk_store.close()
+        return
+
+    if not os.path.exists(CHUNKS_JSONL_PATH):
+        raise FileNotFoundError(f"No chunks found at {CHUNK_STORE_PATH} or {CHUNKS_JSONL_PATH}.")
+
+    # Re-chunked documents append new versions; the last line of a chunk_id wins
+    latest = {}
+    with open(CHUNKS_JSONL_PATH, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                chunk = json.loads(line)
+                latest[chunk["chunk_id"]] = chunk["content"]
+
+    yield from latest.items()
+
+
+def run_bm25_index(k1: float, b: float):
+    """Rebuild the index: BM25 statistics are corpus-wide, so there is no incremental update."""
+
+    start = time.perf_counter()
+    index = BM25Index.build(read_corpus(), k1=k1, b=b)
+    index.save(BM25_INDEX_PATH)
+
+    print(
+        f"[BM25] Indexed {len(index)} chunks, {len(index.terms)} terms, {len(index.doc_ids)} postings "
+        f"in {time.perf_counter() - start:.1f}s. Saved to {BM25_INDEX_PATH}."
+    )
+    return index
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Build the BM25 index over the chunk corpus")
+
+    parser.add_argument("--k1", type=float, default=1.2, help="BM25 term frequency saturation")
+    parser.add_argument("--b", type=float, default=0.75, help="BM25 length normalization")
+
+    args = parser.parse_args()
+    run_bm25_index(args.k1, args.b)
@@ -1,78 +1,243 @@
 import os
 from pathlib import Path
+import re
+import argparse
 import pandas as pd
-import csv
 import json
 
+import sys
 import hashlib
 import tiktoken
+from bisect import bisect_left
+
+from manifest import Manifest, append_ledger
+from parallel import ordered_map, default_workers
+
+# The chunk store is shared with the embedding stage and the API
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.db.chunk_store import ChunkStore
 
 PROCESSED_BASE = os.path.join("data", "processed")
 METADATA_PROCESSED_PATH = os.path.join("data", "metadata_processed.csv")
 OUTPUT_CHUNK_PATH = os.path.join("data", "chunked")
 METADATA_CHUNKED_PATH = os.path.join("data")
+CHUNK_STORE_PATH = os.path.join("data", "chunked", "store")
+
+CHUNK_FIELDS = ["doc_id", "chunk_id", "chunk_index", "tokens", "content"]
+METADATA_CHUNKED_FIELDS = ["doc_id", "chunk_id", "chunk_index", "timestamp", "doc_processed_path", "hash"]
+
+# Chunked documents written per batch
+SAVE_BATCH_SIZE = 100
+
+TIKTOKEN_ENCODING = "cl100k_base"  # OpenAI tokenizer
+
+# Chunk size and the tokens of the previous chunk repeated at the start of the next one
+MAX_TOKENS = 500
+OVERLAP_TOKENS = 0
+
+# Joiners between paragraphs and between sentences of a split paragraph
+PARAGRAPH_SEP = "\n\n"
+SENTENCE_SEP = "\n"
+
+SENTENCE_END = re.compile(r"(?<=\.) ")
+
+_encode_batch = None
+_separator_tokens = None
+
+
+def set_tokenizer(name=None):
+    """Count tokens with tiktoken, or with the Hugging Face tokenizer ``name`` (e.g. the embedding model's).
+
+    Either way a batch of texts is encoded into the character offset where each token starts.
+    """
+    global _encode_batch, _separator_tokens
 
-ENCODER = tiktoken.get_encoding("cl100k_base")  # OpenAI tokenizer
+    if name:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        _encode_batch = lambda texts: [
+            [start for start, _ in offsets]
+            for offsets in tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        ]
+    else:
+        encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+        _encode_batch = lambda texts: [encoding.decode_with_offsets(ids)[1] for ids in encoding.encode_ordinary_batch(texts)]
+
+    _separator_tokens = {sep: len(starts) for sep, starts in zip([PARAGRAPH_SEP, SENTENCE_SEP], _encode_batch([PARAGRAPH_SEP, SENTENCE_SEP]))}
+
+
+def encode_batch(texts):
+    """Token start offsets of each text (its token count is their number)."""
+    if _encode_batch is None:
+        set_tokenizer()
+    return _encode_batch(texts) if texts else []
 
 
 def split_into_paragraphs(text: str):
     # split on blank lines
     return [p.strip() for p in text.split("\n\n") if p.strip()]
 
+def sentence_spans(paragraph: str):
+    """``(sentence, cut)`` pairs: sentences split after ". " (keeping the period) and the offset where each one's tokens start.
+
+    The cut of a sentence is the separator before it, where a merged " word" token begins.
+    """
+    spans = []
+    start = cut = 0
+
+    for m in SENTENCE_END.finditer(paragraph):
+        spans.append((paragraph[start:m.start()].strip(), cut))
+        start, cut = m.end(), m.start()
+    spans.append((paragraph[start:].strip(), cut))
+
+    return [(s, c) for s, c in spans if s]
+
+def split_into_sentences(paragraph: str):
+    return [s for s, _ in sentence_spans(paragraph)]
+
 def count_tokens(text: str) -> int:
-    return len(ENCODER.encode(text))
+    return len(encode_batch([text])[0])
 
 
-def chunk_paragraphs(paragraphs, max_tokens=500):
-    chunks = []
-    current = []
-    current_tokens = 0
+def token_units(paragraphs, max_tokens=MAX_TOKENS):
+    """``(text, tokens, joiner, exact)`` units to pack: paragraphs, or the sentences of paragraphs over ``max_tokens``.
 
-    for para in paragraphs:
-        paragraph_tokens = count_tokens(para)
+    All paragraphs are encoded once, in one batch. A long paragraph is split at
+    sentence boundaries without encoding it again: each sentence gets the
+    paragraph tokens that start inside it. Those counts are estimates
+    (``exact`` is False), since a sentence on its own can tokenize slightly
+    differently; ``chunk_paragraphs`` recounts the chunks they end up in.
+    """
 
-        # If a single paragraph is too big, split by sentences instead
-        if paragraph_tokens > max_tokens:
-            sentences = [s.strip() for s in para.split(". ") if s.strip()]
-
-            for sent in sentences:
-                sent_tokens = count_tokens(sent)
-            
-                if current_tokens + sent_tokens > max_tokens:
-                    chunks.append("\n".join(current))
-                    current = [sent]
-                    current_tokens = sent_tokens
-                else:
-                    current.append(sent)
-                    current_tokens += sent_tokens
+    units = []
+    for para, starts in zip(paragraphs, encode_batch(paragraphs)):
+        if len(starts) <= max_tokens:
+            units.append((para, len(starts), PARAGRAPH_SEP, True))
             continue
 
-        # Normal paragraph append
-        if current_tokens + paragraph_tokens > max_tokens:
-            chunks.append("\n\n".join(current))
-            current = [para]
-            current_tokens = paragraph_tokens
+        # If a single paragraph is too big, split by sentences instead
+        spans = sentence_spans(para)
+        cuts = [bisect_left(starts, cut) for _, cut in spans[1:]] + [len(starts)]
+
+        previous = 0
+        for j, ((sent, _), cut) in enumerate(zip(spans, cuts)):
+            units.append((sent, cut - previous, SENTENCE_SEP if j else PARAGRAPH_SEP, False))
+            previous = cut
+
+    return units
+
+
+def join_units(units):
+    """Chunk text and estimated token count (unit counts plus joiners) of consecutive units."""
+
+    text = units[0][0] + "".join(joiner + t for t, _, joiner, _ in units[1:])
+    tokens = units[0][1] + sum(n + _separator_tokens[joiner] for _, n, joiner, _ in units[1:])
+    return text, tokens
+
+
+def fit_chunk(units, n_overlap, max_tokens):
+    """Exact ``(text, tokens, start, end)`` of the chunk ``units[start:end]`` that fits ``max_tokens``.
+
+    Token counts do not add up across joins (BPE merges), so a chunk of several
+    units, or of an estimated sentence, is encoded once more. While it is over
+    the limit, trailing units are handed back to the next chunk, then leading
+    overlap units are dropped. One unit over the limit on its own (a very long
+    sentence) is kept as is.
+    """
+
+    start, end = 0, len(units)
+
+    while True:
+        text, tokens = join_units(units[start:end])
+        if end - start > 1 or not units[start][3]:
+            tokens = count_tokens(text)
+
+        if tokens <= max_tokens:
+            break
+        if end > max(start, n_overlap) + 1:
+            end -= 1
+        elif start < n_overlap:
+            start += 1
         else:
-            current.append(para)
-            current_tokens += paragraph_tokens
+            break
 
-    if current:
-        chunks.append("\n\n".join(current))
+    return text, tokens, start, end
+
+
+def overlap_tail(units, overlap_tokens, budget):
+    """Trailing units of a finished chunk, worth at most ``overlap_tokens`` and ``budget`` tokens, to repeat in the next one."""
+
+    limit = min(overlap_tokens, budget)
+    tail = []
+
+    # Never carry the whole chunk, the next one has to move forward
+    for unit in reversed(units[1:]):
+        if join_units([unit] + tail)[1] > limit:
+            break
+        tail.insert(0, unit)
+
+    return tail
+
+
+def chunk_paragraphs(paragraphs, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """Greedily pack paragraphs (or sentences) into ``(text, tokens)`` chunks of at most ``max_tokens``.
+
+    Packing uses the per-unit counts of ``token_units``; every finished chunk is
+    then counted exactly by ``fit_chunk``, and the units it hands back start the
+    next chunk.
+    """
+
+    if _separator_tokens is None:
+        set_tokenizer()
+
+    units = token_units(paragraphs, max_tokens)
+
+    chunks = []
+    current = []
+    n_overlap = 0  # leading units of ``current`` repeated from the previous chunk
+    current_tokens = 0
+    i = 0
+
+    while i < len(units) or len(current) > n_overlap:
+        if i < len(units):
+            unit = units[i]
+            cost = unit[1] + (_separator_tokens[unit[2]] if current else 0)
+
+            # A chunk always takes at least one new unit
+            if len(current) == n_overlap or current_tokens + cost <= max_tokens:
+                current.append(unit)
+                current_tokens += cost
+                i += 1
+                continue
+
+        text, tokens, start, end = fit_chunk(current, n_overlap, max_tokens)
+        chunks.append((text, tokens))
+        i -= len(current) - end
+
+        # The next chunk starts with the tail of this one, leaving room for its first new unit
+        if i < len(units):
+            budget = max_tokens - units[i][1] - _separator_tokens[units[i][2]]
+            current = overlap_tail(current[start:end], overlap_tokens, budget)
+        else:
+            current = []
+        n_overlap = len(current)
+        current_tokens = join_units(current)[1] if current else 0
 
     return chunks
 
 
-def process_clean_file(metadata_row, output_rows, metadata_chunked_rows):
+def process_clean_file(metadata_row, output_rows, metadata_chunked_rows, max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS):
 
     path = Path(metadata_row["target_path"])
 
 
     text = path.read_text(encoding="utf-8")
     paragraphs = split_into_paragraphs(text)
-    chunks = chunk_paragraphs(paragraphs)
+    chunks = chunk_paragraphs(paragraphs, max_tokens, overlap_tokens)
 
-    for idx, chunk_text in enumerate(chunks):
-        token_count = count_tokens(chunk_text)
+    for idx, (chunk_text, token_count) in enumerate(chunks):
 
         output_rows.append({
             "doc_id": metadata_row["id"],
@@ -92,64 +257,189 @@ def process_clean_file(metadata_row, output_rows, metadata_chunked_rows):
         })
 
 
+def plan_chunking(processed_rows, chunk_set, chunked_hash, dirty, backfill, counts):
+    """Yield ``(row, previous chunk_ids)`` for each processed document to (re-)chunk, as the rows stream in.
 
+    ``chunk_set(doc_id)`` and ``chunked_hash(doc_id)`` are indexed manifest
+    lookups, so planning holds one document at a time rather than the chunk
+    sets of the whole corpus. Documents in ``dirty`` are re-chunked
+    regardless. Documents chunked before their hash was tracked get a
+    ``chunked_docs`` row appended to ``backfill``. ``counts`` tallies
+    ``up_to_date`` and ``to_chunk``.
+    """
 
-def run_dispatcher():
+    for row in processed_rows:
+        doc_id = row["id"]
+        previous_hash = chunked_hash(doc_id)
 
+        if doc_id not in dirty and previous_hash == row["target_hash"]:
+            counts["up_to_date"] += 1
+            continue
 
-    # Check for necessary files and directories
-    if not os.path.exists(METADATA_PROCESSED_PATH):
-        print("[ETL] No processed metadata found. Skipping chunking.")
-        return -1
-    
-    if not os.path.exists(PROCESSED_BASE):
-        print("[ETL] No processed files found. Skipping chunking.")
-        return -1
-    
-    os.makedirs(OUTPUT_CHUNK_PATH, exist_ok=True)
+        known = chunk_set(doc_id)
+
+        if doc_id not in dirty and previous_hash is None and known:
+            # Chunked by an older run: trust it and start tracking its hash
+            backfill.append({"doc_id": doc_id, "target_hash": row["target_hash"], "timestamp": pd.Timestamp.now().isoformat()})
+            counts["up_to_date"] += 1
+            continue
+
+        counts["to_chunk"] += 1
+        yield row, known
 
-    metadata_processed_rows = pd.read_csv(METADATA_PROCESSED_PATH)
+
+def chunk_document(task):
+    """Chunk one processed document. Runs in a worker process; returns its chunk rows and metadata rows."""
 
     output_rows = []
-    metadata_chunked_rows = [] if os.path.exists( os.path.join(METADATA_CHUNKED_PATH, "metadata_chunked.csv") ) == False else pd.read_csv(os.path.join(METADATA_CHUNKED_PATH, "metadata_chunked.csv")).to_dict(orient="records")
+    metadata_chunked_rows = []
+    process_clean_file(task["row"], output_rows, metadata_chunked_rows, task["max_tokens"], task["overlap_tokens"])
+    return output_rows, metadata_chunked_rows
 
-    # Process each row of the metadata (each row corresponds to a processed file)
-    for _, row in metadata_processed_rows.iterrows():
 
-        if any(chunk["doc_id"] == row["id"] for chunk in metadata_chunked_rows):
-            # Already chunked
-            print(f"[CHUNK] Skipping {row["id"]}, already chunked.")
-            continue
+def get_chunk_store():
+    """Open the chunk store, importing the legacy chunks.jsonl into a new one."""
+
+    new = not os.path.isdir(CHUNK_STORE_PATH)
+    store = ChunkStore(CHUNK_STORE_PATH)
 
-        print(f"[CHUNK] Processing {row["id"]}")
-        process_clean_file(row, output_rows, metadata_chunked_rows)
+    legacy_jsonl = os.path.join(OUTPUT_CHUNK_PATH, "chunks.jsonl")
+    if new and os.path.exists(legacy_jsonl):
+        n = store.import_jsonl(legacy_jsonl)
+        print(f"[CHUNK] Imported {n} chunk rows from {legacy_jsonl} into {CHUNK_STORE_PATH}.")
+
+    return store
+
+
+def save_chunks(output_rows, metadata_chunked_rows, chunked_docs_rows, stale_chunk_ids, rechunked, manifest, chunk_store):
+    """Append one batch of chunked documents to the outputs and record it in the manifest."""
 
-    # Output paths
     output_metadata = os.path.join(METADATA_CHUNKED_PATH, "metadata_chunked.csv")
     output_csv = os.path.join(OUTPUT_CHUNK_PATH, "chunks.csv")
     output_jsonl = os.path.join(OUTPUT_CHUNK_PATH, "chunks.jsonl")
 
-    # Write CSV
-    with open(output_csv, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["doc_id", "chunk_id", "chunk_index", "tokens", "content"])
-        writer.writeheader()
-        writer.writerows(output_rows)
+    # Write CSV (header only when the file is new)
+    append_ledger(output_csv, CHUNK_FIELDS, output_rows)
 
     # Write JSONL
     with open(output_jsonl, "a", encoding="utf-8") as f:
         for row in output_rows:
             f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
-
     # Write metadata
-    with open(output_metadata, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["doc_id", "chunk_id", "chunk_index", "timestamp", "doc_processed_path", "hash"])
-        writer.writeheader()
-        writer.writerows(metadata_chunked_rows)
+    append_ledger(output_metadata, METADATA_CHUNKED_FIELDS, metadata_chunked_rows)
+
+    # Current version of each chunk, looked up by chunk_id downstream
+    chunk_store.put(output_rows)
+    chunk_store.remove(stale_chunk_ids)
+
+    manifest.delete("chunks", "chunk_id", stale_chunk_ids)
+    manifest.delete("embeddings", "chunk_id", stale_chunk_ids)
+    manifest.add("chunks", metadata_chunked_rows)
+    manifest.add("chunked_docs", chunked_docs_rows)
 
+    # Hand re-chunked documents to the embedding stage
+    manifest.mark_dirty("embed", rechunked)
 
-    print(f"[CHUNK] Chunking completed. Output saved to {OUTPUT_CHUNK_PATH}.\n[CHUNK] Number of chunks created: {len(output_rows)}")
+
+def run_dispatcher(max_tokens=MAX_TOKENS, overlap_tokens=OVERLAP_TOKENS, tokenizer=None, workers=1, max_in_flight=None):
+
+
+    manifest = Manifest()
+
+    # Check for necessary files and directories
+    if not manifest.count("processed_docs"):
+        print("[ETL] No processed metadata found. Skipping chunking.")
+        return -1
+    
+    if not os.path.exists(PROCESSED_BASE):
+        print("[ETL] No processed files found. Skipping chunking.")
+        return -1
+    
+    os.makedirs(OUTPUT_CHUNK_PATH, exist_ok=True)
+    chunk_store = get_chunk_store()
+
+    # Planned while the pool runs: processed rows are paged and each document's chunk set / hash is an indexed lookup
+    dirty = manifest.dirty_docs("chunk")
+    backfill = []
+    counts = {"up_to_date": 0, "to_chunk": 0}
+    plan = plan_chunking(manifest.processed_docs(), manifest.chunk_set, manifest.chunked_hash, dirty, backfill, counts)
+
+    # Previous chunk_ids of the documents in flight
+    known_chunks = {}
+
+    def tasks():
+        for row, known in plan:
+            known_chunks[row["id"]] = known
+            yield {"row": row, "max_tokens": max_tokens, "overlap_tokens": overlap_tokens}
+
+    # Each worker loads its own encoder; results come back in manifest order
+    results = ordered_map(
+        chunk_document, tasks(),
+        workers=workers, max_in_flight=max_in_flight,
+        initializer=set_tokenizer, initargs=(tokenizer,),
+    )
+
+    # Only the current batch is held in memory
+    output_rows = []
+    metadata_chunked_rows = []
+    chunked_docs_rows = []
+    stale_chunk_ids = []
+    rechunked = []
+    batch_dirty = []
+    n_chunks = 0
+    n_docs = 0
+
+    # Process each document that is new or whose processed file changed
+    for task, result in results:
+        row = task["row"]
+        known = known_chunks.pop(row["id"])
+
+        if isinstance(result, Exception):
+            print(f"[CHUNK] Failed to chunk {row["id"]}: {result}")
+            continue
+
+        print(f"[CHUNK] {"Re-chunked" if known else "Chunked"} {row["id"]}")
+
+        doc_output_rows, doc_metadata_rows = result
+        output_rows.extend(doc_output_rows)
+        metadata_chunked_rows.extend(doc_metadata_rows)
+
+        # Chunks of the previous version that the new one no longer produces
+        stale_chunk_ids.extend(known - {r["chunk_id"] for r in doc_metadata_rows})
+        if known:
+            rechunked.append(row["id"])
+        chunked_docs_rows.append({"doc_id": row["id"], "target_hash": row["target_hash"], "timestamp": pd.Timestamp.now().isoformat()})
+        if row["id"] in dirty:
+            batch_dirty.append(row["id"])
+
+        n_docs += 1
+        if n_docs % SAVE_BATCH_SIZE == 0:
+            save_chunks(output_rows, metadata_chunked_rows, chunked_docs_rows, stale_chunk_ids, rechunked, manifest, chunk_store)
+            # Only saved documents lose their marker; failed ones are retried next run
+            manifest.clear_dirty("chunk", batch_dirty)
+            n_chunks += len(output_rows)
+            output_rows, metadata_chunked_rows, chunked_docs_rows, stale_chunk_ids, rechunked, batch_dirty = [], [], [], [], [], []
+
+    save_chunks(output_rows, metadata_chunked_rows, chunked_docs_rows, stale_chunk_ids, rechunked, manifest, chunk_store)
+    manifest.clear_dirty("chunk", batch_dirty)
+    n_chunks += len(output_rows)
+    chunk_store.close()
+
+    manifest.add("chunked_docs", backfill)
+    print(f"[CHUNK] {counts['up_to_date']} documents up to date, {counts['to_chunk']} to chunk, {n_docs} chunked.")
+
+    print(f"[CHUNK] Chunking completed. Output saved to {OUTPUT_CHUNK_PATH}.\n[CHUNK] Number of chunks created: {n_chunks}")
 
 
 if __name__ == "__main__":
-    run_dispatcher()
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Split the processed documents into token-bounded chunks.")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="Maximum tokens per chunk.")
+    parser.add_argument("--overlap", type=int, default=OVERLAP_TOKENS, help="Tokens of the previous chunk repeated at the start of the next.")
+    parser.add_argument("--tokenizer", type=str, default=None, help="Hugging Face tokenizer to count with (default: tiktoken cl100k_base).")
+    parser.add_argument("--workers", type=int, default=1, help=f"Chunking processes (this machine has {default_workers()} cores).")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Documents queued ahead of the writer (default 4 * workers).")
+
+    args = parser.parse_args()
+    run_dispatcher(args.max_tokens, args.overlap, args.tokenizer, args.workers, args.max_in_flight)
\ No newline at end of file
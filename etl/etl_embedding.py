@@ -1,176 +1,394 @@
 import os
-import csv
+import sys
 import json
-import pandas as pd
+import time
+import queue
+import hashlib
+import threading
 import numpy as np
+import pandas as pd
 import argparse
+from pathlib import Path
 
+import torch
 from sentence_transformers import SentenceTransformer
-import tqdm
+from sentence_transformers.util import batch_to_device
+
+from manifest import Manifest, append_ledger, truncate_ledger
+from doc_metadata import write_doc_metadata, update_doc_versions
+from parallel import ordered_map, default_workers
+
+# The embedding store is shared with the API, which memory-maps it
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.db.chunk_store import ChunkStore
+from api.db.embedding_store import ShardedEmbeddingStore
+from api.db.quantized_index import QuantizedIndex
 
 
-EMBEDDINGS_NPY_PATH = os.path.join("data", "embeddings", "embeddings.npy")
+EMBEDDINGS_STORE_PATH = os.path.join("data", "embeddings", "store")
+EMBEDDINGS_NPY_PATH = os.path.join("data", "embeddings", "embeddings.npy")  # legacy, imported into the store once
 METADATA_EMBEDDINGS_PATH = os.path.join("data", "metadata_embeddings.csv")
 
+# Optional int8 / binary codes of the store, scanned by the API before float rescoring
+QUANTIZED_INDEX_PATH = os.path.join("data", "embeddings", "quantized.npz")
+QUANTIZE_TRAIN_ROWS = 100_000
+
+CHUNK_STORE_PATH = os.path.join("data", "chunked", "store")
 CHUNKS_JSONL_PATH = os.path.join("data", "chunked", "chunks.jsonl")
 CHUNKS_CSV_PATH = os.path.join("data", "chunked", "chunks.csv")
-METADATA_CHUNKED_PATH = os.path.join("data", "metadata_chunked.csv")
 
-os.makedirs(os.path.dirname(EMBEDDINGS_NPY_PATH), exist_ok=True)
+EMBEDDINGS_FIELDS = ["doc_id", "doc_processed_path", "chunk_id", "chunk_hash", "timestamp"]
+
+os.makedirs(EMBEDDINGS_STORE_PATH, exist_ok=True)
 
 
 # I/O
 def read_chunks():
+    """Stream chunk rows from the chunk store (legacy: chunks.jsonl or chunks.csv) without loading the file."""
+
+    if os.path.isdir(CHUNK_STORE_PATH):
+        print(f"Loading chunks from {CHUNK_STORE_PATH}")
+
+        # Own connection: this generator may run in the producer thread
+        chunk_store = ChunkStore(CHUNK_STORE_PATH)
+        try:
+            yield from chunk_store.iter_chunks()
+        finally:
+            chunk_store.close()
+        return
 
     if os.path.exists(CHUNKS_JSONL_PATH):
         print(f"Loading chunks from {CHUNKS_JSONL_PATH}")
-        chunks = []
 
         with open(CHUNKS_JSONL_PATH, "r", encoding="utf-8") as fh:
             for line in fh:
                 if not line.strip():
                     continue
-                chunks.append(json.loads(line))
-
-        return chunks
+                yield json.loads(line)
+        return
 
     if os.path.exists(CHUNKS_CSV_PATH):
         print(f"Loading chunks from {CHUNKS_CSV_PATH}")
 
-        df = pd.read_csv(CHUNKS_CSV_PATH, dtype=str)
-        
-        # Ensure proper column types and content
-        rows = df.to_dict(orient="records")
-        for r in rows:
-            # keep content as-is; ensure tokens and indices numeric if present
-            r["tokens"] = int(r.get("tokens") or 0)
-            r["chunk_index"] = int(r.get("chunk_index") or 0)
-
-        return rows
+        for df in pd.read_csv(CHUNKS_CSV_PATH, dtype=str, chunksize=10000):
+            # Ensure proper column types and content
+            for r in df.to_dict(orient="records"):
+                # keep content as-is; ensure tokens and indices numeric if present
+                r["tokens"] = int(r.get("tokens") or 0)
+                r["chunk_index"] = int(r.get("chunk_index") or 0)
+                yield r
+        return
 
     raise FileNotFoundError(f"No chunks found at {CHUNKS_JSONL_PATH} or {CHUNKS_CSV_PATH}.")
 
-def save_data(embeddings, metadata):
+def get_store(manifest, dtype="float32"):
+    """Open the sharded embedding store (``dtype`` only applies to a new store) at its last checkpoint."""
 
-    # Save embeddings
-    if os.path.exists(EMBEDDINGS_NPY_PATH):
-        print("Existing embeddings found. Loading for append")
+    store = ShardedEmbeddingStore(EMBEDDINGS_STORE_PATH, dtype=dtype)
 
-        # Append to existing embeddings
-        existing_emb = np.load(EMBEDDINGS_NPY_PATH)
-        all_emb = np.vstack([existing_emb, embeddings])
+    if not len(store) and os.path.exists(EMBEDDINGS_NPY_PATH):
+        n = store.import_npy(EMBEDDINGS_NPY_PATH)
+        print(f"[EMBEDDING] Imported {n} rows from {EMBEDDINGS_NPY_PATH} into {EMBEDDINGS_STORE_PATH}.")
 
-        np.save(EMBEDDINGS_NPY_PATH, all_emb)
+    committed = manifest.get_checkpoint("embedding_rows")
 
-        del existing_emb
-        del all_emb
+    if committed is None:
+        manifest.set_checkpoint("embedding_rows", len(store))
 
-    else:
+    elif len(store) > committed:
+        # A run stopped between writing a batch and committing it: roll back to the checkpoint
+        print(f"[EMBEDDING] Discarding {len(store) - committed} uncommitted rows of an interrupted run.")
+        store.truncate(committed)
+        truncate_ledger(METADATA_EMBEDDINGS_PATH, committed)
 
-        print("No existing embeddings found. Creating new file.")
-        np.save(EMBEDDINGS_NPY_PATH, embeddings)
+    return store
 
-    # Save metadata
-    file_exists = os.path.exists(METADATA_EMBEDDINGS_PATH)
+def save_data(embeddings, metadata, manifest, store, chunk_store=None):
 
-    with open(METADATA_EMBEDDINGS_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=metadata[0].keys())
-        
-        if not file_exists:
-            writer.writeheader()
+    # Marked before the rows exist: an interrupted run over-bumps, it never misses a document
+    manifest.mark_dirty("version", {m["doc_id"] for m in metadata})
 
-        writer.writerows(metadata)
+    # Save embeddings: only this batch is written
+    first_row = store.append(embeddings)
 
-# 
-def generate_embeddings(model, chunks: list, batch_size: int, device: str):
-    emb = model.encode(chunks, show_progress_bar=True, convert_to_numpy=True, normalize_embeddings=False)
-    return emb
+    append_ledger(METADATA_EMBEDDINGS_PATH, EMBEDDINGS_FIELDS, metadata)
 
+    # Commit point: metadata rows (row i of the manifest/ledger is row i of the store) and the checkpoint
+    manifest.commit_embeddings([{**m, "row": first_row + i} for i, m in enumerate(metadata)], len(store))
 
-#
-def create_embeddings(model_name: str, batch_size: int, device: str):
+    # Only committed rows are referenced from the chunk store; sync_chunk_store redoes this after a crash
+    if chunk_store is not None:
+        chunk_store.set_embedding_rows({m["chunk_id"]: first_row + i for i, m in enumerate(metadata)})
+        manifest.set_checkpoint("chunk_store_rows", len(store))
+
+    # Older vectors of re-embedded chunks are no longer live
+    return manifest.drop_superseded_embeddings(metadata)
+
+def sync_chunk_store(manifest, chunk_store):
+    """Record in the chunk store the embedding rows committed after it was last updated.
+
+    A run stopped between the manifest commit and ``set_embedding_rows`` would otherwise
+    leave those chunks at -1; a store without the checkpoint is synced in full once.
+    """
+
+    synced = manifest.get_checkpoint("chunk_store_rows") or 0
+    committed = manifest.get_checkpoint("embedding_rows") or 0
+
+    if synced < committed:
+        rows = manifest.embedding_rows_since(synced)
+        chunk_store.set_embedding_rows(rows)
+        manifest.set_checkpoint("chunk_store_rows", committed)
+        print(f"[EMBEDDING] Recorded {len(rows)} committed embedding rows missing from the chunk store.")
+
+def publish_doc_versions(manifest, doc_ids=()):
+    """Bump the doc versions of ``doc_ids`` and of every document marked by ``save_data``, then clear the markers.
+
+    Done here rather than when the vectors are loaded so cached answers are invalidated with either
+    vector store backend; the local store reads the embedding store directly.
+    """
+
+    changed = manifest.dirty_docs("version") | set(doc_ids)
+    if changed:
+        update_doc_versions(changed)
+        manifest.clear_dirty("version", changed)
+    return changed
+
+def pending_chunks(chunks, manifest, counts):
+    """Chunks whose current version has no embedding yet, with their metadata row.
+
+    A line of chunks.jsonl is current when its content hashes to the chunk's
+    hash in the manifest (re-chunked documents append new versions). Embedded
+    ``(chunk_id, hash)`` pairs are held in one in-memory set.
+    """
+
+    embedded = manifest.embedded_keys()
+
+    for chunk in chunks:
+        chunk_id = chunk["chunk_id"]
+        chunk_meta = manifest.get_chunk(chunk_id)
+
+        if chunk_meta is None:
+            counts["unknown"] += 1
+            continue
+
+        if hashlib.sha256(chunk["content"].encode("utf-8")).hexdigest() != chunk_meta["hash"]:
+            counts["outdated"] += 1
+            continue
+
+        key = (chunk_id, chunk_meta["hash"])
+        if key in embedded:
+            counts["embedded"] += 1
+            continue
+        embedded.add(key)
+
+        yield chunk["content"], {
+            "doc_id": chunk["doc_id"],
+            "doc_processed_path": chunk_meta["doc_processed_path"],
+            "chunk_id": chunk_id,
+            "chunk_hash": chunk_meta["hash"],
+            "timestamp": pd.Timestamp.now().isoformat()
+        }
+
+
+def batched(items, batch_size):
+    """Lists of ``(text, metadata)`` turned into ``(texts, metadata)`` batches; the last one may be partial."""
+
+    texts, metadata = [], []
+
+    for text, meta in items:
+        texts.append(text)
+        metadata.append(meta)
+
+        if len(texts) == batch_size:
+            yield texts, metadata
+            texts, metadata = [], []
+
+    if texts:
+        yield texts, metadata
+
+
+def produce_batches(model, manifest_path, batch_size, out_queue, counts):
+    """Producer thread: read, filter and tokenize batches while the consumer runs the model."""
+
+    # SQLite connections are per thread; WAL lets this one read while the consumer writes
+    manifest = Manifest(manifest_path, ledger_paths={})
+
+    try:
+        for texts, metadata in batched(pending_chunks(read_chunks(), manifest, counts), batch_size):
+            out_queue.put((model.tokenize(texts), metadata))
+
+        out_queue.put(None)
+
+    except Exception as e:
+        out_queue.put(e)
+
+    finally:
+        manifest.close()
+
+
+def embed_features(model, features):
+    features = batch_to_device(features, model.device)
+
+    with torch.no_grad():
+        embeddings = model(features)["sentence_embedding"]
+
+    return embeddings.float().cpu().numpy()
+
+
+def embed_prefetched(model_name, device, batch_size, prefetch, manifest, counts):
+    """Single process: tokenization in a producer thread overlaps inference. Yields ``(metadata, embeddings)``."""
 
     model = SentenceTransformer(model_name, device=device)
+    model.eval()
     print(f"Model loaded. {model_name} on device {model.device}...")
 
-    # Read embeddings metadata
-    current_emb_hashes = {}
+    # Tokenized batches are prepared ahead while the model runs on the current one
+    batches = queue.Queue(maxsize=prefetch)
+    producer = threading.Thread(
+        target=produce_batches, args=(model, manifest.path, batch_size, batches, counts),
+        name="embedding-producer", daemon=True,
+    )
+    producer.start()
 
-    if os.path.exists(METADATA_EMBEDDINGS_PATH):
-        with open(METADATA_EMBEDDINGS_PATH, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
+    while True:
+        item = batches.get()
+        if item is None:
+            break
+        if isinstance(item, Exception):
+            raise item
 
-            for row in reader:
-                # ERROR HERE
-                doc_path = row["doc_processed_path"]
-                chunk_hash = row["chunk_hash"]
+        features, metadata = item
+        yield metadata, embed_features(model, features)
 
-                current_emb_hashes[chunk_hash] = doc_path
+    producer.join()
 
 
-    # Read chunks
-    chunks = read_chunks()
+# Multi-process mode: one model per worker process
+_worker_model = None
+_worker_batch_size = None
 
-    # Read chunk metadata
-    chunks_hashs = {}
-    with open(METADATA_CHUNKED_PATH, "r",newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
 
-        for row in reader:
-            chunk_id = row["chunk_id"]
-            chunk_hash = row["hash"]
-            chunk_proc_path = row["doc_processed_path"]
+def init_worker(model_name, device, batch_size, threads):
+    """Load the model in a worker and cap its intra-op threads so workers do not oversubscribe the cores.
 
-            chunks_hashs[chunk_id] = [chunk_hash, chunk_proc_path]
+    torch is already imported (and has read OMP_NUM_THREADS / MKL_NUM_THREADS) in a forked worker,
+    so the cap is set with ``torch.set_num_threads``; tokenizers reads its variable on first use.
+    """
+    global _worker_model, _worker_batch_size
 
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    torch.set_num_threads(threads)
 
-    # Process each chunk
-    to_embed = []
-    to_embed_metadata = []
-    num_to_embed = 0
-    batch_num = 0
+    _worker_model = SentenceTransformer(model_name, device=device)
+    _worker_batch_size = batch_size
 
-    for curr_chunk in chunks:
-        curr_chunk_id = curr_chunk["chunk_id"]
 
-        curr_chunk_hash = chunks_hashs[curr_chunk_id][0]
-        curr_chunk_proc_path = chunks_hashs[curr_chunk_id][1]
+def encode_batch(batch):
+    texts, _ = batch
+    return _worker_model.encode(
+        texts, batch_size=_worker_batch_size, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False
+    )
 
 
-        # Check if chunk is already embedded (metadata)
-        if curr_chunk_hash in current_emb_hashes:
-            print(f"[EMBEDDING] Skipping {curr_chunk_id} with hash {curr_chunk_hash}, already embedded.")
-            continue
+def embed_multiprocess(model_name, device, batch_size, workers, manifest, counts):
+    """Shard batches over ``workers`` processes; results come back in input order. Yields ``(metadata, embeddings)``."""
 
-        
-        to_embed.append(curr_chunk["content"])
-        to_embed_metadata.append({
-            "doc_id": curr_chunk["doc_id"],
-            "doc_processed_path": curr_chunk_proc_path,
-            "chunk_id": curr_chunk_id,
-            "chunk_hash": curr_chunk_hash,
-            "timestamp": pd.Timestamp.now().isoformat()
-        })
-        num_to_embed += 1
-        
-        if num_to_embed % batch_size == 0 or num_to_embed == len(chunks):
-            print(f"[EMBEDDING] Processing batch num {batch_num} of {num_to_embed} chunks...")
-            batch_num += 1
+    threads = max(1, default_workers() // workers)
+    print(f"[EMBEDDING] {workers} worker processes x {threads} threads, model {model_name} on {device}.")
 
-            # Create embeddings from chunks
-            curr_embeddings = generate_embeddings(model, to_embed, batch_size, device)
+    results = ordered_map(
+        encode_batch, batched(pending_chunks(read_chunks(), manifest, counts), batch_size),
+        workers=workers, max_in_flight=2 * workers,
+        initializer=init_worker, initargs=(model_name, device, batch_size, threads),
+    )
 
-            # Save embedding and metadata
-            save_data(curr_embeddings, to_embed_metadata)
-            del curr_embeddings
+    for (_, metadata), embeddings in results:
+        if isinstance(embeddings, Exception):
+            raise embeddings
+        yield metadata, embeddings
 
-            # Clear variables to free memory
-            to_embed = []
-            to_embed_metadata = []
 
-    
+#
+def update_quantized_index(store, kind):
+    """Append codes for the rows added since the last run; rebuild when the kind, dim or row count does not match."""
+
+    embeddings = store.view()
+    index = QuantizedIndex.load(QUANTIZED_INDEX_PATH) if os.path.exists(QUANTIZED_INDEX_PATH) else None
+
+    if index is None or index.kind != kind or index.dim != embeddings.shape[1] or index.ntotal > len(embeddings):
+        index = QuantizedIndex(embeddings.shape[1], kind)
+        index.train(np.asarray(embeddings[:QUANTIZE_TRAIN_ROWS]))
+
+    new_rows = len(embeddings) - index.ntotal
+    if new_rows:
+        index.add(embeddings[index.ntotal:])
+        index.save(QUANTIZED_INDEX_PATH)
+
+    print(
+        f"[EMBEDDING] {kind} codes: {index.ntotal} rows ({new_rows} new), {index.nbytes / 2**20:.1f} MiB "
+        f"vs {len(embeddings) * embeddings.shape[1] * 4 / 2**20:.1f} MiB as float32."
+    )
+    return index
+
+
+def create_embeddings(model_name: str, batch_size: int, device: str, dtype: str = "float32", prefetch: int = 4, workers: int = 1,
+                      quantize: str = "none"):
+
+    # Chunk and embedding metadata are looked up in the manifest (indexed by chunk_id / hash)
+    manifest = Manifest()
+
+    # Resumes from the last committed batch: committed chunks are skipped as already embedded
+    store = get_store(manifest, dtype)
+    chunk_store = ChunkStore(CHUNK_STORE_PATH) if os.path.isdir(CHUNK_STORE_PATH) else None
+    if chunk_store is not None:
+        sync_chunk_store(manifest, chunk_store)
+
+    # Documents re-chunked upstream, and those whose indexed vectors go stale in this run
+    dirty = manifest.dirty_docs("embed")
+    stale_docs = set(dirty)
+
+    counts = {"unknown": 0, "outdated": 0, "embedded": 0}
+    if workers > 1:
+        batches = embed_multiprocess(model_name, device, batch_size, workers, manifest, counts)
+    else:
+        batches = embed_prefetched(model_name, device, batch_size, prefetch, manifest, counts)
+
+    num_embedded = 0
+    batch_num = 0
+    start = time.perf_counter()
+
+    for metadata, embeddings in batches:
+
+        # Save embedding and metadata
+        stale_docs |= save_data(embeddings, metadata, manifest, store, chunk_store)
+
+        num_embedded += len(metadata)
+        batch_num += 1
+        elapsed = time.perf_counter() - start
+        print(f"[EMBEDDING] Batch {batch_num}: {num_embedded} chunks embedded, {num_embedded / elapsed:.1f} chunks/s")
+
+    # Court / source / date of each document, for filtered retrieval
+    write_doc_metadata(manifest)
+
+    # Hand the affected documents to build_vector_db
+    manifest.mark_dirty("index", stale_docs)
+    manifest.clear_dirty("embed", dirty)
+
+    # Answers cached from the old vectors of these documents are no longer served
+    publish_doc_versions(manifest, stale_docs)
+
+    if quantize != "none" and len(store):
+        update_quantized_index(store, quantize)
 
+    elapsed = time.perf_counter() - start
+    print(
+        f"[EMBEDDING] Done: {num_embedded} chunks in {elapsed:.1f}s ({num_embedded / max(elapsed, 1e-9):.1f} chunks/s). "
+        f"Skipped {counts['embedded']} already embedded, {counts['outdated']} outdated versions, "
+        f"{counts['unknown']} not in the chunk manifest."
+    )
 
+    return num_embedded, elapsed
 
 
 if __name__ == "__main__":
@@ -180,7 +398,11 @@ if __name__ == "__main__":
     parser.add_argument("--model-name", type=str, default="Amanda/bge_portuguese_v4", help="SentenceTransformer model name")
     parser.add_argument("--batch-size", type=int, default=64, help="Batch size for encoding")
     parser.add_argument("--device", type=str, default="cpu", help="Device to run model on (e.g., cpu, cuda:0)")
+    parser.add_argument("--workers", type=int, default=1, help=f"Embedding processes for CPU runs (this machine has {default_workers()} cores)")
+    parser.add_argument("--prefetch", type=int, default=4, help="Tokenized batches prepared ahead of the model")
+    parser.add_argument("--dtype", type=str, default="float32", choices=["float32", "float16"], help="Storage dtype of a new embedding store")
+    parser.add_argument("--quantize", type=str, default="none", choices=["none", "int8", "binary"], help="Also keep quantized codes for the API's coarse search")
     
     args = parser.parse_args()
 
-    create_embeddings(args.model_name, args.batch_size, args.device)
\ No newline at end of file
+    create_embeddings(args.model_name, args.batch_size, args.device, args.dtype, args.prefetch, args.workers, args.quantize)
\ No newline at end of file
@@ -1,60 +1,138 @@
 import os
-import csv
 import re
+import argparse
 import fitz  # PyMuPDF
 from bs4 import BeautifulSoup
 
 import hashlib
-import csv
 from datetime import datetime, timezone
 
+from manifest import Manifest, append_ledger
+from parallel import TaskTimeout, ordered_map, default_workers
+
 METADATA_RAW_PATH = os.path.join("data", "metadata_raw.csv")
 PROCESSED_BASE = os.path.join("data", "processed")
 METADATA_PROCESSED_PATH = os.path.join("data", "metadata_processed.csv")
 
-def save_metadata(row):
-    file_exists = os.path.exists(METADATA_PROCESSED_PATH)
+PROCESSED_FIELDS = ["id", "source_path", "target_path", "timestamp", "source_hash", "target_hash"]
+
+# Processed documents recorded per manifest transaction
+SAVE_BATCH_SIZE = 100
+
+# Seconds a single file may take before its extraction is abandoned
+EXTRACT_TIMEOUT = 300
 
-    with open(METADATA_PROCESSED_PATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=["id", "source_path", "target_path", "timestamp", "source_hash", "target_hash"]
-        )
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
+# BeautifulSoup backend; "lxml" is faster when installed
+HTML_PARSER = "html.parser"
+
+def save_metadata(rows, manifest):
+    """Record a batch of processed documents in the manifest and the CSV ledger."""
+    manifest.add("processed_docs", rows)
+    append_ledger(METADATA_PROCESSED_PATH, PROCESSED_FIELDS, rows)
 
 # Helper: cleaning and normalization
-def clean_text(text: str) -> str:
-    # Normalize whitespace
-    text = text.replace("\r", "")
-    text = re.sub(r"\n{2,}", "\n\n", text)
 
-    # Remove common page numbers
-    text = re.sub(r"^p[aá]gina\s*\d+\s*$", "", text, flags=re.IGNORECASE | re.MULTILINE)
-    text = re.sub(r"^\s*\d+\s*$", "", text, flags=re.MULTILINE)
-    text = re.sub(r"^—?\s*\d+\s*—?$", "", text, flags=re.MULTILINE)
+# Page-number lines ("Página 3", "12", "— 12 —"), removed in this order. ``\s`` may span line
+# breaks, so a footer split over lines ("Página\n3", "—\n12 —") is removed whole
+PAGE_NUMBER_PATTERNS = [
+    re.compile(r"^p[aá]gina\s*\d+\s*$", re.IGNORECASE | re.MULTILINE),
+    re.compile(r"^\s*\d+\s*$", re.MULTILINE),
+    re.compile(r"^—?\s*\d+\s*—?$", re.MULTILINE),
+]
+
+# Lines a page-number match may cover; any other line is left untouched by all three patterns
+SOFT_LINE = re.compile(r"[^\S\n]*(?:p[aá]gina)?[\s\d—]*", re.IGNORECASE)
+
+# Runs of whitespace spanning two or more line breaks
+BLANK_LINES = re.compile(r"\n\s*\n")
+
+
+def strip_page_numbers(text):
+    for pattern in PAGE_NUMBER_PATTERNS:
+        text = pattern.sub("", text)
+    return text
+
+
+def settled_prefix(text):
+    """Length of the prefix ending after the last line that no page-number match can reach.
+
+    Matches span whole lines made only of digits, whitespace, "—" and "página",
+    so the text before such a line is cleaned the same with or without what follows.
+    """
+
+    end = text.rfind("\n")
+    while end > 0:
+        start = text.rfind("\n", 0, end) + 1
+        if not SOFT_LINE.fullmatch(text, start, end):
+            return end + 1
+        end = start - 1
+    return 0
+
+
+def clean_pages(pages):
+    """Clean text page by page, yielding pieces as soon as they are final.
+
+    Joining the pieces gives the cleaned ``"\\n".join(pages)``. Held back are
+    the trailing lines that a page-number match could join with the next page
+    (e.g. a "Página" footer whose number is on the next line) and the
+    whitespace after the last emitted text, so blank lines still collapse
+    across page breaks. Memory stays bounded by the page size.
+    """
+
+    pending = ""   # raw text not cleaned yet
+    blank = ""     # cleaned whitespace not emitted yet
+    started = False
+
+    def emit(raw):
+        nonlocal blank, started
+
+        text = blank + strip_page_numbers(raw)
+        body = text.rstrip()
+        blank = text[len(body):]
+
+        body = BLANK_LINES.sub("\n\n", body)
+        if not started:
+            body = body.lstrip()
+
+        if body:
+            started = True
+        return body
+
+    for i, page in enumerate(pages):
+        pending += ("\n" if i else "") + page.replace("\r", "")
+
+        split = settled_prefix(pending)
+        if split:
+            body = emit(pending[:split])
+            pending = pending[split:]
+            if body:
+                yield body
 
-    # Remove extra empty lines
-    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    body = emit(pending)
+    if body:
+        yield body
 
-    return text.strip()
+
+def clean_text(text: str) -> str:
+    return "".join(clean_pages([text]))
 
     # return re.sub(r'\s+', ' ', text).strip()
 
 # PDF Extraction
+def iter_pdf_pages(path: str):
+    with fitz.open(path) as doc:
+        for page in doc:
+            yield page.get_text("text")
+
+
 def extract_pdf(path: str) -> str:
-    doc = fitz.open(path)
-    texts = []
-    for page in doc:
-        texts.append(page.get_text("text"))
-    return "\n".join(texts)
+    return "\n".join(iter_pdf_pages(path))
 
 
 # HTML Extraction
 def extract_html(path: str) -> str:
     with open(path, "rb") as f:
-        soup = BeautifulSoup(f.read(), "html.parser")
+        soup = BeautifulSoup(f.read(), HTML_PARSER)
 
     # Remove scripts, navigation, styles
     for tag in soup(["script", "style", "nav", "header", "footer"]):
@@ -71,58 +149,120 @@ def extract_txt(path: str) -> str:
 
 
 # Dispatcher
-def extract_file(path: str) -> str:
+def iter_file_pages(path: str):
+    """Raw text of a file as pages (PDF) or as a single piece (HTML, TXT)."""
+
     ext = os.path.splitext(path)[1].lower()
 
     if ext == ".pdf":
-        return extract_pdf(path)
+        return iter_pdf_pages(path)
     elif ext in [".html", ".htm"]:
-        return extract_html(path)
+        return iter([extract_html(path)])
     elif ext in [".txt"]:
-        return extract_txt(path)
+        return iter([extract_txt(path)])
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
 
+def extract_file(path: str) -> str:
+    return "\n".join(iter_file_pages(path))
+
+
+
+def set_html_parser(name: str):
+    """Select the BeautifulSoup backend (also used as the worker initializer)."""
+    global HTML_PARSER
+    HTML_PARSER = name
+
+
+def process_document(task: dict) -> dict:
+    """Extract, clean and write one raw document. Runs in a worker process."""
 
-def run_extraction():
+    target_hash = hashlib.sha256()
+
+    # Written page by page; the whole text is never held in memory
+    with open(task["output_path"], "w", encoding="utf-8") as out:
+        for piece in clean_pages(iter_file_pages(task["raw_path"])):
+            out.write(piece)
+            target_hash.update(piece.encode("utf-8"))
+
+    # ["id", "source_path", "target_path", "timestamp", "source_hash", "target_hash"]
+    return {
+        "id": task["id"],
+        "source_path": task["raw_path"],
+        "target_path": task["output_path"],
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "source_hash": task["source_hash"],
+        "target_hash": target_hash.hexdigest()
+    }
+
+
+def pending_documents(manifest):
+    """Raw documents never extracted, or whose raw hash changed since their last extraction."""
+
+    for row in list(manifest.raw_docs()):
+        file_id = row["id"]
+        output_path = os.path.join(PROCESSED_BASE, file_id + ".txt")
+        processed = manifest.get_processed(file_id)
+
+        if processed and os.path.exists(output_path) and processed["source_hash"] == row["hash"]:
+            continue  # unchanged since last extraction
+
+        yield {
+            "id": file_id,
+            "raw_path": row["file_path"],
+            "output_path": output_path,
+            "source_hash": row["hash"],
+            "previous_target_hash": processed["target_hash"] if processed else None,
+        }
+
+
+def run_extraction(workers=1, max_in_flight=None, timeout=EXTRACT_TIMEOUT, html_parser=None):
     os.makedirs(PROCESSED_BASE, exist_ok=True)
 
-    with open(METADATA_RAW_PATH, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+    if html_parser:
+        set_html_parser(html_parser)
 
-        for row in reader:
-            raw_path = row["file_path"]
-            file_id = row["id"]
-            source_hash = row["hash"]
-            output_path = os.path.join(PROCESSED_BASE, file_id + ".txt")
+    manifest = Manifest()
+    processed_rows = []
+    changed = []
 
-            if os.path.exists(output_path):
-                # TODO: check hash to see if re-extraction is needed
-                continue  # skip already processed
+    # Results come back in raw-ledger order, so the metadata is written in the same order as a serial run
+    results = ordered_map(
+        process_document, pending_documents(manifest),
+        workers=workers, max_in_flight=max_in_flight, timeout=timeout,
+        initializer=set_html_parser, initargs=(HTML_PARSER,),
+    )
 
-            try:
-                text = extract_file(raw_path)
-                text = clean_text(text)
+    for task, result in results:
+        if isinstance(result, Exception):
+            reason = f"timed out after {timeout}s" if isinstance(result, TaskTimeout) else result
+            print(f"[ETL] Failed to process {task["raw_path"]}: {reason}")
+        else:
+            processed_rows.append(result)
+            print(f"[ETL] Processed: {task["output_path"]}")
 
-                with open(output_path, "w", encoding="utf-8") as out:
-                    out.write(text)
+            # Re-extracted with different text: downstream stages must redo this document
+            if task["previous_target_hash"] and task["previous_target_hash"] != result["target_hash"]:
+                changed.append(task["id"])
 
-                # ["id", "source_path", "target_path", "timestamp", "source_hash", "target_hash"]
-                save_metadata({
-                    "id": file_id,
-                    "source_path": raw_path,
-                    "target_path": output_path,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "source_hash": source_hash,
-                    "target_hash": hashlib.sha256(text.encode("utf-8")).hexdigest()
-                })
+        if len(processed_rows) >= SAVE_BATCH_SIZE:
+            save_metadata(processed_rows, manifest)
+            processed_rows = []
 
-                print(f"[ETL] Processed: {output_path}")
+    save_metadata(processed_rows, manifest)
+    manifest.mark_dirty("chunk", changed)
 
-            except Exception as e:
-                print(f"[ETL] Failed to process {raw_path}: {e}")
+    print(f"[ETL] Changed documents marked for re-chunking: {len(changed)}")
 
 
 if __name__ == "__main__":
-    run_extraction()
+
+    parser = argparse.ArgumentParser(description="Extract and clean the text of the raw documents.")
+    parser.add_argument("--workers", type=int, default=1, help=f"Extraction processes (this machine has {default_workers()} cores).")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Files queued ahead of the writer (default 4 * workers).")
+    parser.add_argument("--timeout", type=int, default=EXTRACT_TIMEOUT, help="Per-file timeout in seconds (0 disables).")
+    parser.add_argument("--html-parser", choices=["html.parser", "lxml"], default=HTML_PARSER, help="BeautifulSoup backend for HTML pages.")
+
+    args = parser.parse_args()
+    run_extraction(workers=args.workers, max_in_flight=args.max_in_flight, timeout=args.timeout, html_parser=args.html_parser)
@@ -0,0 +1,293 @@
+import csv
+import os
+import sqlite3
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+MANIFEST_PATH = os.path.join("data", "manifest.sqlite")
+
+# CSV ledgers kept as append-only exports; imported once into an empty manifest
+LEDGER_PATHS = {
+    "raw_docs": os.path.join("data", "metadata_raw.csv"),
+    "processed_docs": os.path.join("data", "metadata_processed.csv"),
+    "chunks": os.path.join("data", "metadata_chunked.csv"),
+    "embeddings": os.path.join("data", "metadata_embeddings.csv"),
+}
+
+COLUMNS = {
+    "raw_docs": ["id", "title", "source", "url", "timestamp", "file_path", "hash"],
+    "processed_docs": ["id", "source_path", "target_path", "timestamp", "source_hash", "target_hash"],
+    "chunks": ["doc_id", "chunk_id", "chunk_index", "timestamp", "doc_processed_path", "hash"],
+    "chunked_docs": ["doc_id", "target_hash", "timestamp"],
+    "dirty_docs": ["doc_id", "stage", "timestamp"],
+    "embeddings": ["row", "doc_id", "doc_processed_path", "chunk_id", "chunk_hash", "timestamp"],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS raw_docs (
+    id TEXT PRIMARY KEY, title TEXT, source TEXT, url TEXT, timestamp TEXT, file_path TEXT, hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_raw_docs_hash ON raw_docs(hash);
+
+CREATE TABLE IF NOT EXISTS processed_docs (
+    id TEXT PRIMARY KEY, source_path TEXT, target_path TEXT, timestamp TEXT, source_hash TEXT, target_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_processed_docs_source_hash ON processed_docs(source_hash);
+
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT PRIMARY KEY, doc_id TEXT, chunk_index INTEGER, timestamp TEXT, doc_processed_path TEXT, hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks(doc_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_hash ON chunks(hash);
+
+-- target_hash of the processed file each document was last chunked from
+CREATE TABLE IF NOT EXISTS chunked_docs (
+    doc_id TEXT PRIMARY KEY, target_hash TEXT, timestamp TEXT
+);
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    row INTEGER PRIMARY KEY, doc_id TEXT, doc_processed_path TEXT, chunk_id TEXT, chunk_hash TEXT, timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_chunk_hash ON embeddings(chunk_hash);
+CREATE INDEX IF NOT EXISTS idx_embeddings_chunk_id ON embeddings(chunk_id);
+CREATE INDEX IF NOT EXISTS idx_embeddings_doc_id ON embeddings(doc_id);
+
+-- Committed progress of resumable stages (e.g. rows of the embedding store)
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY, value INTEGER
+);
+
+-- Documents that changed upstream and still have to be redone by a stage ("chunk", "embed", "index"),
+-- or whose new vectors still have to be published to the answer cache's doc versions ("version")
+CREATE TABLE IF NOT EXISTS dirty_docs (
+    doc_id TEXT, stage TEXT, timestamp TEXT, PRIMARY KEY (doc_id, stage)
+);
+"""
+
+
+class Manifest:
+    """Single SQLite (WAL) manifest for raw docs, processed docs, chunks and embeddings.
+
+    Replaces the full CSV scans the stages used for dedup and "what's new"
+    checks with indexed lookups. Writes go through ``add`` in one transaction
+    per batch; the CSV ledgers are still appended for humans and older tools.
+    """
+
+    def __init__(self, path=MANIFEST_PATH, ledger_paths=None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+        self.import_ledgers(LEDGER_PATHS if ledger_paths is None else ledger_paths)
+
+    @contextmanager
+    def transaction(self):
+        with self.db:
+            yield self.db
+
+    def close(self):
+        self.db.close()
+
+    # Generic
+
+    def count(self, table):
+        return self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def delete(self, table, column, values):
+        """Delete the rows whose ``column`` is in ``values``, in one transaction."""
+
+        with self.transaction():
+            self.db.executemany(f"DELETE FROM {table} WHERE {column} = ?", ((v,) for v in values))
+
+    def add(self, table, rows):
+        """Insert (or replace by primary key) a batch of rows in one transaction."""
+
+        columns = COLUMNS[table]
+        sql = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        with self.transaction():
+            self.db.executemany(sql, ([row.get(c) for c in columns] for row in rows))
+
+    def import_ledgers(self, ledger_paths):
+        """One-time import of the existing CSV ledgers into empty tables."""
+
+        for table, csv_path in ledger_paths.items():
+            if self.count(table) or not os.path.exists(csv_path):
+                continue
+
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                # Skip header lines repeated by earlier appends
+                rows = (r for r in reader if r.get(reader.fieldnames[0]) != reader.fieldnames[0])
+
+                if table == "embeddings":
+                    # Row i of the ledger is row i of the embedding matrix
+                    rows = ({**r, "row": i} for i, r in enumerate(rows))
+
+                self.add(table, rows)
+
+            print(f"[MANIFEST] Imported {self.count(table)} rows from {csv_path} into '{table}'.")
+
+    # Raw documents
+
+    def has_raw_hash(self, h):
+        return self.db.execute("SELECT 1 FROM raw_docs WHERE hash = ? LIMIT 1", (h,)).fetchone() is not None
+
+    def raw_docs(self):
+        return (dict(r) for r in self.db.execute("SELECT * FROM raw_docs ORDER BY rowid"))
+
+    # Processed documents
+
+    def get_processed(self, doc_id):
+        row = self.db.execute("SELECT * FROM processed_docs WHERE id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def processed_docs(self, page_size=1000):
+        """Processed documents in insertion order, a page at a time (no cursor stays open across writes)."""
+
+        last = 0
+        while True:
+            page = self.db.execute(
+                "SELECT rowid AS _rowid, * FROM processed_docs WHERE rowid > ? ORDER BY rowid LIMIT ?", (last, page_size)
+            ).fetchall()
+            if not page:
+                return
+
+            for r in page:
+                row = dict(r)
+                last = row.pop("_rowid")
+                yield row
+
+    # Chunks
+
+    def chunk_sets(self):
+        """doc_id -> set of chunk_ids, built in a single scan of the chunks table."""
+
+        sets = defaultdict(set)
+        for doc_id, chunk_id in self.db.execute("SELECT doc_id, chunk_id FROM chunks"):
+            sets[doc_id].add(chunk_id)
+        return sets
+
+    def chunk_set(self, doc_id):
+        """Current chunk_ids of one document (indexed by doc_id)."""
+        return {chunk_id for (chunk_id,) in self.db.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))}
+
+    def chunked_hash(self, doc_id):
+        """target_hash of the processed file the document was last chunked from, or None."""
+        row = self.db.execute("SELECT target_hash FROM chunked_docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_chunk(self, chunk_id):
+        row = self.db.execute("SELECT * FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+        return dict(row) if row else None
+
+    # Embeddings
+
+    def has_embedding(self, chunk_id, chunk_hash):
+        """Whether this version of the chunk already has a live embedding row."""
+        return self.db.execute(
+            "SELECT 1 FROM embeddings WHERE chunk_id = ? AND chunk_hash = ? LIMIT 1", (chunk_id, chunk_hash)
+        ).fetchone() is not None
+
+    def commit_embeddings(self, rows, store_rows):
+        """Record a batch of embedding rows and the store's new row count in one transaction."""
+
+        columns = COLUMNS["embeddings"]
+        with self.transaction():
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO embeddings ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                ([row.get(c) for c in columns] for row in rows),
+            )
+            self.db.execute("INSERT OR REPLACE INTO checkpoints (name, value) VALUES ('embedding_rows', ?)", (store_rows,))
+
+    def embedded_keys(self):
+        """``(chunk_id, chunk_hash)`` of every live embedding row."""
+        return {(chunk_id, chunk_hash) for chunk_id, chunk_hash in self.db.execute("SELECT chunk_id, chunk_hash FROM embeddings")}
+
+    def drop_superseded_embeddings(self, rows):
+        """Delete older embedding rows of the given chunks (same chunk_id, other hash).
+
+        Returns the doc_ids that had such rows, i.e. whose indexed vectors are stale.
+        """
+
+        docs = set()
+        with self.transaction():
+            for row in rows:
+                cursor = self.db.execute(
+                    "DELETE FROM embeddings WHERE chunk_id = ? AND chunk_hash != ?", (row["chunk_id"], row["chunk_hash"])
+                )
+                if cursor.rowcount:
+                    docs.add(row["doc_id"])
+        return docs
+
+    def embedding_rows_since(self, row):
+        """chunk_id -> committed embedding row, for the rows from ``row`` on."""
+        return dict(self.db.execute("SELECT chunk_id, row FROM embeddings WHERE row >= ? ORDER BY row", (row,)))
+
+    def live_embedding_rows(self):
+        """Rows of the embedding store that still belong to a current chunk."""
+        return {r for (r,) in self.db.execute("SELECT row FROM embeddings")}
+
+    # Checkpoints
+
+    def get_checkpoint(self, name):
+        row = self.db.execute("SELECT value FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, name, value):
+        with self.transaction():
+            self.db.execute("INSERT OR REPLACE INTO checkpoints (name, value) VALUES (?, ?)", (name, value))
+
+    # Dirty markers
+
+    def mark_dirty(self, stage, doc_ids):
+        now = datetime.now(timezone.utc).isoformat()
+        self.add("dirty_docs", ({"doc_id": d, "stage": stage, "timestamp": now} for d in doc_ids))
+
+    def dirty_docs(self, stage):
+        return {d for (d,) in self.db.execute("SELECT doc_id FROM dirty_docs WHERE stage = ?", (stage,))}
+
+    def clear_dirty(self, stage, doc_ids):
+        with self.transaction():
+            self.db.executemany(
+                "DELETE FROM dirty_docs WHERE doc_id = ? AND stage = ?", ((d, stage) for d in doc_ids)
+            )
+
+
+def append_ledger(csv_path, fieldnames, rows):
+    """Append rows to a CSV ledger in one open, writing the header only for a new file."""
+
+    if not rows:
+        return
+
+    if os.path.dirname(csv_path):
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+
+    file_exists = os.path.exists(csv_path) and os.path.getsize(csv_path) > 0
+
+    with open(csv_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        if not file_exists:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def truncate_ledger(csv_path, n_rows):
+    """Keep the header and the first ``n_rows`` rows of a CSV ledger (one line per row)."""
+
+    if not os.path.exists(csv_path):
+        return
+
+    with open(csv_path, "r+b") as f:
+        for _ in range(n_rows + 1):
+            if not f.readline():
+                return
+        f.truncate(f.tell())
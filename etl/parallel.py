@@ -0,0 +1,82 @@
+import os
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise TaskTimeout()
+
+
+def call_with_timeout(func, item, timeout):
+    """Run ``func(item)``, raising ``TaskTimeout`` after ``timeout`` seconds (SIGALRM, Unix only).
+
+    The alarm fires between Python bytecodes, so a call stuck inside a single
+    C function is only interrupted once it returns to the interpreter.
+    """
+
+    if not timeout or not hasattr(signal, "SIGALRM"):
+        return func(item)
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(max(1, int(timeout)))
+    try:
+        return func(item)
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _run_task(args):
+    func, item, timeout = args
+    return call_with_timeout(func, item, timeout)
+
+
+def ordered_map(func, items, workers=1, max_in_flight=None, timeout=None, initializer=None, initargs=()):
+    """Apply ``func`` to ``items`` in worker processes, yielding ``(item, result)`` in input order.
+
+    At most ``max_in_flight`` tasks (default ``4 * workers``) are submitted
+    ahead of the one being consumed, so memory stays bounded on long inputs.
+    A task that raises, or runs past ``timeout`` seconds, yields its exception
+    as the result. ``workers <= 1`` runs everything in the calling process.
+    ``func`` must be a picklable module-level function.
+    """
+
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+
+        for item in items:
+            try:
+                yield item, call_with_timeout(func, item, timeout)
+            except Exception as e:
+                yield item, e
+        return
+
+    max_in_flight = max(workers, max_in_flight or 4 * workers)
+    in_flight = deque()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        for item in items:
+            in_flight.append((item, pool.submit(_run_task, (func, item, timeout))))
+
+            if len(in_flight) >= max_in_flight:
+                yield _result(*in_flight.popleft())
+
+        while in_flight:
+            yield _result(*in_flight.popleft())
+
+
+def _result(item, future):
+    try:
+        return item, future.result()
+    except Exception as e:
+        return item, e
+
+
+def default_workers():
+    return os.cpu_count() or 1
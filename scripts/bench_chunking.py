@@ -0,0 +1,93 @@
+"""Chunking throughput in tokens/sec: batched single-pass chunker vs per-text re-counting.
+
+The baseline reproduces the previous chunker's tokenizer calls: one encode
+per paragraph, one per sentence of long paragraphs and one more per finished
+chunk. Both run over the same synthetic documents.
+
+    python scripts/bench_chunking.py --docs 200 --paragraphs 80
+    python scripts/bench_chunking.py --tokenizer Amanda/bge_portuguese_v4
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+import etl_chunking
+from etl_chunking import chunk_paragraphs, count_tokens, set_tokenizer, split_into_sentences
+
+
+WORDS = (
+    "o tribunal decide que a decisão recorrida viola o artigo da constituição e o direito "
+    "de defesa do arguido pelo que se concede provimento ao recurso nos termos da lei"
+).split()
+
+
+def make_documents(n_docs, n_paragraphs, seed=0):
+    rng = random.Random(seed)
+
+    def sentence():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))).capitalize() + "."
+
+    # Mostly short paragraphs, a few over the chunk size
+    return [
+        [" ".join(sentence() for _ in range(rng.choice([1, 2, 3, 4, 60]))) for _ in range(n_paragraphs)]
+        for _ in range(n_docs)
+    ]
+
+
+def legacy_chunk(paragraphs, max_tokens):
+    chunks = []
+    current, current_tokens = [], 0
+
+    for para in paragraphs:
+        paragraph_tokens = count_tokens(para)
+
+        units = [para] if paragraph_tokens <= max_tokens else split_into_sentences(para)
+        counts = [paragraph_tokens] if paragraph_tokens <= max_tokens else [count_tokens(s) for s in units]
+
+        for unit, n in zip(units, counts):
+            if current and current_tokens + n > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += n
+
+    if current:
+        chunks.append("\n\n".join(current))
+
+    return [(c, count_tokens(c)) for c in chunks]
+
+
+def run_bench(n_docs, n_paragraphs, max_tokens, overlap, tokenizer):
+    set_tokenizer(tokenizer)
+    documents = make_documents(n_docs, n_paragraphs)
+
+    total_tokens = sum(len(ids) for doc in documents for ids in etl_chunking.encode_batch(doc))
+    print(f"{n_docs} documents, {total_tokens} tokens, tokenizer: {tokenizer or etl_chunking.TIKTOKEN_ENCODING}")
+
+    for name, chunk in [
+        ("per-text count_tokens", lambda doc: legacy_chunk(doc, max_tokens)),
+        ("batched, offsets + recount", lambda doc: chunk_paragraphs(doc, max_tokens, overlap)),
+    ]:
+        t0 = time.perf_counter()
+        n_chunks = sum(len(chunk(doc)) for doc in documents)
+        elapsed = time.perf_counter() - t0
+
+        print(f"{name:>24}: {elapsed:7.2f}s  {total_tokens / elapsed:12,.0f} tokens/s  {n_chunks} chunks")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark chunking throughput.")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=80, help="Paragraphs per document.")
+    parser.add_argument("--max-tokens", type=int, default=etl_chunking.MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--tokenizer", type=str, default=None, help="Hugging Face tokenizer (default: tiktoken).")
+
+    args = parser.parse_args()
+    run_bench(args.docs, args.paragraphs, args.max_tokens, args.overlap, args.tokenizer)
@@ -0,0 +1,91 @@
+"""Benchmark of the chunking dispatcher's "what needs chunking" pass.
+
+Fills a throwaway manifest with N chunks (10 per document), changes the
+target_hash of 1% of the documents and times ``plan_chunking``, which pages
+through the processed documents and looks up each one's hash (and, when it
+changed, its chunk set) by index. The old per-document ``any()`` scan over
+the chunk ledger is timed too, up to ``--legacy-max`` chunks, since it is
+quadratic.
+
+    python scripts/bench_chunking_dispatch.py --sizes 1000 10000 100000 1000000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+from manifest import Manifest
+from etl_chunking import plan_chunking
+
+
+CHUNKS_PER_DOC = 10
+
+
+def fill_manifest(manifest, n_chunks):
+    n_docs = max(1, n_chunks // CHUNKS_PER_DOC)
+
+    processed_rows = []
+    chunk_rows = []
+    chunked_docs_rows = []
+
+    for d in range(n_docs):
+        doc_id = f"doc{d}"
+        # 1% of the documents changed since they were chunked
+        target_hash = f"h{d}" + ("-new" if d % 100 == 0 else "")
+
+        processed_rows.append({"id": doc_id, "target_path": f"{doc_id}.txt", "target_hash": target_hash})
+        chunked_docs_rows.append({"doc_id": doc_id, "target_hash": f"h{d}"})
+        chunk_rows.extend(
+            {"doc_id": doc_id, "chunk_id": f"{doc_id}_{i}", "chunk_index": i, "hash": f"{doc_id}_{i}"}
+            for i in range(CHUNKS_PER_DOC)
+        )
+
+    manifest.add("processed_docs", processed_rows)
+    manifest.add("chunks", chunk_rows)
+    manifest.add("chunked_docs", chunked_docs_rows)
+
+    return processed_rows, chunk_rows
+
+
+def legacy_plan(processed_rows, chunk_rows):
+    return [row for row in processed_rows if not any(chunk["doc_id"] == row["id"] for chunk in chunk_rows)]
+
+
+def run_bench(sizes, legacy_max):
+    print(f"{'chunks':>10} {'plan (s)':>10} {'us/chunk':>10} {'to chunk':>10} {'legacy (s)':>11}")
+
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = Manifest(os.path.join(tmp, "manifest.sqlite"), ledger_paths={})
+            processed_rows, chunk_rows = fill_manifest(manifest, n)
+
+            counts = {"up_to_date": 0, "to_chunk": 0}
+            t0 = time.perf_counter()
+            for _ in plan_chunking(manifest.processed_docs(), manifest.chunk_set, manifest.chunked_hash, set(), [], counts):
+                pass
+            t1 = time.perf_counter()
+
+            legacy = "-"
+            if n <= legacy_max:
+                t3 = time.perf_counter()
+                legacy_plan(processed_rows, chunk_rows)
+                legacy = f"{time.perf_counter() - t3:.3f}"
+
+            manifest.close()
+
+        print(f"{n:>10} {t1 - t0:>10.3f} {(t1 - t0) / n * 1e6:>10.2f} {counts['to_chunk']:>10} {legacy:>11}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the chunking dispatcher's skip check.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=10_000, help="Largest size to run the quadratic scan on.")
+
+    args = parser.parse_args()
+    run_bench(args.sizes, args.legacy_max)
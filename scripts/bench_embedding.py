@@ -0,0 +1,90 @@
+"""CPU embedding throughput in chunks/sec: one process vs N worker processes.
+
+Both paths encode the same synthetic chunks with the functions used by
+etl_embedding: the single process runs with all cores, each worker gets
+``cores // workers`` threads.
+
+    python scripts/bench_embedding.py --chunks 2000 --workers 1 2 4
+    python scripts/bench_embedding.py --model-name Amanda/bge_portuguese_v4 --batch-size 32
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+import etl_embedding
+from parallel import ordered_map, default_workers
+
+
+WORDS = (
+    "o tribunal decide que a decisão recorrida viola o artigo da constituição e o direito "
+    "de defesa do arguido pelo que se concede provimento ao recurso nos termos da lei"
+).split()
+
+
+def make_chunks(n_chunks, words_per_chunk, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_chunk)) for _ in range(n_chunks)]
+
+
+def batches_of(texts, batch_size):
+    return [(texts[i:i + batch_size], None) for i in range(0, len(texts), batch_size)]
+
+
+def run_single(model_name, texts, batch_size):
+    torch.set_num_threads(default_workers())
+    model = SentenceTransformer(model_name, device="cpu")
+    model.eval()
+
+    t0 = time.perf_counter()
+    for batch, _ in batches_of(texts, batch_size):
+        etl_embedding.embed_features(model, model.tokenize(batch))
+    return time.perf_counter() - t0
+
+
+def run_workers(model_name, texts, batch_size, workers):
+    threads = max(1, default_workers() // workers)
+
+    # Model loading happens in the initializer; start the clock once the first batch returns
+    results = ordered_map(
+        etl_embedding.encode_batch, batches_of(texts, batch_size), workers=workers, max_in_flight=2 * workers,
+        initializer=etl_embedding.init_worker, initargs=(model_name, "cpu", batch_size, threads),
+    )
+
+    next(results)
+    t0 = time.perf_counter()
+    for _ in results:
+        pass
+    return time.perf_counter() - t0, len(texts) - batch_size
+
+
+def run_bench(model_name, n_chunks, words_per_chunk, batch_size, workers_list):
+    texts = make_chunks(n_chunks, words_per_chunk)
+    print(f"{n_chunks} chunks of {words_per_chunk} words, model {model_name}, {default_workers()} cores")
+
+    elapsed = run_single(model_name, texts, batch_size)
+    print(f"{'single process':>16}: {elapsed:7.2f}s  {n_chunks / elapsed:8.1f} chunks/s")
+
+    for workers in workers_list:
+        elapsed, n_timed = run_workers(model_name, texts, batch_size, workers)
+        print(f"{f'{workers} workers':>16}: {elapsed:7.2f}s  {n_timed / elapsed:8.1f} chunks/s")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark CPU embedding throughput.")
+    parser.add_argument("--model-name", type=str, default="Amanda/bge_portuguese_v4")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=200, help="Words per chunk.")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+
+    args = parser.parse_args()
+    run_bench(args.model_name, args.chunks, args.words, args.batch_size, args.workers)
@@ -0,0 +1,76 @@
+"""Memory and recall@k of the quantized indexes (int8 / binary) against exact float search.
+
+Queries are corpus rows with a little noise; the reference is the exact
+cosine top-k over the float vectors. Each kind is measured on its coarse
+scores alone and with exact rescoring of ``k * rerank_factor`` rows.
+
+    python scripts/bench_quantized.py                       # ETL embedding store
+    python scripts/bench_quantized.py --synthetic 200000    # clustered random vectors
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from etl_ann_index import exact_search, load_embeddings
+from api.db.ann_index import recall_at_k
+from api.db.quantized_index import KINDS, QuantizedIndex
+
+
+def synthetic_embeddings(n, dim, n_clusters=256, seed=0):
+    """Clustered vectors, closer to sentence embeddings than isotropic noise."""
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, n_clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def run_bench(embeddings, k, n_queries, rerank_factors, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(embeddings.shape[0], min(n_queries, embeddings.shape[0]), replace=False))
+    queries = np.asarray(embeddings[rows], dtype=np.float32)
+    queries += 0.1 * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(queries.shape[1]) * rng.standard_normal(queries.shape)
+
+    n, dim = embeddings.shape
+    exact = exact_search(embeddings, queries, k)
+    print(f"{n} vectors of dim {dim}, float32 {n * dim * 4 / 2**20:.1f} MiB, recall@{k} over {len(queries)} queries")
+    print(f"{'kind':>7} {'MiB':>8} {'ratio':>6} {'rerank':>7} {'recall':>7} {'ms/query':>9}")
+
+    for kind in KINDS:
+        index = QuantizedIndex(dim, kind)
+        index.train(np.asarray(embeddings[:100_000]))
+        index.add(embeddings)
+
+        mib = index.nbytes / 2**20
+        ratio = n * dim * 4 / index.nbytes
+
+        for factor in [0] + rerank_factors:
+            start = time.perf_counter()
+            if factor:
+                ids, _ = index.search(queries, k, rerank_vectors=embeddings, rerank_factor=factor)
+            else:
+                ids, _ = index.search(queries, k)
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            label = f"x{factor}" if factor else "none"
+            print(f"{kind:>7} {mib:>8.1f} {ratio:>5.1f}x {label:>7} {recall_at_k(ids, exact, k):>7.3f} {ms:>9.2f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark int8 / binary quantized search.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N clustered random vectors instead of the store")
+    parser.add_argument("--dim", type=int, default=1024, help="Dimension of the synthetic vectors")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rerank-factor", type=int, nargs="+", default=[4, 10, 40])
+
+    args = parser.parse_args()
+    embeddings = synthetic_embeddings(args.synthetic, args.dim) if args.synthetic else load_embeddings()
+    run_bench(embeddings, args.k, args.queries, args.rerank_factor)
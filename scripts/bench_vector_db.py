@@ -0,0 +1,88 @@
+"""Chroma load throughput in chunks/sec: sequential ``add`` with per-row lists vs the pipelined bulk loader.
+
+Runs against a local Chroma server (``chroma run --port 8001``) with synthetic
+vectors; every run loads a fresh collection that is deleted afterwards.
+
+    python scripts/bench_vector_db.py --chunks 20000 --in-flight 1 4 8
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from chromadb import HttpClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import build_vector_db
+from build_vector_db import METADATA_FIELDS, bulk_load, iter_batches
+
+
+def make_data(n_chunks, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((n_chunks, dim)).astype(np.float32)
+
+    columns = {
+        "row": list(range(n_chunks)),
+        "doc_id": [f"doc{i // 20}" for i in range(n_chunks)],
+        "doc_processed_path": [f"data/processed/doc{i // 20}.txt" for i in range(n_chunks)],
+        "chunk_id": [f"doc{i // 20}_{i % 20}" for i in range(n_chunks)],
+        "chunk_hash": [f"{i:064x}" for i in range(n_chunks)],
+        "timestamp": ["2025-01-01T00:00:00"] * n_chunks,
+    }
+    contents = {chunk_id: "o tribunal decide " * 60 for chunk_id in columns["chunk_id"]}
+
+    return embeddings, columns, contents
+
+
+def legacy_load(collection, embeddings, columns, contents, batch_size):
+    df = pd.DataFrame(columns)
+
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size]
+        collection.add(
+            ids=batch["chunk_id"].tolist(),
+            embeddings=embeddings[start:start + batch_size].tolist(),
+            metadatas=batch.apply(lambda r: {field: r[field] for field in METADATA_FIELDS}, axis=1).tolist(),
+            documents=[contents[c] for c in batch["chunk_id"]],
+        )
+
+
+def timed(client, name, load):
+    collection = client.create_collection(name="bench_load", metadata={"hnsw:space": "cosine"})
+    try:
+        t0 = time.perf_counter()
+        load(collection)
+        return time.perf_counter() - t0
+    finally:
+        client.delete_collection("bench_load")
+
+
+def run_bench(host, port, n_chunks, dim, batch_size, in_flight_list):
+    client = HttpClient(host=host, port=port)
+    embeddings, columns, contents = make_data(n_chunks, dim)
+    print(f"{n_chunks} chunks, dim {dim}, batch size {batch_size}, Chroma at {host}:{port}")
+
+    elapsed = timed(client, "legacy", lambda c: legacy_load(c, embeddings, columns, contents, batch_size))
+    print(f"{'sequential add':>22}: {elapsed:7.2f}s  {n_chunks / elapsed:9.1f} chunks/s")
+
+    for in_flight in in_flight_list:
+        elapsed = timed(client, "bulk", lambda c: bulk_load(c, iter_batches(embeddings, columns, contents, batch_size), in_flight))
+        print(f"{f'bulk, {in_flight} in flight':>22}: {elapsed:7.2f}s  {n_chunks / elapsed:9.1f} chunks/s")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark loading vectors into Chroma.")
+    parser.add_argument("--host", type=str, default=build_vector_db.CHROMA_HOST)
+    parser.add_argument("--port", type=int, default=build_vector_db.CHROMA_PORT)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=build_vector_db.BATCH_SIZE)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8])
+
+    args = parser.parse_args()
+    run_bench(args.host, args.port, args.chunks, args.dim, args.batch_size, args.in_flight)
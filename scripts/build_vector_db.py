@@ -1,6 +1,11 @@
 import os
+import csv
+import sys
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import numpy as np
-import pandas as pd
 
 from tqdm import tqdm
 import json
@@ -11,10 +16,26 @@ from sentence_transformers import SentenceTransformer
 from chromadb import HttpClient
 from chromadb.config import Settings
 
-EMBEDDINGS_NPY_PATH = os.path.join("data", "embeddings", "embeddings.npy")
+# Live embedding rows and dirty documents come from the ETL manifest
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+from manifest import Manifest
+from doc_metadata import read_doc_metadata, update_doc_versions
+
+# Embedding store reader shared with the API
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from api.db.chunk_store import ChunkStore
+from api.db.embedding_store import open_embeddings
+
+EMBEDDINGS_STORE_PATH = os.path.join("data", "embeddings", "store")
+EMBEDDINGS_NPY_PATH = os.path.join("data", "embeddings", "embeddings.npy")  # legacy single-file matrix
 METADATA_EMBEDDINGS_PATH = os.path.join("data", "metadata_embeddings.csv")
 
-CHUNKS_CSV_PATH = os.path.join("data", "chunked", "chunks.csv")
+CHUNK_STORE_PATH = os.path.join("data", "chunked", "store")
+CHUNKS_CSV_PATH = os.path.join("data", "chunked", "chunks.csv")  # legacy, scanned when there is no chunk store
+
+# Read by the API's semantic answer cache to drop answers built on changed documents
 
 CHROMA_HOST = "localhost"
 CHROMA_PORT = 8001
@@ -22,6 +43,15 @@ COLLECTION_NAME = "legal_chunks"
 
 BATCH_SIZE = 128
 
+# Concurrent upserts to the Chroma server and retries of a failed one
+MAX_IN_FLIGHT = 4
+MAX_RETRIES = 3
+
+# IDs fetched per page when listing the collection
+ID_PAGE_SIZE = 10000
+
+METADATA_FIELDS = ["doc_id", "doc_processed_path", "chunk_id", "chunk_hash", "timestamp"]
+
 def connect_to_chroma():
     """Initialize Chroma HTTP client."""
     client = HttpClient(
@@ -31,12 +61,6 @@ def connect_to_chroma():
     )
     return client
 
-def load_data():
-    embeddings = np.load(EMBEDDINGS_NPY_PATH)
-    df = pd.read_csv(METADATA_EMBEDDINGS_PATH, dtype=str)
-
-    return embeddings, df
-
 def build_collection(client):
     """Create or get a Chroma collection."""
     try:
@@ -51,76 +75,190 @@ def build_collection(client):
 
     return collection
 
-def existing_ids(collection):
-    """Fetch existing document IDs to avoid duplicates."""
+def existing_ids(collection, page_size=ID_PAGE_SIZE):
+    """IDs already in the collection, fetched page by page without metadata, documents or vectors."""
+
+    ids = set()
+    offset = 0
+
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)["ids"]
+        ids.update(page)
+
+        if len(page) < page_size:
+            return ids
+        offset += page_size
+
+
+def new_rows(live_rows, existing):
+    """Columns (store row, then ``METADATA_FIELDS``) of the live ledger rows whose chunk is not in the collection.
+
+    The ledger is streamed: line ``i`` describes row ``i`` of the embedding store.
+    """
+
+    columns = {"row": [], **{field: [] for field in METADATA_FIELDS}}
+
+    with open(METADATA_EMBEDDINGS_PATH, "r", newline="", encoding="utf-8") as f:
+        for row, record in enumerate(csv.DictReader(f)):
+            if row not in live_rows or record["chunk_id"] in existing:
+                continue
+
+            columns["row"].append(row)
+            for field in METADATA_FIELDS:
+                columns[field].append(record[field] or "")
+
+    return columns
+
+
+def chunk_contents(chunk_ids):
+    """Current content of the given chunks, looked up in the chunk store (legacy: streamed from the chunks CSV)."""
+
+    if os.path.isdir(CHUNK_STORE_PATH):
+        chunk_store = ChunkStore(CHUNK_STORE_PATH)
+        try:
+            return chunk_store.contents(chunk_ids)
+        finally:
+            chunk_store.close()
+
+    contents = {}
+
+    with open(CHUNKS_CSV_PATH, "r", newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            if record["chunk_id"] in chunk_ids:
+                contents[record["chunk_id"]] = record["content"]
+
+    return contents
+
+
+def with_filters(metadata, doc_metadata):
+    """Chunk metadata plus the filterable fields of its document (Chroma ``where`` on source / court / date)."""
+    return {**metadata, **doc_metadata.get(metadata["doc_id"], {"source": "", "court": "", "date": 0, "date_end": 0})}
 
-    try:
-        data = collection.get(include=["metadatas"])
-        return set(data.get("ids", []))
-    except Exception:
-        return set()
 
+def iter_batches(embeddings, columns, contents, batch_size=BATCH_SIZE, doc_metadata=None):
+    """Keyword arguments of ``collection.upsert`` for each batch, built column-wise."""
 
-def create_db():
+    rows = np.asarray(columns["row"], dtype=np.int64)
+    doc_metadata = doc_metadata or {}
+
+    for start in range(0, len(rows), batch_size):
+        end = start + batch_size
+        ids = columns["chunk_id"][start:end]
+
+        yield {
+            "ids": ids,
+            "embeddings": np.asarray(embeddings[rows[start:end]], dtype=np.float32),
+            "metadatas": [
+                with_filters(dict(zip(METADATA_FIELDS, values)), doc_metadata)
+                for values in zip(*(columns[field][start:end] for field in METADATA_FIELDS))
+            ],
+            "documents": [contents.get(chunk_id, "") for chunk_id in ids],
+        }
+
+
+def upsert_with_retry(collection, batch, retries=MAX_RETRIES):
+    """Upsert one batch; upserts are idempotent, so a batch is simply re-sent after a failure."""
+
+    for attempt in range(retries + 1):
+        try:
+            collection.upsert(**batch)
+            return len(batch["ids"])
+
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"Upsert of {len(batch['ids'])} chunks failed ({e}), retrying.")
+            time.sleep(2 ** attempt)
+
+
+def bulk_load(collection, batches, max_in_flight=MAX_IN_FLIGHT, retries=MAX_RETRIES):
+    """Upsert the batches with up to ``max_in_flight`` requests outstanding; returns the chunks loaded."""
+
+    loaded = 0
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool, tqdm(unit="chunks") as progress:
+        pending = set()
+
+        for batch in batches:
+            # Bounded: batches are built only as fast as the server takes them
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    n = future.result()
+                    loaded += n
+                    progress.update(n)
+
+            pending.add(pool.submit(upsert_with_retry, collection, batch, retries))
+
+        for future in pending:
+            n = future.result()
+            loaded += n
+            progress.update(n)
+
+    return loaded
+
+
+def backfill_filters(collection, doc_metadata, page_size=ID_PAGE_SIZE):
+    """Rewrite the filter fields of records loaded without them or with outdated values (pages through every metadata once)."""
+
+    updated = 0
+    offset = 0
+
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+
+        current = [(chunk_id, m, with_filters(m, doc_metadata)) for chunk_id, m in zip(page["ids"], page["metadatas"])]
+        stale = [(chunk_id, new) for chunk_id, m, new in current if new != m]
+        if stale:
+            collection.update(ids=[c for c, _ in stale], metadatas=[new for _, new in stale])
+            updated += len(stale)
+
+        if len(page["ids"]) < page_size:
+            return updated
+        offset += page_size
+
+
+def create_db(batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT, page_size=ID_PAGE_SIZE, backfill=False):
 
     client = connect_to_chroma()
 
-    embeddings, df = load_data()
+    manifest = Manifest()
+
+    embeddings = open_embeddings(EMBEDDINGS_STORE_PATH if os.path.isdir(EMBEDDINGS_STORE_PATH) else EMBEDDINGS_NPY_PATH)
 
     collection = build_collection(client)
+    doc_metadata = read_doc_metadata()
+
+    if backfill:
+        print(f"Added filter metadata to {backfill_filters(collection, doc_metadata, page_size)} existing records.")
 
-    existing = existing_ids(collection)
-    # existing = set(["68278f2581cbc78d2015c3fe54d4d337c7d9e5ac39879bfdbc6f24c1fcf2b6a5.html_1"])
+    # Documents changed upstream: drop their vectors, their live rows are re-added below
+    dirty = manifest.dirty_docs("index")
+    if dirty:
+        collection.delete(where={"doc_id": {"$in": sorted(dirty)}})
+        print(f"Removed the vectors of {len(dirty)} changed documents.")
 
-    # Select rows not yet in DB
-    new_rows_idx = df.index[~df["chunk_id"].isin(existing)].tolist()
-    new_rows = df.iloc[new_rows_idx].reset_index(drop=True)
+    # Rows superseded by a re-embedded chunk version are not loaded
+    columns = new_rows(manifest.live_embedding_rows(), existing_ids(collection, page_size))
 
-    # For each row not yet in DB (i.e., each new chunk), get the chunk content
-    df_content = pd.read_csv(CHUNKS_CSV_PATH, dtype=str)
-    # print(df_content.columns)
-    # df_content = df_content.to_dict(orient="records")
-    df_content = df_content.loc[ new_rows_idx, ["content"] ].reset_index(drop=True)
+    if not columns["row"]:
+        print("Nothing new to insert.")
 
+        if dirty:
+            update_doc_versions(dirty)
 
+    else:
+        contents = chunk_contents(set(columns["chunk_id"]))
 
+        start = time.perf_counter()
+        loaded = bulk_load(collection, iter_batches(embeddings, columns, contents, batch_size, doc_metadata), max_in_flight)
+        elapsed = time.perf_counter() - start
 
-    insert = True
-    if not len(new_rows):
+        print(f"Insertion complete! {loaded} chunks in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.1f} chunks/s)")
 
-        print("Nothing new to insert.")
-        insert = False
-    
-
-    if insert:
-        # Insert batch-by-batch
-        for start in tqdm(range(0, len(new_rows), BATCH_SIZE)):
-            end = start + BATCH_SIZE
-
-            batch = new_rows.iloc[start:end]
-            batch_embeddings = embeddings[ new_rows_idx[start:end] ]
-            batch_content = df_content.iloc[start:end]
-
-            # batch_embeddings = embeddings[ batch["embedding_index"].values.astype(int)]
-
-            collection.add(
-
-                ids=batch["chunk_id"].tolist(),
-                
-                embeddings=batch_embeddings.tolist(),
-                
-                metadatas=batch.apply(lambda r: {
-                    "doc_id": r["doc_id"],
-                    "doc_processed_path": r["doc_processed_path"],
-                    "chunk_id": r["chunk_id"],
-                    "chunk_hash": r["chunk_hash"],
-                    "timestamp": r["timestamp"]
-                }, axis=1).tolist(),
-                
-                documents=batch_content["content"].tolist()
-            )
-
-        print("Insertion complete!")    
+        update_doc_versions(set(columns["doc_id"]) | dirty)
+
+    manifest.clear_dirty("index", dirty)
 
     # Test retrieval
     print("Performing a test query:")
@@ -145,4 +283,12 @@ João Grilo Amaral")
 
 
 if __name__ == "__main__":
-    create_db()
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Load new embeddings into the Chroma collection.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Chunks per upsert request")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="Concurrent upsert requests")
+    parser.add_argument("--page-size", type=int, default=ID_PAGE_SIZE, help="IDs per page when listing the collection")
+    parser.add_argument("--backfill-filters", action="store_true", help="Add or correct source / court / date / date_end of records already loaded")
+
+    args = parser.parse_args()
+    create_db(args.batch_size, args.max_in_flight, args.page_size, args.backfill_filters)
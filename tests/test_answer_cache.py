@@ -0,0 +1,65 @@
+import numpy as np
+
+from api.utils.answer_cache import SemanticAnswerCache
+
+
+CHUNKS = [{"chunk_id": "doc1_0", "distance": 0.1, "metadata": {"doc_id": "doc1"}, "snippet": "..."}]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_paraphrase_hits_above_threshold():
+    cache = SemanticAnswerCache(max_size=4, threshold=0.95)
+    cache.put(vector(1, 0, 0), top_k=5, response="resposta", chunks=CHUNKS)
+
+    assert cache.get(vector(0.99, 0.05, 0), top_k=5)["response"] == "resposta"
+    assert cache.get(vector(0, 1, 0), top_k=5) is None
+    assert cache.get(vector(1, 0, 0), top_k=3) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_invalidated_when_document_version_changes():
+    versions = {"doc1": "v1"}
+    cache = SemanticAnswerCache(max_size=4, doc_versions=lambda ids: {i: versions.get(i, "") for i in ids})
+    cache.put(vector(1, 0), top_k=5, response="resposta", chunks=CHUNKS)
+
+    assert cache.get(vector(1, 0), top_k=5) is not None
+
+    versions["doc1"] = "v2"
+    assert cache.get(vector(1, 0), top_k=5) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_ttl_and_explicit_invalidation():
+    clock = FakeClock()
+    cache = SemanticAnswerCache(max_size=4, ttl_seconds=10, clock=clock)
+    cache.put(vector(1, 0), top_k=5, response="a", chunks=CHUNKS)
+    cache.put(vector(0, 1), top_k=5, response="b", chunks=[])
+
+    cache.invalidate_docs(["doc1"])
+    assert cache.get(vector(1, 0), top_k=5) is None
+
+    clock.now += 20
+    assert cache.get(vector(0, 1), top_k=5) is None
+
+
+def test_lru_slot_reused_when_full():
+    cache = SemanticAnswerCache(max_size=2)
+    cache.put(vector(1, 0, 0), top_k=5, response="a", chunks=[])
+    cache.put(vector(0, 1, 0), top_k=5, response="b", chunks=[])
+    cache.get(vector(1, 0, 0), top_k=5)
+    cache.put(vector(0, 0, 1), top_k=5, response="c", chunks=[])
+
+    assert cache.get(vector(0, 1, 0), top_k=5) is None
+    assert cache.get(vector(1, 0, 0), top_k=5)["response"] == "a"
+    assert cache.get(vector(0, 0, 1), top_k=5)["response"] == "c"
@@ -0,0 +1,44 @@
+import numpy as np
+
+from api.db.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+CORPUS = [
+    ("a_0", "Nos termos do artigo 94.º, n.º 2 do Código de Processo Penal, o texto foi revisto."),
+    ("b_0", "O Acórdão 587/2024 do Tribunal Constitucional decidiu sobre direitos fundamentais."),
+    ("c_0", "O tribunal aprecia o direito fundamental de defesa do arguido."),
+    ("d_0", "Contratos de crédito ao consumo e cláusulas abusivas."),
+]
+
+
+def test_tokenize_folds_accents_and_keeps_citations():
+    assert tokenize("artigo 94º, nº 2") == ["artigo", "94", "2"]
+    assert tokenize("Acórdão 587/2024") == ["acordao", "587/2024", "587", "2024"]
+    assert tokenize("Art. 5.º das decisões") == ["artigo", "5", "decisao"]
+
+
+def test_search_ranks_exact_citations_first(tmp_path):
+    index = BM25Index.build(CORPUS)
+
+    ids, scores = index.search("acórdão 587/2024", k=3)
+    assert ids[0] == "b_0"
+    assert np.all(np.diff(scores) <= 0)
+
+    assert index.search("art. 94º, nº 2 CPP", k=1)[0] == ["a_0"]
+    # Plurals fold to the singular
+    assert set(index.search("direitos fundamentais", k=4)[0]) == {"b_0", "c_0"}
+    assert index.search("inexistente", k=4)[0] == []
+
+    index.save(str(tmp_path / "bm25.npz"))
+    loaded = BM25Index.load(str(tmp_path / "bm25.npz"))
+
+    assert loaded.chunk_ids == index.chunk_ids
+    np.testing.assert_allclose(loaded.scores("crédito abusivo"), index.scores("crédito abusivo"))
+
+
+def test_reciprocal_rank_fusion():
+    dense = ["x", "y", "z"]
+    lexical = ["z", "w"]
+
+    # z is in both lists; y and w tie at rank 2 and the first seen comes first
+    assert reciprocal_rank_fusion([dense, lexical], k=60) == ["z", "x", "y", "w"]
@@ -0,0 +1,42 @@
+import hashlib
+import json
+
+from api.db.chunk_store import ChunkStore
+
+
+def chunk(doc_id, i, content, tokens=3):
+    return {"doc_id": doc_id, "chunk_id": f"{doc_id}_{i}", "content": content, "tokens": tokens}
+
+
+def test_put_get_replace_and_remove(tmp_path):
+    store = ChunkStore(str(tmp_path / "store"))
+    store.put([chunk("a", 0, "primeiro"), chunk("a", 1, "ação"), chunk("b", 0, "outro")])
+
+    # A re-chunked document stores new versions; the old bytes stay but are unreferenced
+    store.put([chunk("a", 0, "primeiro, revisto", tokens=5)])
+    store.remove(["a_1"])
+    store.set_embedding_rows({"a_0": 7, "missing": 1})
+
+    reopened = ChunkStore(str(tmp_path / "store"))
+    a0 = reopened.get("a_0")
+
+    assert len(reopened) == 2
+    assert a0["content"] == "primeiro, revisto"
+    assert a0["tokens"] == 5
+    assert a0["hash"] == hashlib.sha256("primeiro, revisto".encode("utf-8")).hexdigest()
+    assert a0["embedding_row"] == 7
+    assert reopened.get("b_0")["embedding_row"] is None
+    assert reopened.get("a_1") is None
+    assert reopened.contents(["b_0", "a_1"]) == {"b_0": "outro"}
+    assert [c["chunk_id"] for c in reopened.iter_chunks()] == ["b_0", "a_0"]
+
+
+def test_import_jsonl_keeps_last_version(tmp_path):
+    path = tmp_path / "chunks.jsonl"
+    lines = [chunk("a", 0, "velho"), chunk("a", 1, "um"), chunk("a", 0, "novo")]
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines) + "\n", encoding="utf-8")
+
+    store = ChunkStore(str(tmp_path / "store"))
+
+    assert store.import_jsonl(str(path), batch_size=2) == 3
+    assert store.contents(["a_0", "a_1"]) == {"a_0": "novo", "a_1": "um"}
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("tiktoken")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+import etl_chunking
+from etl_chunking import chunk_paragraphs
+from api.db.chunk_store import ChunkStore
+
+
+@pytest.fixture
+def word_tokenizer(monkeypatch):
+    """One token per whitespace-separated word; records every batch it encodes."""
+
+    calls = []
+
+    def encode_batch(texts):
+        calls.append(list(texts))
+        return word_offsets(texts)
+
+    monkeypatch.setattr(etl_chunking, "_encode_batch", encode_batch)
+    monkeypatch.setattr(etl_chunking, "_separator_tokens", {"\n\n": 0, "\n": 0})
+    return calls
+
+
+def word_offsets(texts):
+    return [[m.start() for m in re.finditer(r"\S+", t)] for t in texts]
+
+
+def words(n, prefix="w"):
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+def test_packs_paragraphs_and_reuses_counts(word_tokenizer):
+    paragraphs = [words(4, "a"), words(4, "b"), words(4, "c"), words(9, "d")]
+
+    chunks = chunk_paragraphs(paragraphs, max_tokens=10)
+
+    assert [text for text, _ in chunks] == [paragraphs[0] + "\n\n" + paragraphs[1], paragraphs[2], paragraphs[3]]
+    assert [tokens for _, tokens in chunks] == [len(text.split()) for text, _ in chunks]
+    # Paragraphs encoded once, in one batch; only the two-paragraph chunk is recounted
+    assert word_tokenizer == [paragraphs, [chunks[0][0]]]
+
+
+def test_long_paragraph_is_split_by_sentence(word_tokenizer):
+    long_para = "Primeira frase longa aqui. Segunda frase longa aqui. Terceira frase."
+
+    chunks = chunk_paragraphs(["Intro.", long_para], max_tokens=5)
+
+    assert [text for text, _ in chunks] == [
+        "Intro.\n\nPrimeira frase longa aqui.",
+        "Segunda frase longa aqui.",
+        "Terceira frase.",
+    ]
+    # The long paragraph is not encoded again per sentence; each finished chunk is recounted once
+    assert word_tokenizer == [["Intro.", long_para]] + [[text] for text, _ in chunks]
+    assert [tokens for _, tokens in chunks] == [5, 4, 2]
+
+
+def test_chunks_are_recounted_before_enforcing_max_tokens(monkeypatch):
+    # Newlines are tokens of their own, but the separator estimate says they are free
+    monkeypatch.setattr(etl_chunking, "_encode_batch", lambda texts: [[m.start() for m in re.finditer(r"\S+|\n", t)] for t in texts])
+    monkeypatch.setattr(etl_chunking, "_separator_tokens", {"\n\n": 0, "\n": 0})
+
+    paragraphs = [words(4, "a"), words(4, "b"), words(2, "c")]
+    chunks = chunk_paragraphs(paragraphs, max_tokens=10)
+
+    # a + b + c is 10 tokens by estimate but 14 once joined: c moves to the next chunk
+    assert chunks == [(paragraphs[0] + "\n\n" + paragraphs[1], 10), (paragraphs[2], 2)]
+
+
+def test_overlap_repeats_trailing_units(word_tokenizer):
+    paragraphs = [words(3, "a"), words(2, "b"), words(3, "c"), words(3, "d")]
+
+    chunks = chunk_paragraphs(paragraphs, max_tokens=8, overlap_tokens=3)
+
+    assert [text for text, _ in chunks] == [
+        paragraphs[0] + "\n\n" + paragraphs[1] + "\n\n" + paragraphs[2],
+        paragraphs[2] + "\n\n" + paragraphs[3],
+    ]
+    assert all(tokens <= 8 for _, tokens in chunks)
+
+
+def fake_set_tokenizer(name=None):
+    etl_chunking._encode_batch = word_offsets
+    etl_chunking._separator_tokens = {"\n\n": 0, "\n": 0}
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_dispatcher_streams_in_order_and_rechunks_changes(tmp_path, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(etl_chunking, "set_tokenizer", fake_set_tokenizer)
+    monkeypatch.setattr(etl_chunking, "SAVE_BATCH_SIZE", 2)
+
+    processed = tmp_path / "data" / "processed"
+    processed.mkdir(parents=True)
+
+    rows = []
+    for d in range(5):
+        path = processed / f"doc{d}.txt"
+        path.write_text("\n\n".join(words(6, f"d{d}p{p}_") for p in range(3)), encoding="utf-8")
+        rows.append({"id": f"doc{d}", "target_path": str(path), "target_hash": f"h{d}"})
+
+    manifest = etl_chunking.Manifest(ledger_paths={})
+    manifest.add("processed_docs", rows)
+
+    etl_chunking.run_dispatcher(max_tokens=12, workers=workers)
+
+    jsonl = tmp_path / "data" / "chunked" / "chunks.jsonl"
+    chunk_ids = [json.loads(line)["chunk_id"] for line in jsonl.read_text(encoding="utf-8").splitlines()]
+    assert chunk_ids == [f"doc{d}_{i}" for d in range(5) for i in range(2)]
+    assert (tmp_path / "data" / "chunked" / "chunks.csv").read_text(encoding="utf-8").count("chunk_index") == 1
+    assert [c["chunk_id"] for c in ChunkStore(etl_chunking.CHUNK_STORE_PATH).iter_chunks()] == chunk_ids
+
+    # doc3 shrinks to one paragraph: re-chunked, its second chunk dropped, handed to embedding
+    (processed / "doc3.txt").write_text(words(4, "new"), encoding="utf-8")
+    manifest.add("processed_docs", [{**rows[3], "target_hash": "h3-new"}])
+
+    etl_chunking.run_dispatcher(max_tokens=12, workers=workers)
+
+    assert manifest.chunk_sets()["doc3"] == {"doc3_0"}
+    assert manifest.get_chunk("doc3_0")["hash"] == hashlib.sha256(words(4, "new").encode("utf-8")).hexdigest()
+    assert manifest.dirty_docs("embed") == {"doc3"}
+
+    chunk_store = ChunkStore(etl_chunking.CHUNK_STORE_PATH)
+    assert chunk_store.get("doc3_0")["content"] == words(4, "new")
+    assert chunk_store.get("doc3_1") is None
+
+
+def test_failed_document_keeps_its_dirty_marker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(etl_chunking, "set_tokenizer", fake_set_tokenizer)
+
+    processed = tmp_path / "data" / "processed"
+    processed.mkdir(parents=True)
+    (processed / "ok.txt").write_text(words(4), encoding="utf-8")
+
+    manifest = etl_chunking.Manifest(ledger_paths={})
+    manifest.add("processed_docs", [
+        {"id": "ok", "target_path": str(processed / "ok.txt"), "target_hash": "h1"},
+        {"id": "broken", "target_path": str(processed / "missing.txt"), "target_hash": "h2"},
+    ])
+    manifest.mark_dirty("chunk", ["ok", "broken"])
+
+    etl_chunking.run_dispatcher(max_tokens=12)
+
+    assert manifest.dirty_docs("chunk") == {"broken"}
+    assert manifest.chunked_hash("ok") == "h1"
+    assert manifest.chunked_hash("broken") is None
@@ -0,0 +1,179 @@
+import hashlib
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+import check_new_data_and_download as download
+from crawler import Crawler
+from crawl_state import CrawlState
+from manifest import Manifest
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves the pages registered in ``server.pages`` with an ETag; ``/flaky`` fails twice before answering."""
+
+    def do_GET(self):
+        server = self.server
+
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+
+        try:
+            time.sleep(server.delay)
+
+            if self.path == "/flaky" and hits <= 2:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            body = server.pages.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.pages = {"/flaky": b"ok"}
+    server.hits = {}
+    server.lock = threading.Lock()
+    server.active = 0
+    server.max_active = 0
+    server.delay = 0.0
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_retry_with_backoff(stub_server):
+    server, base = stub_server
+    crawler = Crawler(retries=3, backoff=0.01)
+
+    response = crawler.get(base + "/flaky")
+
+    assert response.status_code == 200
+    assert server.hits["/flaky"] == 3
+    crawler.close()
+
+
+def test_fetch_many_keeps_order_and_host_limit(stub_server):
+    server, base = stub_server
+    server.delay = 0.05
+    for i in range(12):
+        server.pages[f"/doc{i}"] = f"doc {i}".encode()
+
+    crawler = Crawler(max_workers=8, per_host=3, backoff=0.01)
+    results = crawler.fetch_many([f"{base}/doc{i}" for i in range(12)] + [base + "/missing"])
+
+    assert [r.text for _, r in results[:12]] == [f"doc {i}" for i in range(12)]
+    assert results[-1][1].status_code == 404
+    assert 1 < server.max_active <= 3
+    crawler.close()
+
+
+def test_fetch_dgsi_latest_against_stub(stub_server, tmp_path, monkeypatch):
+    server, base = stub_server
+    server.pages["/jstj.nsf/"] = (
+        b'<a href="/jstj.nsf/abc/1?OpenDocument">Acordao 1</a>'
+        b'<a href="/jstj.nsf/abc/2?OpenDocument">Acordao 2</a>'
+        b'<a href="/other">ignored</a>'
+    )
+    server.pages["/jstj.nsf/abc/1?OpenDocument"] = "<html>acórdão um</html>".encode()
+    server.pages["/jstj.nsf/abc/2?OpenDocument"] = "<html>acórdão dois</html>".encode()
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(download, "METADATA_PATH", str(tmp_path / "metadata_raw.csv"))
+
+    crawler = Crawler(backoff=0.01, state=CrawlState(str(tmp_path / "crawl_state.sqlite")))
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+
+    assert download.fetch_dgsi_latest(url=base + "/jstj.nsf/", crawler=crawler, manifest=manifest) == 2
+    assert download.fetch_dgsi_latest(url=base + "/jstj.nsf/", crawler=crawler, manifest=manifest) == 0
+    assert len(list((tmp_path / "data" / "raw" / "dgsi").iterdir())) == 2
+    assert manifest.count("raw_docs") == 2
+
+    # Second crawl was answered with 304s, no bodies transferred
+    assert crawler.not_modified == 2
+    crawler.close()
+
+
+def test_interrupted_save_does_not_record_validators(stub_server, tmp_path, monkeypatch):
+    server, base = stub_server
+    server.pages["/jstj.nsf/"] = b'<a href="/jstj.nsf/abc/1?OpenDocument">Acordao 1</a>'
+    server.pages["/jstj.nsf/abc/1?OpenDocument"] = "<html>acórdão um</html>".encode()
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(download, "METADATA_PATH", str(tmp_path / "metadata_raw.csv"))
+
+    crawler = Crawler(backoff=0.01, state=CrawlState(str(tmp_path / "crawl_state.sqlite")))
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+
+    def killed(rows, manifest):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(download, "save_metadata", killed)
+        with pytest.raises(KeyboardInterrupt):
+            download.fetch_dgsi_latest(url=base + "/jstj.nsf/", crawler=crawler, manifest=manifest)
+
+    # No validators were stored, so the next run downloads the document again and records it
+    assert crawler.state.get(base + "/jstj.nsf/abc/1?OpenDocument") is None
+    assert download.fetch_dgsi_latest(url=base + "/jstj.nsf/", crawler=crawler, manifest=manifest) == 1
+    assert manifest.count("raw_docs") == 1
+    crawler.close()
+
+
+def test_conditional_get_uses_stored_validators(stub_server, tmp_path):
+    server, base = stub_server
+    server.pages["/constpt2005.pdf"] = b"%PDF constituicao"
+
+    state = CrawlState(str(tmp_path / "crawl_state.sqlite"))
+    crawler = Crawler(backoff=0.01, state=state)
+
+    first = crawler.get(base + "/constpt2005.pdf", conditional=True)
+    crawler.record(base + "/constpt2005.pdf", first, "hash")
+    crawler.close()
+
+    # State survives a restart
+    crawler = Crawler(backoff=0.01, state=CrawlState(str(tmp_path / "crawl_state.sqlite")))
+    second = crawler.get(base + "/constpt2005.pdf", conditional=True)
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert crawler.state.get(base + "/constpt2005.pdf")["content_length"] == len(b"%PDF constituicao")
+    crawler.close()
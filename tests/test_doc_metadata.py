@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+from doc_metadata import doc_filters, read_doc_metadata, write_doc_metadata
+from manifest import Manifest
+
+
+def raw(source, url, title="", timestamp="2025-03-04T10:00:00+00:00", doc_id="x"):
+    return {"id": doc_id, "source": source, "url": url, "title": title, "timestamp": timestamp}
+
+
+def test_court_and_date_from_raw_rows():
+    stj = doc_filters(raw("DGSI", "https://www.dgsi.pt/jstj.nsf/954f0ce6ad9dd8b9/abc?OpenDocument", "02-12-2024"))
+    tc = doc_filters(raw("Tribunal Constitucional", "https://www.tribunalconstitucional.pt/a.html", "Acórdão 587/2024"))
+    law = doc_filters(raw("Parlamento.pt", "https://www.parlamento.pt/crp.pdf", "Constituição"))
+    process = doc_filters(raw("DGSI", "https://www.dgsi.pt/jtrl.nsf/x?OpenDocument", "1234/19.3T8LSB.L1.S1"))
+
+    assert (stj["court"], stj["date"], stj["date_end"]) == ("STJ", 20241202, 20241202)
+    # A case year is any day of that year
+    assert (tc["court"], tc["date"], tc["date_end"]) == ("TC", 20240101, 20241231)
+    # No date in the title: unknown, never the download date
+    assert (law["court"], law["date"], law["date_end"]) == ("", 0, 0)
+    assert (process["court"], process["date"], process["date_end"]) == ("TRL", 0, 0)
+
+
+def test_write_and_read_doc_metadata(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+    manifest.add("raw_docs", [{**raw("DGSI", "https://www.dgsi.pt/jtrl.nsf/x", doc_id="a.html"), "file_path": "", "hash": "h"}])
+
+    assert write_doc_metadata(manifest, str(tmp_path / "doc_metadata.csv")) == 1
+    assert read_doc_metadata(str(tmp_path / "doc_metadata.csv")) == {"a.html": {"source": "DGSI", "court": "TRL", "date": 0, "date_end": 0}}
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from api.models.emb_batcher import EmbeddingBatcher
+
+
+def fake_encode(texts):
+    return np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        time.sleep(0.02)  # a forward pass: requests arriving meanwhile join the next batch
+        return fake_encode(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=8, max_wait_ms=50)
+    queries = ["a" * n for n in range(1, 9)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(batcher.encode, queries))
+
+    batcher.close()
+
+    # Every caller gets the row for its own text
+    assert [int(r[0]) for r in results] == list(range(1, 9))
+    assert len(calls) < len(queries)
+    assert batcher.stats()["items"] == 8
+
+
+def test_max_batch_size_is_respected():
+    sizes = []
+
+    def encode(texts):
+        sizes.append(len(texts))
+        return fake_encode(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=3, max_wait_ms=20)
+    futures = [batcher.submit(str(i)) for i in range(7)]
+    [f.result(timeout=5) for f in futures]
+    batcher.close()
+
+    assert max(sizes) <= 3
+    assert sum(sizes) == 7
+
+
+def test_errors_propagate_to_callers():
+    def encode(texts):
+        raise RuntimeError("model failed")
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=4, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError):
+        batcher.encode("query")
+
+    batcher.close()
+
+
+def test_lone_request_is_not_delayed():
+    batcher = EmbeddingBatcher(fake_encode, max_batch_size=8, max_wait_ms=500)
+
+    start = time.perf_counter()
+    batcher.encode("a")
+    elapsed = time.perf_counter() - start
+    batcher.close()
+
+    assert elapsed < 0.25
+
+
+def test_async_callers_fill_batches_beyond_the_thread_pool():
+    sizes = []
+
+    def encode(texts):
+        sizes.append(len(texts))
+        time.sleep(0.02)
+        return fake_encode(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=32, max_wait_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.aencode("a" * n) for n in range(1, 41)))
+
+    results = asyncio.run(run())
+    batcher.close()
+
+    # No thread is held per waiting caller, so 40 concurrent queries need only a few batches
+    assert [int(r[0]) for r in results] == list(range(1, 41))
+    assert max(sizes) > 8
+    assert len(sizes) <= 3
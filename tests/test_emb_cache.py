@@ -0,0 +1,63 @@
+import numpy as np
+
+from api.models.emb_cache import EmbeddingCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_query():
+    assert normalize_query("  Direitos   fundamentais\nna CONSTITUIÇÃO ") == "direitos fundamentais na constituição"
+
+
+def test_hit_after_put_with_normalized_key():
+    cache = EmbeddingCache(max_size=4)
+    cache.put("model", "direitos fundamentais na Constituição", np.ones(3))
+
+    assert cache.get("model", "Direitos  fundamentais na constituição") is not None
+    assert cache.get("other-model", "direitos fundamentais na Constituição") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_eviction():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("m", "a", np.zeros(2))
+    cache.put("m", "b", np.zeros(2))
+    cache.get("m", "a")
+    cache.put("m", "c", np.zeros(2))
+
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") is not None
+    assert cache.get("m", "c") is not None
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = EmbeddingCache(max_size=4, ttl_seconds=10, clock=clock)
+    cache.put("m", "a", np.zeros(2))
+
+    clock.now += 5
+    assert cache.get("m", "a") is not None
+
+    clock.now += 10
+    assert cache.get("m", "a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "emb_cache.sqlite")
+
+    cache = EmbeddingCache(max_size=4, disk_path=path)
+    cache.put("m", "contrato de crédito abusivo", np.arange(4, dtype=np.float32))
+
+    restarted = EmbeddingCache(max_size=4, disk_path=path)
+    vector = restarted.get("m", "contrato de crédito abusivo")
+
+    assert vector is not None
+    assert vector.tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert restarted.stats()["disk_hits"] == 1
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import queue
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+import etl_embedding
+from manifest import Manifest
+from doc_metadata import update_doc_versions
+from api.db.chunk_store import ChunkStore
+
+
+class FakeModel:
+    def tokenize(self, texts):
+        return list(texts)
+
+
+def sha(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def test_producer_filters_and_flushes_partial_batch(tmp_path, monkeypatch):
+    chunks_path = tmp_path / "chunks.jsonl"
+    monkeypatch.setattr(etl_embedding, "CHUNKS_JSONL_PATH", str(chunks_path))
+
+    lines = [
+        {"doc_id": "a", "chunk_id": "a_0", "content": "old text"},     # replaced by a later version
+        {"doc_id": "a", "chunk_id": "a_1", "content": "embedded"},     # already embedded
+        {"doc_id": "x", "chunk_id": "x_0", "content": "orphan"},       # not in the manifest
+        {"doc_id": "a", "chunk_id": "a_0", "content": "new text"},
+        {"doc_id": "b", "chunk_id": "b_0", "content": "b zero"},
+        {"doc_id": "b", "chunk_id": "b_1", "content": "b one"},
+        {"doc_id": "b", "chunk_id": "b_1", "content": "b one"},        # duplicate line
+    ]
+    chunks_path.write_text("".join(json.dumps(line) + "\n" for line in lines), encoding="utf-8")
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+    manifest.add("chunks", [
+        {"doc_id": "a", "chunk_id": "a_0", "hash": sha("new text"), "doc_processed_path": "a.txt"},
+        {"doc_id": "a", "chunk_id": "a_1", "hash": sha("embedded"), "doc_processed_path": "a.txt"},
+        {"doc_id": "b", "chunk_id": "b_0", "hash": sha("b zero"), "doc_processed_path": "b.txt"},
+        {"doc_id": "b", "chunk_id": "b_1", "hash": sha("b one"), "doc_processed_path": "b.txt"},
+    ])
+    manifest.add("embeddings", [{"row": 0, "doc_id": "a", "chunk_id": "a_1", "chunk_hash": sha("embedded")}])
+
+    batches = queue.Queue()
+    counts = {"unknown": 0, "outdated": 0, "embedded": 0}
+    etl_embedding.produce_batches(FakeModel(), manifest.path, 2, batches, counts)
+
+    produced = []
+    while (item := batches.get()) is not None:
+        produced.append(item)
+
+    assert [texts for texts, _ in produced] == [["new text", "b zero"], ["b one"]]
+    assert [m["chunk_id"] for _, metadata in produced for m in metadata] == ["a_0", "b_0", "b_1"]
+    assert counts == {"unknown": 1, "outdated": 1, "embedded": 2}
+
+
+def test_get_store_rolls_back_uncommitted_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(etl_embedding, "EMBEDDINGS_STORE_PATH", str(tmp_path / "store"))
+    monkeypatch.setattr(etl_embedding, "EMBEDDINGS_NPY_PATH", str(tmp_path / "embeddings.npy"))
+    monkeypatch.setattr(etl_embedding, "METADATA_EMBEDDINGS_PATH", str(tmp_path / "metadata_embeddings.csv"))
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+    store = etl_embedding.get_store(manifest)
+
+    rows = [{"doc_id": "a", "chunk_id": f"a_{i}", "chunk_hash": str(i)} for i in range(4)]
+    etl_embedding.save_data(np.ones((2, 3), dtype=np.float32), rows[:2], manifest, store)
+
+    # Crash after writing the next batch, before its manifest commit
+    store.append(np.zeros((2, 3), dtype=np.float32))
+    etl_embedding.append_ledger(etl_embedding.METADATA_EMBEDDINGS_PATH, etl_embedding.EMBEDDINGS_FIELDS, rows[2:])
+
+    store = etl_embedding.get_store(manifest)
+
+    assert len(store) == 2
+    assert len((tmp_path / "metadata_embeddings.csv").read_text(encoding="utf-8").splitlines()) == 3
+    assert not manifest.has_embedding("a_2", "2")
+
+
+def test_saved_batches_bump_doc_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(etl_embedding, "EMBEDDINGS_STORE_PATH", str(tmp_path / "store"))
+    monkeypatch.setattr(etl_embedding, "EMBEDDINGS_NPY_PATH", str(tmp_path / "embeddings.npy"))
+    monkeypatch.setattr(etl_embedding, "METADATA_EMBEDDINGS_PATH", str(tmp_path / "metadata_embeddings.csv"))
+    versions_path = tmp_path / "doc_versions.json"
+    monkeypatch.setattr(etl_embedding, "update_doc_versions", lambda doc_ids: update_doc_versions(doc_ids, str(versions_path)))
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+    store = etl_embedding.get_store(manifest)
+
+    rows = [{"doc_id": d, "chunk_id": f"{d}_0", "chunk_hash": "h"} for d in ["a", "b"]]
+    etl_embedding.save_data(np.ones((2, 3), dtype=np.float32), rows, manifest, store)
+
+    # "c" lost its chunks in a re-chunk and has no new rows
+    assert etl_embedding.publish_doc_versions(manifest, {"c"}) == {"a", "b", "c"}
+    assert set(json.loads(versions_path.read_text(encoding="utf-8"))) == {"a", "b", "c"}
+    assert not manifest.dirty_docs("version")
+
+
+def test_chunk_store_rows_recorded_after_interrupted_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(etl_embedding, "EMBEDDINGS_STORE_PATH", str(tmp_path / "store"))
+    monkeypatch.setattr(etl_embedding, "EMBEDDINGS_NPY_PATH", str(tmp_path / "embeddings.npy"))
+    monkeypatch.setattr(etl_embedding, "METADATA_EMBEDDINGS_PATH", str(tmp_path / "metadata_embeddings.csv"))
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+    store = etl_embedding.get_store(manifest)
+    chunk_store = ChunkStore(str(tmp_path / "chunks"))
+    chunk_store.put([{"doc_id": "a", "chunk_id": f"a_{i}", "content": f"texto {i}", "tokens": 2} for i in range(4)])
+
+    rows = [{"doc_id": "a", "chunk_id": f"a_{i}", "chunk_hash": str(i)} for i in range(4)]
+    etl_embedding.save_data(np.ones((2, 3), dtype=np.float32), rows[:2], manifest, store, chunk_store)
+
+    # Crash after the manifest commit of the next batch, before the chunk store update
+    first_row = store.append(np.zeros((2, 3), dtype=np.float32))
+    manifest.commit_embeddings([{**m, "row": first_row + i} for i, m in enumerate(rows[2:])], len(store))
+    assert chunk_store.get("a_3")["embedding_row"] is None
+
+    etl_embedding.sync_chunk_store(manifest, chunk_store)
+    assert [chunk_store.get(f"a_{i}")["embedding_row"] for i in range(4)] == [0, 1, 2, 3]
+    assert manifest.get_checkpoint("chunk_store_rows") == 4
@@ -0,0 +1,80 @@
+import csv
+
+import numpy as np
+import pytest
+
+from api.db.embedding_store import ShardedEmbeddingStore, open_embeddings
+from api.db.local_store import LocalVectorStore
+
+
+def test_append_across_shards_and_reopen(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(23, 4)).astype(np.float32)
+
+    store = ShardedEmbeddingStore(str(tmp_path / "store"), shard_rows=5)
+    assert store.append(vectors[:7]) == 0
+    assert store.append(vectors[7:]) == 7
+    assert sorted(p.name for p in (tmp_path / "store").glob("*.bin")) == [f"shard_0000{i}.bin" for i in range(5)]
+
+    view = ShardedEmbeddingStore(str(tmp_path / "store")).view()
+
+    assert view.shape == (23, 4)
+    np.testing.assert_array_equal(np.asarray(view), vectors)
+    np.testing.assert_array_equal(np.asarray(view[3:12]), vectors[3:12])
+    np.testing.assert_array_equal(view[3:12][4:6], vectors[7:9])
+    np.testing.assert_array_equal(view[[22, 0, 9, 9]], vectors[[22, 0, 9, 9]])
+    np.testing.assert_array_equal(view[-1], vectors[-1])
+
+
+def test_float16_store_and_torn_append(tmp_path):
+    vectors = np.arange(24, dtype=np.float32).reshape(6, 4) / 8
+
+    store = ShardedEmbeddingStore(str(tmp_path / "store"), dtype="float16", shard_rows=4)
+    store.append(vectors[:5])
+
+    # Rows written after the last recorded count are ignored and overwritten
+    with open(tmp_path / "store" / "shard_00001.bin", "ab") as f:
+        f.write(b"\xff" * 64)
+
+    store = ShardedEmbeddingStore(str(tmp_path / "store"))
+    store.append(vectors[5:])
+    view = store.view()
+
+    assert view.dtype == np.float32
+    assert (tmp_path / "store" / "shard_00001.bin").stat().st_size == 2 * 4 * 2
+    np.testing.assert_allclose(np.asarray(view), vectors, atol=1e-3)
+
+
+def test_local_store_reads_sharded_store(tmp_path):
+    legacy = np.eye(3, dtype=np.float32)
+    np.save(tmp_path / "embeddings.npy", legacy)
+
+    store = ShardedEmbeddingStore(str(tmp_path / "store"), shard_rows=2)
+    assert store.import_npy(str(tmp_path / "embeddings.npy"), block_rows=2) == 3
+    np.testing.assert_array_equal(np.asarray(open_embeddings(str(tmp_path / "store"))), legacy)
+
+    with open(tmp_path / "metadata_embeddings.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["doc_id", "doc_processed_path", "chunk_id", "chunk_hash", "timestamp"])
+        writer.writeheader()
+        for i in range(3):
+            writer.writerow({"doc_id": "doc0", "doc_processed_path": "", "chunk_id": f"doc0_{i}", "chunk_hash": str(i), "timestamp": ""})
+
+    local = LocalVectorStore(str(tmp_path / "store"), str(tmp_path / "metadata_embeddings.csv"))
+    results = local.query(query_embeddings=[[0.0, 0.0, 2.0]], n_results=1)
+
+    assert results["ids"][0] == ["doc0_2"]
+    assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_truncate_drops_rows_and_shards(tmp_path):
+    vectors = np.arange(14, dtype=np.float32).reshape(7, 2)
+
+    store = ShardedEmbeddingStore(str(tmp_path / "store"), shard_rows=3)
+    store.append(vectors)
+    store.truncate(3)
+
+    assert len(ShardedEmbeddingStore(str(tmp_path / "store"))) == 3
+    assert not (tmp_path / "store" / "shard_00001.bin").exists()
+
+    store.append(vectors[5:])
+    np.testing.assert_array_equal(np.asarray(store.view()), np.concatenate([vectors[:3], vectors[5:]]))
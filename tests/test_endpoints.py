@@ -9,6 +9,11 @@ def test_health():
     assert r.status_code == 200
     assert r.json().get("status") == "okay running"
 
+def test_cache_stats():
+    r = client.get("/health/cache")
+    assert r.status_code == 200
+    assert "hits" in r.json().get("embedding_cache")
+
 def test_root():
     r = client.get("/")
     assert r.status_code == 200
@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("bs4")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+import etl_extract
+from etl_extract import clean_pages, clean_text, extract_html
+
+
+def test_clean_text_removes_page_numbers_and_blank_lines():
+    text = "Artigo 1.º\r\n\n\n\nPágina 3\n  12  \n— 4 —\nTexto   \n\n \nFim\n"
+
+    assert clean_text(text) == "Artigo 1.º\n\nTexto   \n\nFim"
+
+
+def test_clean_pages_matches_whole_document():
+    pages = ["\n  Título\n\n", "  \n", "\n\n7\nCorpo do acórdão.  \n", "— 8 —\n\nDecisão\n\n"]
+
+    pieces = list(clean_pages(pages))
+
+    assert len(pieces) > 1
+    assert "".join(pieces) == clean_text("\n".join(pages))
+    assert "".join(pieces) == "Título\n\nCorpo do acórdão.  \n\nDecisão"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Texto\nPágina\n3\nMais texto", "Texto\n\nMais texto"),
+    ("Texto\nPÁGINA\n\n3\n\nMais texto", "Texto\n\nMais texto"),
+    ("Texto\n— \n12 —\nMais texto", "Texto\n\nMais texto"),
+    # The bare-number pass runs first, so only the number of "—\n12\n—" goes
+    ("Texto\n—\n12\n—\nMais texto", "Texto\n—\n\n—\nMais texto"),
+])
+def test_clean_text_removes_page_numbers_split_over_lines(text, expected):
+    assert clean_text(text) == expected
+
+
+def test_clean_pages_joins_footer_across_page_break():
+    pages = ["Fim da página\nPágina", "4\nInício da seguinte"]
+
+    assert "".join(clean_pages(pages)) == "Fim da página\n\nInício da seguinte"
+
+
+# A DGSI-style ruling page: navigation, scripts, a metadata table and the decision text
+RULING_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Acórdão do Supremo Tribunal de Justiça</title>
+<style>td { font-size: 10pt }</style><script>var x = "<b>não</b>";</script></head>
+<body>
+<header><a href="/">DGSI</a></header>
+<nav><ul><li>Bases Jurídico-Documentais</li><li>Pesquisa</li></ul></nav>
+<table>
+<tr><td>Processo:</td><td>1234/19.3T8LSB.L1.S1</td></tr>
+<tr><td>Relator:</td><td>Maria da Conceição &amp; Sá</td></tr>
+<tr><td>Data do Acordão:</td><td>02-12-2024</td></tr>
+</table>
+<p>Acordam no Supremo Tribunal de Justiça:<br>I. Relatório<br/>
+O arguido interpôs recurso&nbsp;do acórdão.</p>
+<p>II. Fundamentação
+<b>1.</b> A prisão preventiva é <i>excecional</i>.
+<p>Lisboa, 02 de dezembro de 2024
+<footer>Página 1 de 1</footer>
+</body></html>
+"""
+
+
+def test_extract_html_same_text_with_lxml(tmp_path, monkeypatch):
+    pytest.importorskip("lxml")
+
+    path = tmp_path / "ruling.html"
+    path.write_text(RULING_PAGE, encoding="utf-8")
+
+    texts = {}
+    for parser in ["html.parser", "lxml"]:
+        monkeypatch.setattr(etl_extract, "HTML_PARSER", parser)
+        # Compared as stored: the parsers only differ in blank lines, which clean_text drops
+        texts[parser] = clean_text(extract_html(str(path)))
+
+    assert texts["lxml"] == texts["html.parser"]
+    assert "Maria da Conceição & Sá" in texts["lxml"]
+    assert "DGSI" not in texts["lxml"] and "não</b>" not in texts["lxml"]
@@ -0,0 +1,306 @@
+import csv
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from api.db.ann_index import IVFPQIndex, recall_at_k
+from api.db.chunk_store import ChunkStore
+from api.db.local_store import LocalVectorStore, top_k_indices
+from api.db.quantized_index import QuantizedIndex
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+from manifest import Manifest
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(50, 8)).astype(np.float32)
+    np.save(tmp_path / "embeddings.npy", embeddings)
+
+    with open(tmp_path / "metadata_embeddings.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["doc_id", "doc_processed_path", "chunk_id", "chunk_hash", "timestamp"])
+        writer.writeheader()
+        for i in range(len(embeddings)):
+            writer.writerow({
+                "doc_id": f"doc{i // 10}",
+                "doc_processed_path": f"data/processed/doc{i // 10}.txt",
+                "chunk_id": f"doc{i // 10}_{i % 10}",
+                "chunk_hash": f"hash{i}",
+                "timestamp": "2025-01-01T00:00:00",
+            })
+
+    with open(tmp_path / "chunks.jsonl", "w", encoding="utf-8") as f:
+        for i in range(len(embeddings)):
+            f.write(json.dumps({"chunk_id": f"doc{i // 10}_{i % 10}", "content": f"conteúdo {i}"}) + "\n")
+
+    store = LocalVectorStore(
+        str(tmp_path / "embeddings.npy"),
+        str(tmp_path / "metadata_embeddings.csv"),
+        str(tmp_path / "chunks.jsonl"),
+    )
+    return store, embeddings
+
+
+def test_top_k_indices():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 4, 0]
+
+
+def test_query_matches_exact_cosine(local_store):
+    store, embeddings = local_store
+    query = embeddings[7] * 3.0
+
+    results = store.query(query_embeddings=[query.tolist()], n_results=5)
+
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normed @ (query / np.linalg.norm(query))))[:5]
+
+    assert results["ids"][0] == [store.ids[i] for i in expected]
+    assert results["ids"][0][0] == "doc0_7"
+    assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+    assert results["documents"][0][0] == "conteúdo 7"
+    assert results["metadatas"][0][0]["doc_id"] == "doc0"
+
+
+def test_ivfpq_index_search_and_tail(local_store):
+    store, embeddings = local_store
+
+    index = IVFPQIndex(dim=8, nlist=4, m=4)
+    index.train(embeddings)
+    index.add(embeddings[:40])
+    store.ann_index = index
+    store.nprobe = 4
+
+    # Rows 40..49 are not indexed yet and must still be found exactly
+    for row in (3, 45):
+        results = store.query(query_embeddings=[embeddings[row].tolist()], n_results=3)
+        assert results["ids"][0][0] == store.ids[row]
+
+
+def test_ivfpq_index_save_load(tmp_path, local_store):
+    _, embeddings = local_store
+
+    index = IVFPQIndex(dim=8, nlist=4, m=2)
+    index.train(embeddings)
+    index.add(embeddings)
+    index.save(str(tmp_path / "ann_index.npz"))
+
+    loaded = IVFPQIndex.load(str(tmp_path / "ann_index.npz"))
+    ids, _ = loaded.search(embeddings[:5], k=5, nprobe=4, rerank_vectors=embeddings)
+
+    assert loaded.ntotal == 50
+    assert recall_at_k(ids, [np.array([i]) for i in range(5)], k=1) == 1.0
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_quantized_index_rerank_and_tail(local_store, kind):
+    store, embeddings = local_store
+
+    index = QuantizedIndex(dim=8, kind=kind)
+    index.train(embeddings)
+    index.add(embeddings[:40])
+    store.ann_index = index
+    store.rerank_factor = 10
+
+    # Float rescoring of the shortlist gives exact distances; rows 40..49 are scanned exactly
+    for row in (3, 45):
+        results = store.query(query_embeddings=[embeddings[row].tolist()], n_results=3)
+        assert results["ids"][0][0] == store.ids[row]
+        assert results["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_quantized_index_save_load_and_allowed(tmp_path, local_store):
+    _, embeddings = local_store
+
+    index = QuantizedIndex(dim=8, kind="binary")
+    index.add(embeddings)
+    index.save(str(tmp_path / "quantized.npz"))
+
+    loaded = QuantizedIndex.load(str(tmp_path / "quantized.npz"))
+    assert loaded.kind == "binary" and loaded.ntotal == 50
+    assert loaded.codes.nbytes == 50  # one byte per 8-dim row
+
+    allowed = np.ones(50, dtype=bool)
+    allowed[2] = False
+    ids, _ = loaded.search(embeddings[:5], k=5, rerank_vectors=embeddings, rerank_factor=10, allowed=allowed)
+
+    assert 2 not in ids[2]
+    assert [row[0] for i, row in enumerate(ids) if i != 2] == [0, 1, 3, 4]
+
+
+def test_superseded_rows_are_not_returned(tmp_path):
+    # doc0_0 was re-embedded: row 2 replaces row 0
+    embeddings = np.array([[1, 0], [0, 1], [0.6, 0.8]], dtype=np.float32)
+    np.save(tmp_path / "embeddings.npy", embeddings)
+
+    with open(tmp_path / "metadata_embeddings.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["doc_id", "doc_processed_path", "chunk_id", "chunk_hash", "timestamp"])
+        writer.writeheader()
+        for chunk_id, chunk_hash in [("doc0_0", "old"), ("doc0_1", "b"), ("doc0_0", "new")]:
+            writer.writerow({"doc_id": "doc0", "doc_processed_path": "", "chunk_id": chunk_id, "chunk_hash": chunk_hash, "timestamp": ""})
+
+    store = LocalVectorStore(str(tmp_path / "embeddings.npy"), str(tmp_path / "metadata_embeddings.csv"))
+    results = store.query(query_embeddings=[[1.0, 0.0]], n_results=5)
+
+    assert results["ids"][0] == ["doc0_0", "doc0_1"]
+    assert results["metadatas"][0][0]["chunk_hash"] == "new"
+    assert results["distances"][0][0] == pytest.approx(0.4, abs=1e-5)
+
+
+@pytest.mark.parametrize("index", ["flat", "ivfpq", "quantized"])
+def test_chunks_dropped_by_rechunk_are_not_returned(local_store, tmp_path, index):
+    _, embeddings = local_store
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+    manifest.commit_embeddings([
+        {"row": i, "doc_id": f"doc{i // 10}", "chunk_id": f"doc{i // 10}_{i % 10}", "chunk_hash": f"hash{i}"}
+        for i in range(len(embeddings))
+    ], len(embeddings))
+
+    # doc0 shrank from 10 to 3 chunks: save_chunks deletes the dropped ids, their ledger rows stay
+    dropped = [f"doc0_{i}" for i in range(3, 10)]
+    manifest.delete("embeddings", "chunk_id", dropped)
+    manifest.close()
+
+    store = LocalVectorStore(
+        str(tmp_path / "embeddings.npy"),
+        str(tmp_path / "metadata_embeddings.csv"),
+        str(tmp_path / "chunks.jsonl"),
+        manifest_path=str(tmp_path / "manifest.sqlite"),
+    )
+    if index == "ivfpq":
+        store.ann_index = IVFPQIndex(dim=8, nlist=4, m=4)
+        store.ann_index.train(embeddings)
+        store.nprobe = 4
+    elif index == "quantized":
+        store.ann_index = QuantizedIndex(dim=8, kind="int8")
+        store.ann_index.train(embeddings)
+    if store.ann_index is not None:
+        store.ann_index.add(embeddings)
+
+    results = store.query(query_embeddings=embeddings[:10].tolist(), n_results=50)
+
+    for ids in results["ids"]:
+        assert len(ids) == 43
+        assert not set(ids) & set(dropped)
+    assert results["ids"][1][0] == "doc0_1"
+    assert store.get(dropped + ["doc0_1"])["ids"] == ["doc0_1"]
+
+
+def test_documents_from_chunk_store(local_store, tmp_path):
+    _, embeddings = local_store
+
+    chunk_store = ChunkStore(str(tmp_path / "chunk_store"))
+    chunk_store.put([
+        {"doc_id": f"doc{i // 10}", "chunk_id": f"doc{i // 10}_{i % 10}", "content": f"conteúdo {i}"}
+        for i in range(len(embeddings))
+    ])
+
+    store = LocalVectorStore(
+        str(tmp_path / "embeddings.npy"),
+        str(tmp_path / "metadata_embeddings.csv"),
+        str(tmp_path / "chunk_store"),
+    )
+    results = store.query(query_embeddings=[embeddings[12].tolist()], n_results=2)
+
+    assert store.documents == {}
+    assert results["documents"][0][0] == "conteúdo 12"
+
+
+def test_get_returns_live_rows_by_id(local_store):
+    store, embeddings = local_store
+
+    found = store.get(ids=["doc1_3", "missing", "doc0_0"], include=["embeddings", "metadatas", "documents"])
+
+    assert found["ids"] == ["doc1_3", "doc0_0"]
+    np.testing.assert_array_equal(found["embeddings"], embeddings[[13, 0]])
+    assert found["documents"] == ["conteúdo 13", "conteúdo 0"]
+    assert found["metadatas"][0]["doc_id"] == "doc1"
+
+
+def test_where_filters_before_top_k(local_store, tmp_path):
+    _, embeddings = local_store
+
+    with open(tmp_path / "doc_metadata.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["doc_id", "source", "court", "date"])
+        writer.writeheader()
+        for d, (source, court) in enumerate([("DGSI", "STJ"), ("DGSI", "TRL"), ("Tribunal Constitucional", "TC")] * 2):
+            writer.writerow({"doc_id": f"doc{d}", "source": source, "court": court, "date": 20200101 + d * 10000})
+
+    store = LocalVectorStore(
+        str(tmp_path / "embeddings.npy"),
+        str(tmp_path / "metadata_embeddings.csv"),
+        doc_metadata_path=str(tmp_path / "doc_metadata.csv"),
+    )
+
+    # doc0_7 is the closest row overall, but not a TC chunk
+    results = store.query(query_embeddings=[embeddings[7].tolist()], n_results=5, where={"court": "TC"})
+    assert len(results["ids"][0]) == 5
+    assert {m["doc_id"] for m in results["metadatas"][0]} == {"doc2"}
+
+    where = {"$and": [{"court": {"$in": ["STJ", "TRL"]}}, {"date": {"$gte": 20210101}}]}
+    assert set(np.flatnonzero(store.filter_mask(where)) // 10) == {1, 3, 4}
+    assert not store.filter_mask({"court": "STA"}).any()
+
+    # get tests only the requested rows; include=[] returns bare ids
+    rows = np.array([45, 3, 12, 31])
+    np.testing.assert_array_equal(store.filter_mask(where, rows), store.filter_mask(where)[rows])
+    assert store.get(["doc4_5", "doc0_3", "doc1_2", "doc3_1"], where=where, include=[]) == {"ids": ["doc4_5", "doc1_2", "doc3_1"]}
+
+    store.ann_index = IVFPQIndex(dim=8, nlist=4, m=4)
+    store.ann_index.train(embeddings, seed=0)
+    store.ann_index.add(embeddings)
+
+    results = store.query(query_embeddings=[embeddings[7].tolist()], n_results=3, where={"source": "Tribunal Constitucional"})
+    assert len(results["ids"][0]) == 3
+    assert all(m["court"] == "TC" for m in results["metadatas"][0])
+
+
+def test_date_bound_leaves_undated_documents_out(local_store, tmp_path):
+    with open(tmp_path / "doc_metadata.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["doc_id", "source", "court", "date"])
+        writer.writeheader()
+        for d in range(5):
+            # doc0 has no known date
+            writer.writerow({"doc_id": f"doc{d}", "source": "DGSI", "court": "STJ", "date": 20200101 + d * 10000 if d else 0})
+
+    store = LocalVectorStore(
+        str(tmp_path / "embeddings.npy"),
+        str(tmp_path / "metadata_embeddings.csv"),
+        doc_metadata_path=str(tmp_path / "doc_metadata.csv"),
+    )
+
+    # What build_where emits for date_to alone
+    where = {"$and": [{"date": {"$gte": 1}}, {"date": {"$lte": 20220101}}]}
+    assert set(np.flatnonzero(store.filter_mask(where)) // 10) == {1, 2}
+
+
+def test_case_year_matches_ranges_overlapping_its_year(local_store, tmp_path):
+    with open(tmp_path / "doc_metadata.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["doc_id", "source", "court", "date", "date_end"])
+        writer.writeheader()
+        # doc0 is known to the day, doc1 only by its case year
+        writer.writerow({"doc_id": "doc0", "source": "DGSI", "court": "STJ", "date": 20191215, "date_end": 20191215})
+        writer.writerow({"doc_id": "doc1", "source": "Tribunal Constitucional", "court": "TC", "date": 20190101, "date_end": 20191231})
+
+    store = LocalVectorStore(
+        str(tmp_path / "embeddings.npy"),
+        str(tmp_path / "metadata_embeddings.csv"),
+        doc_metadata_path=str(tmp_path / "doc_metadata.csv"),
+    )
+
+    def docs(date_from, date_to):
+        # What build_where emits for both bounds
+        where = {"$and": [{"date_end": {"$gte": date_from}}, {"date": {"$lte": date_to}}]}
+        return set(np.flatnonzero(store.filter_mask(where)) // 10)
+
+    assert docs(20190601, 20191231) == {0, 1}
+    assert docs(20190101, 20190630) == {1}
+    assert docs(20200101, 20201231) == set()
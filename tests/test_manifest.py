@@ -0,0 +1,64 @@
+import csv
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+from manifest import Manifest, append_ledger, truncate_ledger
+
+
+def test_import_ledger_skips_repeated_headers(tmp_path):
+    ledger = tmp_path / "metadata_chunked.csv"
+    fields = ["doc_id", "chunk_id", "chunk_index", "timestamp", "doc_processed_path", "hash"]
+
+    # Older runs wrote the header on every append
+    with open(ledger, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for chunk_id in ["a_0", "a_1"]:
+            writer.writerow(fields)
+            writer.writerow(["a", chunk_id, chunk_id[-1], "", "a.txt", f"h{chunk_id}"])
+
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={"chunks": str(ledger)})
+
+    assert manifest.count("chunks") == 2
+    assert manifest.chunk_sets() == {"a": {"a_0", "a_1"}}
+
+
+def test_superseded_embeddings_and_dirty_markers(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+
+    manifest.add("embeddings", [
+        {"row": 0, "doc_id": "a", "chunk_id": "a_0", "chunk_hash": "old"},
+        {"row": 1, "doc_id": "b", "chunk_id": "b_0", "chunk_hash": "x"},
+    ])
+    new = [{"row": 2, "doc_id": "a", "chunk_id": "a_0", "chunk_hash": "new"}]
+    manifest.add("embeddings", new)
+
+    assert manifest.drop_superseded_embeddings(new) == {"a"}
+    assert manifest.live_embedding_rows() == {1, 2}
+    assert manifest.has_embedding("a_0", "new")
+    assert not manifest.has_embedding("a_0", "old")
+
+    manifest.mark_dirty("index", ["a", "c"])
+    manifest.mark_dirty("index", ["a"])
+    assert manifest.dirty_docs("index") == {"a", "c"}
+    assert manifest.dirty_docs("embed") == set()
+
+    manifest.clear_dirty("index", ["a"])
+    assert manifest.dirty_docs("index") == {"c"}
+
+
+def test_commit_embeddings_checkpoint_and_ledger_truncation(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"), ledger_paths={})
+
+    assert manifest.get_checkpoint("embedding_rows") is None
+    manifest.commit_embeddings([{"row": 0, "doc_id": "a", "chunk_id": "a_0", "chunk_hash": "h"}], 1)
+    assert manifest.get_checkpoint("embedding_rows") == 1
+    assert manifest.has_embedding("a_0", "h")
+
+    ledger = tmp_path / "metadata_embeddings.csv"
+    fields = ["doc_id", "chunk_id"]
+    append_ledger(str(ledger), fields, [{"doc_id": "a", "chunk_id": f"a_{i}"} for i in range(3)])
+
+    truncate_ledger(str(ledger), 1)
+    assert ledger.read_text(encoding="utf-8").splitlines() == ["doc_id,chunk_id", "a,a_0"]
@@ -0,0 +1,39 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "etl"))
+
+from parallel import TaskTimeout, ordered_map
+
+
+def square_after(item):
+    # Later items finish first, so ordering comes from the helper, not from timing
+    time.sleep(0.05 * (5 - item % 5))
+    if item == 3:
+        raise ValueError("bad item")
+    return item * item
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_ordered_map_keeps_input_order_and_returns_errors(workers):
+    results = list(ordered_map(square_after, range(8), workers=workers, max_in_flight=4))
+
+    assert [item for item, _ in results] == list(range(8))
+    assert isinstance(results[3][1], ValueError)
+    assert [r for item, r in results if item != 3] == [i * i for i in range(8) if i != 3]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ordered_map_timeout(workers):
+    results = dict(ordered_map(sleep_for, [0, 3, 0], workers=workers, timeout=1))
+
+    assert results[0] == 0
+    assert isinstance(results[3], TaskTimeout)
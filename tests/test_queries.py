@@ -31,3 +31,40 @@ def test_predict_invalid_body(client, body):
     response = client.post("/query", json=payload)
 
     assert response.status_code == 422
+
+#
+def test_query_stream(client):
+    with client.stream("POST", "/query/stream", json={"query": "O que é a Constituição?"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        body = "".join(response.iter_text())
+
+    assert "event: token" in body
+    assert "event: done" in body
+
+#
+@pytest.mark.parametrize("body", [{"queries": "Test Query"}, {}, None])
+def test_query_stream_invalid_body(client, body):
+    response = client.post("/query/stream", json=body)
+
+    assert response.status_code == 422
+
+#
+def test_query_retrieval_only(client):
+    response = client.post("/query", json={"query": "contrato de crédito abusivo", "top_k": 3, "retrieval_only": True})
+
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["response"] == ""
+    assert len(data["retrieved_chunks"]) <= 3
+    for chunk in data["retrieved_chunks"]:
+        assert {"chunk_id", "distance", "metadata", "snippet"} <= chunk.keys()
+
+#
+@pytest.mark.parametrize("top_k", [0, -1, "many"])
+def test_query_invalid_top_k(client, top_k):
+    response = client.post("/query", json={"query": "O que é a Constituição?", "top_k": top_k})
+
+    assert response.status_code == 422
@@ -0,0 +1,58 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from api.utils import retrieval
+from api.utils.retrieval import build_where, date_bound, retrieve_close_chunks
+
+
+@pytest.mark.parametrize("value, first, last", [
+    ("2024-03-05", 20240305, 20240305),
+    (date(2024, 3, 5), 20240305, 20240305),
+    ("2024-02", 20240201, 20240229),
+    ("2023", 20230101, 20231231),
+])
+def test_date_bound_expands_partial_dates(value, first, last):
+    assert date_bound(value) == first
+    assert date_bound(value, last=True) == last
+
+
+@pytest.mark.parametrize("value", ["01/03/2024", "2024-13", "March 2024", ""])
+def test_date_bound_rejects_other_formats(value):
+    with pytest.raises(ValueError):
+        date_bound(value)
+
+
+def test_build_where_date_range():
+    assert build_where(date_from="2019", date_to="2019-06") == {
+        "$and": [{"date_end": {"$gte": 20190101}}, {"date": {"$lte": 20190630}}]
+    }
+    # Undated documents are left out by a date_to alone
+    assert build_where(court="tc", date_to=date(2020, 1, 1)) == {
+        "$and": [{"court": {"$in": ["TC"]}}, {"date": {"$gte": 1}}, {"date": {"$lte": 20200101}}]
+    }
+
+
+def test_request_config_overrides_the_llm_choices(monkeypatch):
+    calls = []
+
+    async def fake_aencode_query(query):
+        return None
+
+    def fake_search_chunks(query, top_k, where, query_embedding):
+        calls.append((top_k, where))
+        return []
+
+    monkeypatch.setattr(retrieval, "aencode_query", fake_aencode_query)
+    monkeypatch.setattr(retrieval, "search_chunks", fake_search_chunks)
+
+    args = {"query": "prisão preventiva", "top_k": 3, "court": "STJ"}
+    configurable = {"top_k": 8, "where": {"court": "TC"}}
+
+    asyncio.run(retrieve_close_chunks.ainvoke(args))
+    asyncio.run(retrieve_close_chunks.ainvoke(args, {"configurable": configurable}))
+    assert calls == [(3, {"court": {"$in": ["STJ"]}}), (8, {"court": "TC"})]
+
+    # A bad date goes back to the LLM as the tool result
+    assert asyncio.run(retrieve_close_chunks.ainvoke({"query": "q", "date_from": "01/03/2024"})).startswith("Invalid date filter")
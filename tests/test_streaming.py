@@ -0,0 +1,29 @@
+import json
+from types import SimpleNamespace
+
+from api.utils.streaming import sse_event, message_text, tool_chunk_ids, tool_ranking
+
+
+def test_sse_event_format():
+    event = sse_event("token", {"text": "Constituição"})
+
+    assert event == 'event: token\ndata: {"text": "Constituição"}\n\n'
+
+
+def test_message_text_from_parts():
+    assert message_text("olá") == "olá"
+    assert message_text([{"type": "text", "text": "a"}, "b", {"type": "image_url"}]) == "ab"
+
+
+def test_tool_chunk_ids():
+    message = SimpleNamespace(content=json.dumps([{"chunk_id": "doc_0"}, {"chunk_id": "doc_3"}]))
+
+    assert tool_chunk_ids(message) == ["doc_0", "doc_3"]
+    assert tool_chunk_ids(SimpleNamespace(content="not json")) == []
+
+
+def test_tool_ranking_prefers_artifact():
+    ranking = [{"chunk_id": "doc_1", "distance": 0.2}]
+    message = SimpleNamespace(content="[]", artifact=ranking)
+
+    assert tool_ranking(message) == ranking